@@ -0,0 +1,553 @@
+"""
+Benchmarks of the acquisition and write hot paths
+اندازه‌گیری کارایی مسیرهای اصلی با ورودی شبیه‌سازی شده
+
+Runs without hardware (sim_mcc118.py / sim_opc_server.py) and writes one
+JSON file so results of two releases can be compared:
+
+- ``current_rate``: highest per-channel sample rate the per-block work of
+  the current_logger loop keeps up with (current_pipeline.py, the code the
+  logger runs: scheduled blocking reads, RMS engine, window timestamps,
+  waveform ring buffer and trigger checks, live bus, writer thread with
+  CSV output and rollups) for each
+  RMS_WINDOW / block size pair. The samples arrive in real time from a
+  paced scan buffer; the rate is doubled step by step until a buffer
+  overrun, a dropped block or a growing writer backlog, and the last
+  rate that ran clean is reported.
+- ``read_loop``: CPU use of the scan read loop at the real sample rate,
+  the old fixed 100-sample read with a 1 ms sleep against the
+  scan_scheduler reads.
+- ``opc_read``: OPC UA read cycle time (read_node_values, split into
+  MAX_NODES_PER_READ requests) against the simulated server as the node
+  count grows.
+- ``csv_write``: rows/s and MB/s of the OPC CSV writer (per-row
+  StreamingCsvWriter.write, and OpcSampleStore chunks as in the main loop)
+  and of the current CSV sink.
+- ``memory``: RSS growth of the current pipeline over time.
+
+    python benchmark.py -o results.json
+    python benchmark.py -o new.json --compare old.json   # exit 1 on regression
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Simulated HAT for daqhats_utils / current_logger imports
+os.environ.setdefault("KSF_SIMULATE", "1")
+
+from current_pipeline import CurrentPipeline
+from current_writer import BlockWriter, RmsBlock, CsvRmsSink
+from live_bus import LiveRing, current_dtype
+from rms_engine import BlockRmsEngine
+from rollups import RollupWriter
+from sample_clock import SampleClock
+from scan_scheduler import ReadScheduler
+from sim_mcc118 import (SignalModel, mcc118, OptionFlags, ScanReadResult,
+                        ScanStatus)
+from supervisor import ProcessSampler
+from waveform_capture import WaveformCapture
+
+DEFAULT_WINDOWS = [5, 50, 400]
+DEFAULT_BLOCKS = [100, 1000, 5000]
+DEFAULT_NODE_COUNTS = [10, 45, 100, 200, 400]
+# Fixed read size and sleep of the read loop before scan_scheduler
+POLL_BLOCK = 100
+POLL_SLEEP = 0.001
+# Real sample rate (read_loop, memory) and first step of current_rate
+BENCH_RATE = 20000.0
+# current_rate: rate factor per step and highest rate tried
+RATE_STEP = 2.0
+MAX_RATE = 2560000.0
+# Same as current_logger (WRITER_QUEUE_BLOCKS, TRIGGER_POLL_SEC)
+WRITER_QUEUE_BLOCKS = 512
+TRIGGER_POLL_SEC = 0.5
+# Relative change counted as a regression by --compare
+REGRESSION_THRESHOLD = 0.2
+
+# Metrics checked by --compare (tail latencies are too noisy to compare)
+_HIGHER_IS_BETTER = ("rate_hz", "rows_per_sec", "mb_per_sec")
+_LOWER_IS_BETTER = ("mean_ms", "growth_bytes_per_sec", "cpu_percent")
+# Memory growth below this is noise (bytes/s)
+GROWTH_FLOOR = 1000.0
+
+
+def _percentiles(values):
+    values = np.asarray(values, dtype=np.float64) * 1000.0
+    return {"mean_ms": round(float(values.mean()), 4),
+            "p50_ms": round(float(np.percentile(values, 50)), 4),
+            "p99_ms": round(float(np.percentile(values, 99)), 4),
+            "max_ms": round(float(values.max()), 4)}
+
+
+class _PacedScan(object):
+    """
+    Scan buffer filled in real time from a pre-generated signal.
+
+    Same read semantics as sim_mcc118 (blocking reads, ``buffer_overrun``
+    once the reader is a whole buffer behind), without its 100 kS/s limit
+    and without the cost of computing the signal.
+    """
+
+    def __init__(self, rate, channels=1, buffer_sec=1.0):
+        self.rate = float(rate)
+        self.channels = channels
+        self.buffer = int(rate * buffer_sec)
+        # A whole number of line periods, so the signal repeats seamlessly
+        self.signal = SignalModel(rate, channels).block(0, self.buffer).reshape(
+            self.buffer, channels)
+        self.read_count = 0
+        self.overrun = False
+        self.start = time.monotonic()
+
+    def _available(self):
+        produced = int((time.monotonic() - self.start) * self.rate)
+        if produced - self.read_count > self.buffer:
+            self.overrun = True
+        return min(produced - self.read_count, self.buffer)
+
+    def a_in_scan_buffer_size(self):
+        return self.buffer * self.channels
+
+    def a_in_scan_status(self):
+        return ScanStatus(not self.overrun, False, self.overrun, True,
+                          max(self._available(), 0))
+
+    def a_in_scan_read_numpy(self, samples_per_channel, timeout):
+        available = self._available()
+        if available < samples_per_channel and not self.overrun:
+            time.sleep(min((samples_per_channel - available) / self.rate, timeout))
+            available = self._available()
+        count = max(min(available, samples_per_channel), 0)
+        first = self.read_count % self.buffer
+        end = first + count
+        if end <= self.buffer:
+            data = self.signal[first:end].copy()
+        else:
+            data = np.concatenate((self.signal[first:], self.signal[:end - self.buffer]))
+        self.read_count += count
+        return ScanReadResult(not self.overrun, False, self.overrun, True,
+                              count < samples_per_channel, data.ravel())
+
+    def restart(self):
+        """Scan restart after an overrun: sample 0 of the new scan is now."""
+        self.start = time.monotonic()
+        self.read_count = 0
+        self.overrun = False
+
+
+class _CurrentPipeline(object):
+    """
+    :py:class:`current_pipeline.CurrentPipeline` (window mode) as set up by
+    acquire_with_rms, on a paced scan: RMS, window timestamps, waveform
+    capture with the RMS and trigger file checks, live bus and writer
+    thread with rollups. Only the processing after each read is timed.
+    """
+
+    def __init__(self, folder, rate, window, block, channels=1):
+        self.hat = _PacedScan(rate, channels)
+        # Requests of ``block`` samples while the loop keeps up
+        self.scheduler = ReadScheduler(rate, self.hat.buffer, channels,
+                                       block / rate, block)
+        clock = SampleClock(rate)
+        self.bus = LiveRing.create(f"ksf_bench_{os.getpid()}", current_dtype(channels),
+                                   max(int(rate / window), 1000))
+        self.writer = BlockWriter(
+            lambda when=None, extension=".csv": os.path.join(
+                folder, f"bench_{time.monotonic_ns()}{extension}"),
+            clock, 150, 10, sink_cls=CsvRmsSink, maxsize=WRITER_QUEUE_BLOCKS,
+            rollups=RollupWriter(os.path.join(folder, "rollups"), list(range(channels))))
+        self.pipeline = CurrentPipeline(
+            self.hat, self.scheduler, clock,
+            BlockRmsEngine(window, scale=10.0, channels=channels), self.writer,
+            self.hat.restart,
+            capture=WaveformCapture(os.path.join(folder, "waveforms"), clock,
+                                    list(range(channels)), 2, 0.5, 0.5,
+                                    block=self.scheduler.max_block),
+            # Checked on every block like RMS_TRIGGER_A, never reached
+            rms_trigger=1e9,
+            trigger_file=os.path.join(folder, "waveform.trigger"),
+            trigger_poll_sec=TRIGGER_POLL_SEC, bus=self.bus)
+        self.cycles = []
+
+    def step(self):
+        """
+        One loop iteration.
+
+        Returns:
+            str: ``None``, or ``buffer_overrun`` / ``writer_queue_full``.
+        """
+        result = self.scheduler.read(self.hat)
+        start = time.perf_counter()
+        overrun = self.pipeline.process(result)
+        self.cycles.append(time.perf_counter() - start)
+        if overrun:
+            return overrun
+        if not self.pipeline.submitted:
+            return "writer_queue_full"
+        return None
+
+    def run(self, seconds):
+        """
+        Run the loop for ``seconds``.
+
+        Returns:
+            str: First failure (``buffer_overrun``, ``writer_queue_full``,
+            or ``writer_backlog`` when the queue was still more than half
+            full at the end), None if the rate was sustained.
+        """
+        self.writer.start()
+        failure = None
+        end = time.monotonic() + seconds
+        try:
+            while time.monotonic() < end and failure is None:
+                failure = self.step()
+            if failure is None and self.writer.stats()["queue_depth"] > WRITER_QUEUE_BLOCKS // 2:
+                failure = "writer_backlog"
+        finally:
+            self.writer.stop()
+            self.bus.close()
+        return failure
+
+
+def bench_current_rate(windows=DEFAULT_WINDOWS, blocks=DEFAULT_BLOCKS, seconds=2.0,
+                       start_rate=BENCH_RATE, step=RATE_STEP, max_rate=MAX_RATE):
+    results = []
+    for window in windows:
+        for block in blocks:
+            clean, steps = None, []
+            rate = start_rate
+            failure = None
+            while rate <= max_rate:
+                with tempfile.TemporaryDirectory() as folder:
+                    pipeline = _CurrentPipeline(folder, rate, window, block)
+                    failure = pipeline.run(seconds)
+                    stats = pipeline.writer.stats()
+                steps.append({"hz": rate, "failure": failure,
+                              "blocks_written": stats["blocks_written"],
+                              "max_queue_depth": stats["max_queue_depth"]})
+                if failure is not None:
+                    break
+                clean = (rate, pipeline)
+                rate *= step
+            result = {
+                "rms_window": window,
+                "samples_per_channel": block,
+                "rate_hz": clean[0] if clean else 0.0,
+                "failed_rate_hz": rate if failure else None,
+                "failure": failure,
+                "steps": steps,
+            }
+            if clean:
+                result["cycle"] = _percentiles(clean[1].cycles)
+            results.append(result)
+            print(f"  window {window:4d} block {block:5d}: "
+                  f"{result['rate_hz']:12,.0f} Hz  "
+                  f"({f'{failure} at {rate:,.0f} Hz' if failure else 'no failure'})")
+    return results
+
+
+def bench_read_loop(seconds=5.0, rate=BENCH_RATE, window=5):
+    """CPU time per wall-clock second of the read + RMS loop on the real-time HAT"""
+    results = []
+    for mode in ("poll", "scheduler"):
+        hat = mcc118(0)
+        hat.a_in_scan_start(1, 0, rate, OptionFlags.CONTINUOUS)
+        scheduler = ReadScheduler(hat.a_in_scan_actual_rate(1, rate),
+                                  hat.a_in_scan_buffer_size())
+        engine = BlockRmsEngine(window, scale=10.0)
+        reads = 0
+        overrun = False
+        start = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            while time.perf_counter() - start < seconds:
+                if mode == "poll":
+                    result = hat.a_in_scan_read_numpy(POLL_BLOCK, -1)
+                else:
+                    result = scheduler.read(hat)
+                engine.process(result.data)
+                reads += 1
+                overrun = overrun or result.buffer_overrun or result.hardware_overrun
+                if mode == "poll":
+                    time.sleep(POLL_SLEEP)
+        finally:
+            cpu = time.process_time() - cpu
+            elapsed = time.perf_counter() - start
+            hat.a_in_scan_stop()
+            hat.a_in_scan_cleanup()
+        results.append({"mode": mode, "reads_per_sec": round(reads / elapsed, 1),
+                        "cpu_percent": round(100.0 * cpu / elapsed, 2),
+                        "samples": engine.samples_in, "overrun": overrun})
+        print(f"  {mode:9s}: {results[-1]['reads_per_sec']:7.1f} reads/s, "
+              f"CPU {results[-1]['cpu_percent']:5.2f} %")
+    return results
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def bench_opc_read(node_counts=DEFAULT_NODE_COUNTS, reads=50, latency_ms=0.0):
+    import opc_logger
+    from opcua import Client
+    from sim_opc_server import build_server
+    port = _free_port()
+    server, _ = build_server(f"opc.tcp://127.0.0.1:{port}", latency_ms)
+    server.start()
+    client = Client(f"opc.tcp://127.0.0.1:{port}")
+    results = []
+    try:
+        client.connect()
+        ids = opc_logger.READ_NODE_IDS
+        for count in node_counts:
+            node_ids = (ids * (count // len(ids) + 1))[:count]
+            times = []
+            for _ in range(reads):
+                start = time.perf_counter()
+                opc_logger.read_node_values(client, node_ids)
+                times.append(time.perf_counter() - start)
+            results.append(dict(nodes=count, requests=-(-count // opc_logger.MAX_NODES_PER_READ),
+                                latency_ms=latency_ms, **_percentiles(times)))
+            print(f"  {count:4d} nodes: {results[-1]['mean_ms']:8.2f} ms")
+    finally:
+        try:
+            client.disconnect()
+        finally:
+            server.stop()
+    return results
+
+
+def bench_csv_write(rows=20000):
+    import opc_logger
+    from opc_store import OpcSampleStore
+    from sim_opc_server import SimulatedMachine
+    results = {}
+    machine = SimulatedMachine()
+    samples = [machine.values(i * 0.5) for i in range(rows)]
+    with tempfile.TemporaryDirectory() as folder:
+        # Per-row dict writes (StreamingCsvWriter.write)
+        writer = opc_logger.StreamingCsvWriter(folder, name="bench",
+                                               rotate_seconds=float("inf"),
+                                               flush_interval=float("inf"))
+        base = time.time()
+        dicts = []
+        for i, values in enumerate(samples):
+            data = dict(values)
+            data["timestamp"] = time.strftime("%Y-%m-%d %H:%M:%S",
+                                              time.localtime(base + i))
+            dicts.append(data)
+        start = time.perf_counter()
+        for data in dicts:
+            writer.write(data)
+        path = writer.path
+        writer.close()
+        results["opc_rows"] = _throughput(rows, path, time.perf_counter() - start)
+
+        # OpcSampleStore chunks (main loop)
+        writer = opc_logger.StreamingCsvWriter(folder, name="store",
+                                               rotate_seconds=float("inf"))
+        store = OpcSampleStore(opc_logger.DATA_COLUMNS, opc_logger.STORE_CAPACITY)
+        cells = [[values[name] for name in opc_logger.DATA_COLUMNS] for values in samples]
+        start = time.perf_counter()
+        for i, row in enumerate(cells):
+            store.append(base + i, row)
+            if store.full:
+                writer.write_store(store)
+                store.clear()
+        writer.write_store(store)
+        path = writer.path
+        writer.close()
+        results["opc_store"] = _throughput(rows, path, time.perf_counter() - start)
+
+        # Current RMS rows (CsvRmsSink)
+        clock = SampleClock(BENCH_RATE)
+        path = os.path.join(folder, "current.csv")
+        sink = CsvRmsSink(path, clock)
+        t = np.arange(rows) * 5 / BENCH_RATE
+        values = np.abs(np.sin(t * 314.0)).reshape(-1, 1)
+        start = time.perf_counter()
+        for i in range(0, rows, 400):
+            sl = slice(i, i + 400)
+            sink.write_block(RmsBlock(t[sl], values[sl], values[sl], values[sl],
+                                      float(t[sl][-1]), time.time()), 0.0)
+        sink.close()
+        results["current_rows"] = _throughput(rows, path, time.perf_counter() - start)
+    for name, result in results.items():
+        print(f"  {name:12s}: {result['rows_per_sec']:12,.0f} rows/s  "
+              f"{result['mb_per_sec']:7.2f} MB/s")
+    return results
+
+
+def _throughput(rows, path, elapsed):
+    size = os.path.getsize(path)
+    return {"rows": rows, "bytes": size, "seconds": round(elapsed, 4),
+            "rows_per_sec": round(rows / elapsed, 1),
+            "mb_per_sec": round(size / elapsed / 1e6, 3)}
+
+
+def bench_memory(seconds=20.0, window=5, block=100):
+    sampler = ProcessSampler(os.getpid())
+    points = []
+    with tempfile.TemporaryDirectory() as folder:
+        pipeline = _CurrentPipeline(folder, BENCH_RATE, window, block)
+        pipeline.writer.start()
+        start = time.perf_counter()
+        next_sample = start
+        try:
+            while time.perf_counter() - start < seconds:
+                pipeline.step()
+                if time.perf_counter() >= next_sample:
+                    rss = sampler.sample()["rss_bytes"]
+                    if rss is not None:
+                        points.append((time.perf_counter() - start, rss))
+                    next_sample += 1.0
+                # Keep the cycle list from growing the measurement itself
+                del pipeline.cycles[:]
+        finally:
+            pipeline.writer.stop()
+            pipeline.bus.close()
+    if len(points) < 2:
+        return {"available": False}
+    t, rss = np.array(points).T
+    slope = float(np.polyfit(t, rss, 1)[0])
+    result = {"available": True, "seconds": seconds,
+              "rss_start_bytes": int(rss[0]), "rss_end_bytes": int(rss[-1]),
+              "rss_max_bytes": int(rss.max()),
+              "growth_bytes_per_sec": round(slope, 1)}
+    print(f"  RSS {rss[0] / 1e6:.1f} -> {rss[-1] / 1e6:.1f} MB, "
+          f"slope {slope / 1e3:.1f} kB/s")
+    return result
+
+
+def environment():
+    """نسخه‌ها و مشخصات سیستم برای مقایسه نتایج"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "commit": commit,
+            "python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "system": platform.platform(),
+            "cpu_count": os.cpu_count()}
+
+
+def _metrics(results, prefix=""):
+    # Flatten to {"current_rate[window=5,block=100].rate_hz": value}
+    out = {}
+    if isinstance(results, dict):
+        for key, value in results.items():
+            out.update(_metrics(value, f"{prefix}.{key}" if prefix else key))
+    elif isinstance(results, list):
+        for item in results:
+            label = ",".join(f"{k}={v}" for k, v in item.items()
+                             if k in ("rms_window", "samples_per_channel", "nodes", "mode"))
+            out.update(_metrics(item, f"{prefix}[{label}]"))
+    elif isinstance(results, (int, float)) and not isinstance(results, bool):
+        out[prefix] = results
+    return out
+
+
+def compare(new, old, threshold=REGRESSION_THRESHOLD):
+    """
+    Regressions of ``new`` against ``old`` (both loaded result files).
+
+    Returns:
+        list: ``(metric, old, new)`` for rates/throughputs that fell and
+        mean times that rose by more than ``threshold``, and for memory
+        growth above the old value by more than that plus GROWTH_FLOOR.
+    """
+    old_metrics = _metrics(old["results"])
+    regressions = []
+    for name, value in _metrics(new["results"]).items():
+        base = old_metrics.get(name)
+        leaf = name.rsplit(".", 1)[-1]
+        if base is None or leaf not in _HIGHER_IS_BETTER + _LOWER_IS_BETTER:
+            continue
+        if leaf == "growth_bytes_per_sec":
+            if value > max(base, 0.0) * (1 + threshold) + GROWTH_FLOOR:
+                regressions.append((name, base, value))
+            continue
+        if not base:
+            continue
+        change = (value - base) / abs(base)
+        if leaf in _HIGHER_IS_BETTER:
+            change = -change
+        if change > threshold:
+            regressions.append((name, base, value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the logger hot paths")
+    parser.add_argument("-o", "--output", default="benchmark_results.json")
+    parser.add_argument("--only", nargs="+",
+                        choices=["current_rate", "read_loop", "opc_read", "csv_write",
+                                 "memory"])
+    parser.add_argument("--seconds", type=float, default=2.0,
+                        help="duration of each current_rate step")
+    parser.add_argument("--max-rate", type=float, default=MAX_RATE,
+                        help="highest current_rate step (Hz per channel)")
+    parser.add_argument("--read-seconds", type=float, default=5.0,
+                        help="duration of each read_loop case")
+    parser.add_argument("--memory-seconds", type=float, default=20.0)
+    parser.add_argument("--windows", type=int, nargs="+", default=DEFAULT_WINDOWS)
+    parser.add_argument("--blocks", type=int, nargs="+", default=DEFAULT_BLOCKS)
+    parser.add_argument("--nodes", type=int, nargs="+", default=DEFAULT_NODE_COUNTS)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="simulated OPC UA read latency (ms)")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--compare", help="earlier result file")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    # opc_logger logs every file it writes
+    import logging
+    logging.getLogger("opc_logger").setLevel(logging.WARNING)
+    logging.getLogger("opcua").setLevel(logging.WARNING)
+
+    selected = args.only or ["current_rate", "read_loop", "opc_read", "csv_write",
+                             "memory"]
+    results = {}
+    for name in selected:
+        print(f"{name}:")
+        if name == "current_rate":
+            results[name] = bench_current_rate(args.windows, args.blocks, args.seconds,
+                                               max_rate=args.max_rate)
+        elif name == "read_loop":
+            results[name] = bench_read_loop(args.read_seconds)
+        elif name == "opc_read":
+            results[name] = bench_opc_read(args.nodes, latency_ms=args.latency)
+        elif name == "csv_write":
+            results[name] = bench_csv_write(args.rows)
+        else:
+            results[name] = bench_memory(args.memory_seconds)
+    report = {"environment": environment(), "results": results}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            old = json.load(f)
+        regressions = compare(report, old, args.threshold)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before} -> {after}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare}")
+
+
+if __name__ == '__main__':
+    main()
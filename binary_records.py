@@ -0,0 +1,266 @@
+"""
+    Appendable fixed-width binary record files.
+
+    File layout::
+
+        8 bytes   magic  b'KSFREC01'
+        4 bytes   little-endian uint32: total header size in bytes
+        n bytes   UTF-8 JSON metadata (includes the record dtype), padded
+                  with spaces so the records start on a 64-byte boundary
+        ...       records, back to back, in the dtype from the metadata
+
+    Records are appended (:py:meth:`RecordWriter.overwrite` can update
+    existing ones in place), so a file that is still being written
+    (or was cut short by a power loss) can be read up to its last complete
+    record. :py:func:`read_records` memory-maps the records into a NumPy
+    structured array without loading or parsing them.
+
+    Data files packed into daily archives by compact_data.py are addressed
+    as ``<folder>/archive/<source>_<day>.zip!<file name>``;
+    :py:func:`open_data`, :py:func:`data_files` and :py:func:`read_records`
+    accept these paths like plain ones.
+"""
+import glob
+import io
+import json
+import os
+import struct
+import zipfile
+
+import numpy as np
+
+MAGIC = b'KSFREC01'
+_ALIGN = 64
+_PREFIX = struct.Struct('<8sI')
+
+# Daily archives of a data folder and the archive/member separator
+ARCHIVE_DIR = 'archive'
+ARCHIVE_SEP = '!'
+
+
+def _dtype_to_json(dtype):
+    return [list(field) for field in np.dtype(dtype).descr]
+
+
+def _dtype_from_json(descr):
+    return np.dtype([tuple(field) if len(field) == 2
+                     else (field[0], field[1], tuple(field[2]))
+                     for field in descr])
+
+
+class RecordWriter(object):
+    """
+    Append structured NumPy records to a binary record file.
+
+    Args:
+        path (str): Output file. Created with a new header if it does not
+            exist, otherwise records are appended after checking the dtype.
+        dtype (numpy.dtype): Structured record type.
+        meta (dict): Extra metadata stored in the header (JSON-serializable).
+    """
+
+    def __init__(self, path, dtype, meta=None):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.meta = dict(meta or {})
+        self.records = 0
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            existing, offset = read_header(path)
+            if _dtype_from_json(existing['dtype']) != self.dtype:
+                raise ValueError('Error: record dtype does not match '
+                                 '{}'.format(path))
+            self.meta = existing
+            self.offset = offset
+            self._file = open(path, 'r+b')
+            # Drop a trailing partial record left by an interrupted write
+            size = os.path.getsize(path) - offset
+            self.records = size // self.dtype.itemsize
+            self._file.truncate(offset + self.records * self.dtype.itemsize)
+            self._file.seek(0, os.SEEK_END)
+        else:
+            self.meta['dtype'] = _dtype_to_json(self.dtype)
+            header = encode_header(self.meta)
+            self.offset = len(header)
+            self._file = open(path, 'wb')
+            self._file.write(header)
+
+    def append(self, records):
+        """Append an array of records (must have the file's dtype)."""
+        records = np.ascontiguousarray(records, dtype=self.dtype)
+        self._file.write(records.tobytes())
+        self.records += records.size
+
+    def overwrite(self, index, records):
+        """
+        Rewrite records in place from record number ``index`` on (e.g. an
+        aggregate that is still being updated). Appending continues at the
+        end of the file.
+        """
+        records = np.ascontiguousarray(records, dtype=self.dtype)
+        if index < 0 or index + records.size > self.records:
+            raise IndexError('Error: records out of range')
+        self._file.seek(self.offset + index * self.dtype.itemsize)
+        self._file.write(records.tobytes())
+        self._file.seek(0, os.SEEK_END)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+
+def split_archive_path(path):
+    """``(archive, member)`` of an archive member path, else ``(path, None)``."""
+    archive, sep, member = path.rpartition(ARCHIVE_SEP)
+    if sep and archive.endswith('.zip') and os.path.isfile(archive):
+        return archive, member
+    return path, None
+
+
+def data_exists(path):
+    """bool: A data file or archive member exists."""
+    archive, member = split_archive_path(path)
+    if member is None:
+        return os.path.exists(path)
+    try:
+        with zipfile.ZipFile(archive) as zf:
+            zf.getinfo(member)
+        return True
+    except (KeyError, zipfile.BadZipFile):
+        return False
+
+
+def open_data(path, text=False):
+    """
+    Open a data file or archive member for reading.
+
+    Args:
+        text (bool): Text mode as used for the CSV files (UTF-8, no
+            newline translation); binary otherwise.
+
+    Raises:
+        FileNotFoundError: The file or member does not exist.
+    """
+    archive, member = split_archive_path(path)
+    if member is None:
+        if text:
+            return open(path, 'r', newline='', encoding='utf-8')
+        return open(path, 'rb')
+    # The member keeps the archive file open after the ZipFile is closed
+    with zipfile.ZipFile(archive) as zf:
+        try:
+            f = zf.open(member)
+        except KeyError:
+            raise FileNotFoundError('Error: {} not in {}'.format(member, archive))
+    if text:
+        return io.TextIOWrapper(f, encoding='utf-8', newline='')
+    return f
+
+
+def data_files(folder):
+    """
+    ``(name, path)`` of the files in ``folder`` and of the members of its
+    daily archives. A file that is in both (kept after a failed archive
+    check) is listed once, as the plain file; a plain ``<name>.csv`` /
+    ``.bin`` also hides the members of its converted copy (``<name>.bin``
+    and its sidecars).
+    """
+    if not os.path.isdir(folder):
+        return []
+    names = os.listdir(folder)
+    files = [(name, os.path.join(folder, name)) for name in names]
+    seen = set(names)
+    stems = {stem for stem, _, ext in (name.partition('.') for name in names)
+             if ext in ('csv', 'bin')}
+    for archive in sorted(glob.glob(os.path.join(folder, ARCHIVE_DIR, '*.zip'))):
+        try:
+            with zipfile.ZipFile(archive) as zf:
+                members = zf.namelist()
+        except zipfile.BadZipFile:
+            continue
+        for name in members:
+            if name not in seen and name.partition('.')[0] not in stems:
+                seen.add(name)
+                files.append((name, archive + ARCHIVE_SEP + name))
+    return files
+
+
+def encode_header(meta):
+    """Return the header bytes for a metadata dict."""
+    body = json.dumps(meta, sort_keys=True).encode('utf-8')
+    size = _PREFIX.size + len(body)
+    size += (-size) % _ALIGN
+    return _PREFIX.pack(MAGIC, size) + body.ljust(size - _PREFIX.size)
+
+
+def read_header(path):
+    """
+    Read the header of a record file.
+
+    Returns:
+        tuple: ``(meta, offset)`` where offset is the first record byte.
+
+    Raises:
+        ValueError: The file is not a record file.
+    """
+    with open_data(path) as f:
+        prefix = f.read(_PREFIX.size)
+        if len(prefix) < _PREFIX.size:
+            raise ValueError('Error: truncated header in {}'.format(path))
+        magic, size = _PREFIX.unpack(prefix)
+        if magic != MAGIC:
+            raise ValueError('Error: not a record file: {}'.format(path))
+        return decode_header(prefix + f.read(size - _PREFIX.size))
+
+
+def decode_header(data):
+    """
+    Decode a header from a bytes-like object (e.g. a shared memory block).
+
+    Returns:
+        tuple: ``(meta, size)``.
+    """
+    magic, size = _PREFIX.unpack_from(data)
+    if magic != MAGIC or len(data) < size:
+        raise ValueError('Error: not a record header')
+    meta = json.loads(bytes(data[_PREFIX.size:size]).decode('utf-8'))
+    return meta, size
+
+
+def record_dtype(meta):
+    """Record dtype stored in a header's metadata."""
+    return _dtype_from_json(meta['dtype'])
+
+
+def read_records(path):
+    """
+    Memory-map the records of a file into a NumPy structured array.
+
+    Only complete records are mapped, so files that are still being
+    written can be read safely. Archive members cannot be mapped; they are
+    decompressed into memory.
+
+    Returns:
+        tuple: ``(meta, records)``; records is a read-only ``numpy.memmap``
+        (or an empty array if the file has no records yet).
+    """
+    if split_archive_path(path)[1] is not None:
+        with open_data(path) as f:
+            data = f.read()
+        meta, offset = decode_header(data)
+        dtype = _dtype_from_json(meta['dtype'])
+        count = (len(data) - offset) // dtype.itemsize
+        return meta, np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+    meta, offset = read_header(path)
+    dtype = _dtype_from_json(meta['dtype'])
+    count = (os.path.getsize(path) - offset) // dtype.itemsize
+    if count == 0:
+        return meta, np.empty(0, dtype=dtype)
+    return meta, np.memmap(path, dtype=dtype, mode='r', offset=offset,
+                           shape=(count,))
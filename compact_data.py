@@ -0,0 +1,352 @@
+"""
+Background compaction of rotated data files into daily archives
+فشرده‌سازی فایل‌های قدیمی در آرشیو روزانه
+
+Closed files of past days (current_data and opc data, with their
+``.events`` / ``.errors`` / ``.status.csv`` sidecars and the status change
+logs) are packed into one compressed archive per day and source::
+
+    <folder>/archive/current_2026-01-12.zip
+    <folder>/archive/opc_2026-01-12.zip
+
+CSV data files are stored as :py:mod:`binary_records` members (the
+format the binary loggers write): ``currentdata_<time>.csv`` becomes
+``currentdata_<time>.bin`` with its ``#`` comment rows in
+``<member>.events``, ``opc_data_<time>.csv`` becomes ``opc_data_<time>.bin``
+with the non-numeric cells in ``<member>.errors``, and their sidecars are
+renamed to match (``.bin.status.csv``, ``.bin.stats.json``). Binary data
+files and all other files are stored unchanged (deflate). After the
+archive is closed, each data member is decoded back from it and its row
+count and first/last timestamps checked against the source before the
+source is deleted; the other members are read back (CRC) and their line
+counts compared. Index entries (:py:mod:`data_index`) are moved to
+``<archive>!<member>``; merge_data, opc_status and data_index read these
+members directly from the archive (:py:func:`binary_records.open_data`).
+
+The job lowers its own CPU and I/O priority (nice 19, ionice idle class)
+and limits its read rate, so the loggers are not disturbed. start.py runs
+it in loop mode; for a single pass:
+    python compact_data.py --once
+"""
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+import zipfile
+from datetime import datetime
+
+import numpy as np
+
+import merge_data
+from binary_records import RecordWriter, read_records, open_data, ARCHIVE_DIR, ARCHIVE_SEP
+from current_writer import rms_dtype
+from data_index import DataIndex, DEFAULT_INDEX
+from heartbeat import Heartbeat
+from opc_status import read_dense
+from opc_store import OpcSampleStore, open_binary
+
+CURRENT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "Ziresch", "current_data")
+OPC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opc data")
+
+# فقط فایل‌هایی که این مدت تغییر نکرده‌اند (ثانیه)
+MIN_AGE_SEC = 3600
+# حداکثر سرعت خواندن (بایت بر ثانیه)
+MAX_BYTES_PER_SEC = 4 * 1024 * 1024
+# فاصله اجرای دوره‌ای در حالت loop (ثانیه)
+RUN_INTERVAL = 3600
+COPY_CHUNK = 256 * 1024
+
+# تاریخ در نام فایل: 2026-01-12_10-35-30 یا 20260112_110724
+_DAY = re.compile(r"(\d{4})-?(\d{2})-?(\d{2})_\d{2}-?\d{2}-?\d{2}")
+# فایل‌های داده CSV که در آرشیو به binary_records تبدیل می‌شوند
+_CSV_DATA = re.compile(r"(currentdata|opc_data)_[^.]+\.csv$")
+# ستون‌های فایل چندکاناله: "CH4 RMS Current (A)"
+_CHANNEL = re.compile(r"CH(\d+) ")
+
+
+def lower_priority():
+    """کمترین اولویت CPU و I/O برای این process"""
+    if hasattr(os, "nice"):
+        try:
+            os.nice(19)
+        except OSError:
+            pass
+    if shutil.which("ionice"):
+        subprocess.run(["ionice", "-c", "3", "-p", str(os.getpid())],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+class Throttle(object):
+    """محدودیت سرعت خواندن: بعد از هر بخش به اندازه لازم صبر می‌کند"""
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.start = time.monotonic()
+        self.done = 0
+
+    def consume(self, count):
+        self.done += count
+        ahead = self.done / self.rate - (time.monotonic() - self.start)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def closed_files_by_day(folder, min_age=MIN_AGE_SEC, now=None):
+    """
+    Files of past days that are no longer written, grouped by day.
+
+    Returns:
+        dict: ``{"YYYY-MM-DD": [path, ...]}``
+    """
+    now = time.time() if now is None else now
+    today = datetime.fromtimestamp(now).strftime("%Y-%m-%d")
+    days = {}
+    if not os.path.isdir(folder):
+        return days
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        match = _DAY.search(name)
+        if not match or not os.path.isfile(path):
+            continue
+        day = "-".join(match.groups())
+        if day >= today or now - os.path.getmtime(path) < min_age:
+            continue
+        days.setdefault(day, []).append(path)
+    return days
+
+
+def count_rows(f):
+    """تعداد خطوط یک فایل (بررسی فایل‌های همراه)"""
+    lines = 0
+    for chunk in iter(lambda: f.read(COPY_CHUNK), b""):
+        lines += chunk.count(b"\n")
+    return lines
+
+
+def is_data_file(name):
+    """currentdata_* / opc_data_* فایل داده (نه فایل همراه آن)"""
+    return (name.startswith(("currentdata_", "opc_data_")) and
+            name.partition(".")[2] in ("csv", "bin"))
+
+
+def member_names(names):
+    """
+    Archive member name of each file: CSV data files and their sidecars
+    are renamed to ``.bin`` (they are converted), the others are kept.
+
+    Returns:
+        dict: ``{file name: member name}``
+    """
+    converted = {name[:-len(".csv")] for name in names if _CSV_DATA.match(name)}
+    members = {}
+    for name in names:
+        stem = name.partition(".")[0]
+        if stem in converted and name.startswith(stem + ".csv"):
+            members[name] = stem + ".bin" + name[len(stem) + len(".csv"):]
+        else:
+            members[name] = name
+    return members
+
+
+def _convert_current(path, out):
+    """currentdata CSV -> binary records + ``.events`` (ردیف‌های #)"""
+    chunks = list(merge_data.read_current(path))
+    columns = chunks[0].columns if chunks else []
+    channels = [int(_CHANNEL.match(column).group(1)) for column in columns[0::3]
+                if _CHANNEL.match(column)] or [None]
+    dtype = rms_dtype(len(channels))
+    writer = RecordWriter(out, dtype, {"channels": channels,
+                                       "archived_from": os.path.basename(path)})
+    try:
+        for chunk in chunks:
+            records = np.empty(len(chunk.t), dtype=dtype)
+            records["t"] = chunk.t
+            shape = records["rms"].shape
+            records["rms"] = chunk.values[:, 0::3].reshape(shape)
+            records["peak"] = chunk.values[:, 1::3].reshape(shape)
+            records["min"] = chunk.values[:, 2::3].reshape(shape)
+            writer.append(records)
+    finally:
+        writer.close()
+    with open(path, newline="", encoding="utf-8") as f:
+        comments = [line for line in f if line.startswith("#")]
+    if comments:
+        with open(out + ".events", "w", newline="", encoding="utf-8") as f:
+            f.writelines(comments)
+
+
+def _convert_opc(path, out):
+    """opc_data CSV -> binary records + ``.errors`` (متن‌ها و خانه‌های خالی)"""
+    columns, rows = read_dense(path, -np.inf, np.inf)
+    store = OpcSampleStore(columns, capacity=max(1, len(rows)))
+    for t, cells in rows:
+        store.append(t, cells)
+    writer = open_binary(out, columns, {"archived_from": os.path.basename(path)})
+    try:
+        store.to_binary(writer)
+    finally:
+        writer.close()
+
+
+def convert_csv(path, out):
+    """
+    Write a CSV data file as a binary record file (plus its ``.events`` /
+    ``.errors`` file, if any).
+
+    Returns:
+        list: The files written.
+    """
+    if os.path.basename(path).startswith("currentdata_"):
+        _convert_current(path, out)
+    else:
+        _convert_opc(path, out)
+    return [name for name in (out, out + ".events", out + ".errors")
+            if os.path.exists(name)]
+
+
+def data_summary(path):
+    """
+    Row count and first/last time (epoch) of a data file or archive member.
+
+    Returns:
+        tuple: ``(rows, first, last)``; first/last are None without rows.
+    """
+    if path.endswith(".bin"):
+        t = read_records(path)[1]["t"]
+    else:
+        name = os.path.basename(path)
+        reader = merge_data.read_current if name.startswith("currentdata_") else merge_data.read_opc
+        t = np.concatenate([chunk.t for chunk in reader(path)] or [np.empty(0)])
+    if not len(t):
+        return 0, None, None
+    return len(t), float(t[0]), float(t[-1])
+
+
+def _same_rows(stored, expected):
+    if stored[0] != expected[0]:
+        return False
+    return stored[0] == 0 or np.allclose(stored[1:], expected[1:], rtol=0, atol=1e-6)
+
+
+def _store(zf, name, path, throttle):
+    with open(path, "rb") as src, zf.open(name, "w") as dst:
+        for chunk in iter(lambda: src.read(COPY_CHUNK), b""):
+            dst.write(chunk)
+            throttle.consume(len(chunk))
+
+
+def archive_day(folder, source, day, paths, throttle, index=None, dry_run=False):
+    """
+    Add the files of one day to its archive, verify them and delete them.
+
+    Returns:
+        tuple: ``(archived, bytes)``.
+    """
+    archive_dir = os.path.join(folder, ARCHIVE_DIR)
+    archive = os.path.join(archive_dir, f"{source}_{day}.zip")
+    if dry_run:
+        print(f"[compact] {len(paths)} file(s) -> {archive}")
+        return 0, 0
+    os.makedirs(archive_dir, exist_ok=True)
+    members = member_names([os.path.basename(path) for path in paths])
+    # Data files first: the sidecars of a file that was kept are kept too
+    paths = sorted(paths, key=lambda path: not is_data_file(os.path.basename(path)))
+    kept = set()
+    with zipfile.ZipFile(archive, "a", compression=zipfile.ZIP_DEFLATED,
+                         compresslevel=6) as zf:
+        existing = set(zf.namelist())
+        for path in paths:
+            name = os.path.basename(path)
+            member = members[name]
+            if member in existing:
+                continue
+            if not (is_data_file(name) and member != name):
+                _store(zf, member, path, throttle)
+                continue
+            try:
+                with tempfile.TemporaryDirectory(dir=archive_dir) as tmp:
+                    for out in convert_csv(path, os.path.join(tmp, member)):
+                        _store(zf, os.path.basename(out), out, throttle)
+            except ValueError as e:
+                print(f"[compact] {name}: conversion failed ({e}), kept")
+                kept.add(name.partition(".")[0])
+    # Verify: decode each member back from the closed archive (CRC checked while reading)
+    archived = size = 0
+    for path in paths:
+        name = os.path.basename(path)
+        if name.partition(".")[0] in kept:
+            continue
+        member = f"{archive}{ARCHIVE_SEP}{members[name]}"
+        try:
+            if is_data_file(name):
+                stored, expected = data_summary(member), data_summary(path)
+                ok = _same_rows(stored, expected)
+            else:
+                with open_data(member) as f:
+                    stored = count_rows(f)
+                with open(path, "rb") as f:
+                    expected = count_rows(f)
+                ok = stored == expected
+        except (zipfile.BadZipFile, FileNotFoundError, ValueError) as e:
+            print(f"[compact] {name}: archive check failed ({e}), kept")
+            kept.add(name.partition(".")[0])
+            continue
+        if not ok:
+            print(f"[compact] {name}: {stored} archived, {expected} in source - kept")
+            kept.add(name.partition(".")[0])
+            continue
+        size += os.path.getsize(path)
+        if index is not None:
+            index.relocate(path, os.path.abspath(archive) + ARCHIVE_SEP + members[name])
+        os.remove(path)
+        archived += 1
+    return archived, size
+
+
+def compact(folders, index=None, rate=MAX_BYTES_PER_SEC, min_age=MIN_AGE_SEC,
+            dry_run=False):
+    """یک دور فشرده‌سازی همه‌ی فولدرها"""
+    throttle = Throttle(rate)
+    total = 0
+    for folder, source in folders:
+        for day, paths in sorted(closed_files_by_day(folder, min_age).items()):
+            archived, size = archive_day(folder, source, day, paths, throttle,
+                                         index, dry_run)
+            if archived:
+                print(f"[compact] {source} {day}: {archived} file(s), "
+                      f"{size / 1e6:.1f} MB archived")
+            total += archived
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact old data files into daily archives")
+    parser.add_argument("--once", action="store_true", help="one pass, then exit")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--rate", type=float, default=MAX_BYTES_PER_SEC,
+                        help="max read rate in bytes/s")
+    parser.add_argument("--min-age", type=float, default=MIN_AGE_SEC)
+    parser.add_argument("--index", default=DEFAULT_INDEX, help="'' = no index")
+    args = parser.parse_args()
+
+    lower_priority()
+    index = DataIndex(args.index) if args.index else None
+    folders = [(CURRENT_FOLDER, "current"), (OPC_FOLDER, "opc")]
+    heartbeat = Heartbeat.from_env(interval=1.0)
+    archived = 0
+    while True:
+        archived += compact(folders, index, args.rate, args.min_age, args.dry_run)
+        if args.once:
+            break
+        next_run = time.monotonic() + RUN_INTERVAL
+        while time.monotonic() < next_run:
+            heartbeat.beat(samples=archived)
+            time.sleep(heartbeat.interval)
+
+
+if __name__ == '__main__':
+    main()
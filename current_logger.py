@@ -1,35 +1,125 @@
 # KSF 2024: Fixed current logger with RMS calculation
 # Uses scan mode for accurate timing and calculates RMS current
-from daqhats import mcc118, OptionFlags, HatIDs, HatError
-from daqhats_utils import select_hat_device, enum_mask_to_string
+from sim_mcc118 import simulate_enabled
+# KSF_SIMULATE=1: synthetic CT signal instead of the HAT (sim_mcc118.py)
+if simulate_enabled():
+    from sim_mcc118 import mcc118, OptionFlags, HatIDs, HatError
+else:
+    from daqhats import mcc118, OptionFlags, HatIDs, HatError
+from daqhats_utils import select_hat_device, enum_mask_to_string, \
+    chan_list_to_mask, validate_channels
+from rms_engine import BlockRmsEngine, CycleRmsEngine
+from spectral import HarmonicAnalyzer
+from sample_clock import SampleClock
+from current_writer import BlockWriter, CsvRmsSink, BinaryRmsSink
+from current_pipeline import CurrentPipeline
+from waveform_capture import WaveformCapture
+from heartbeat import Heartbeat
+from live_bus import LiveRing, CURRENT_BUS, current_dtype
+from data_index import DataIndex, DEFAULT_INDEX
+from rollups import RollupWriter
+from scan_scheduler import ReadScheduler
+import signal
 import time
-import csv
 from datetime import datetime
 import os
 import numpy as np
 
 # === Configuration ===
 SAMPLE_RATE_HZ = 20000  # 10kHz for accurate AC measurement
-SAMPLES_PER_CHANNEL = 100  # Samples per read (10ms window at 10kHz)
+# Reads block in the library until READ_PERIOD_SEC of samples are there
+# (no polling/sleep); the read grows when a backlog builds up in the scan
+# buffer (scan_scheduler.py)
+READ_PERIOD_SEC = 0.05
 PERIOD_SEC = 150  # Save file every n seconds
-CH = 4  # Input channel (0-7) - CT connected to CH4
-CH_MASK = 1 << CH  # Convert to bit mask (CH4 = 0b00010000 = 16)
+CHANNELS = [4]  # Input channels (0-7) - CT connected to CH4, e.g. [4, 5, 6] for 3 phases
+CH_MASK = chan_list_to_mask(CHANNELS)  # Convert to bit mask (CH4 = 0b00010000 = 16)
 SHUNT_OHM = 100.0  # CT shunt resistance
 TURNS_RATIO = 1000.0  # CT turns ratio (1000:1)
+# Per-channel overrides of the CT settings, e.g. {5: 50.0}
+CHANNEL_SHUNT_OHM = {}
+CHANNEL_TURNS_RATIO = {}
 OUTDIR = os.path.join(".", "Ziresch", "current_data")
 
-# Calculate RMS every N samples (50Hz AC = 20ms period)
-# At 10kHz, 200 samples = 20ms = 1 full AC cycle
-RMS_WINDOW = 5  # Samples for RMS calculation
+# RMS_MODE "window": RMS every RMS_WINDOW samples. 5 samples at 20kHz is
+# 0.25ms, a fraction of one 50Hz cycle (a full cycle is 400 samples)
+# RMS_MODE "cycle": true RMS over RMS_CYCLES whole line periods between
+# rising zero crossings (50 rows/s for RMS_CYCLES = 1)
+RMS_MODE = "window"
+RMS_WINDOW = 5  # Samples for RMS calculation ("window" mode)
+RMS_CYCLES = 1  # Line periods per RMS value ("cycle" mode)
+FUNDAMENTAL_HZ = 50.0  # Line frequency (cycle RMS and harmonics)
+# Zero band for the crossing detection (V at the shunt); below this the
+# signal counts as off and rows of nominal length are written
+ZERO_CROSS_HYSTERESIS_V = 0.02
+
+# Row times come from the sample clock; every ANCHOR_SEC a wall-clock
+# anchor line is written so drift between the two clocks can be checked
+ANCHOR_SEC = 10
+
+# Blocks waiting for the writer thread before new ones are dropped
+# (512 blocks of READ_PERIOD_SEC = 25 s of data)
+WRITER_QUEUE_BLOCKS = 512
+
+# Output format: "csv" (text) or "binary" (fixed-width records, ~3x smaller,
+# read back with binary_records.read_records)
+OUTPUT_FORMAT = "csv"
+
+# Raw waveform capture: the last WAVEFORM_BUFFER_SEC of raw samples stay in
+# memory and the window around a trigger is dumped to WAVEFORM_DIR.
+# Triggers: RMS above RMS_TRIGGER_A (None = off), SIGUSR1, or the trigger
+# file written by the OPC UA logger on a progEvent change.
+WAVEFORM_CAPTURE = True
+WAVEFORM_BUFFER_SEC = 10
+WAVEFORM_PRE_SEC = 2
+WAVEFORM_POST_SEC = 1
+RMS_TRIGGER_A = None
+WAVEFORM_DIR = os.path.join(OUTDIR, "waveforms")
+WAVEFORM_TRIGGER_FILE = os.path.join(OUTDIR, "waveform.trigger")
+TRIGGER_POLL_SEC = 0.5
+
+# Publish every RMS window to the shared-memory live bus (live_bus.py) so
+# other processes can read live current data; LIVE_BUS_SEC of windows kept
+LIVE_BUS = True
+LIVE_BUS_SEC = 30
+
+# Harmonic analysis of the raw samples: fundamental, THD and harmonics
+# 2..HARMONIC_COUNT per frame of HARMONIC_CYCLES line periods (frames
+# overlap by HARMONIC_OVERLAP), written to <file>.harmonics.csv
+HARMONICS = False
+HARMONIC_COUNT = 10
+HARMONIC_CYCLES = 10
+HARMONIC_OVERLAP = 0.5
+
+# 1 s / 1 min / 1 h aggregates (mean, RMS, max, min, count) kept up to
+# date in small files in ROLLUP_DIR (rollups.py)
+ROLLUPS = True
+ROLLUP_DIR = os.path.join(OUTDIR, "rollups")
+
+# Time-range catalog updated whenever a file is closed (None = off)
+DATA_INDEX = DEFAULT_INDEX
 
 os.makedirs(OUTDIR, exist_ok=True)
 
 print("\n========== KSF MCC118 RMS Current Logger ==========")
-print(f"Sampling: {SAMPLE_RATE_HZ:,} Hz on CH{CH} (mask: 0x{CH_MASK:02X})")
-print(f"RMS Window: {RMS_WINDOW} samples ({RMS_WINDOW/SAMPLE_RATE_HZ*1000:.1f}ms)")
+if simulate_enabled():
+    print("SIMULATION: synthetic CT signal (sim_mcc118.py), no hardware used")
+print(f"Sampling: {SAMPLE_RATE_HZ:,} Hz on CH{','.join(str(ch) for ch in CHANNELS)} (mask: 0x{CH_MASK:02X})")
+if RMS_MODE == "cycle":
+    print(f"RMS: every {RMS_CYCLES} cycle(s) of {FUNDAMENTAL_HZ:g} Hz (zero-crossing synchronous)")
+else:
+    print(f"RMS Window: {RMS_WINDOW} samples ({RMS_WINDOW/SAMPLE_RATE_HZ*1000:.1f}ms)")
 print(f"Save period: {PERIOD_SEC}s")
-print(f"Output: {OUTDIR}")
-print(f"CT: {TURNS_RATIO:.0f}:1, Shunt: {SHUNT_OHM:g} Ohm\n")
+print(f"Output: {OUTDIR} ({OUTPUT_FORMAT})")
+if HARMONICS:
+    print(f"Harmonics: {HARMONIC_COUNT} x {FUNDAMENTAL_HZ:g} Hz, "
+          f"{HARMONIC_CYCLES}-cycle frames, {HARMONIC_OVERLAP:.0%} overlap")
+for ch in CHANNELS:
+    print(f"CH{ch} CT: {CHANNEL_TURNS_RATIO.get(ch, TURNS_RATIO):.0f}:1, "
+          f"Shunt: {CHANNEL_SHUNT_OHM.get(ch, SHUNT_OHM):g} Ohm")
+print()
+
+validate_channels(set(CHANNELS), mcc118.info().NUM_AI_CHANNELS)
 
 # Initialize HAT
 address = select_hat_device(HatIDs.MCC_118)
@@ -37,22 +127,22 @@ hat = mcc118(address)
 print(f"MCC118 initialized (address: {hat.address()})\n")
 
 # Verify actual sample rate
-actual_rate = hat.a_in_scan_actual_rate(1, SAMPLE_RATE_HZ)  # 1 channel
+actual_rate = hat.a_in_scan_actual_rate(len(CHANNELS), SAMPLE_RATE_HZ)  # per channel
 print(f"Requested rate: {SAMPLE_RATE_HZ} Hz")
 print(f"Actual rate: {actual_rate} Hz\n")
 
-def get_filename():
-    """Generate timestamped filename"""
-    now = datetime.now()
+def get_filename(when=None, extension=".csv"):
+    """Generate timestamped filename (when: epoch seconds, default now)"""
+    now = datetime.now() if when is None else datetime.fromtimestamp(when)
     return os.path.join(
         OUTDIR,
-        now.strftime("currentdata_%Y-%m-%d_%H-%M-%S.csv")
+        now.strftime("currentdata_%Y-%m-%d_%H-%M-%S") + extension
     )
 
-def voltage_to_current(voltage):
+def voltage_to_current(voltage, channel=None):
     """Convert CT voltage to primary current"""
-    secondary_current = voltage / SHUNT_OHM
-    primary_current = secondary_current * TURNS_RATIO
+    secondary_current = voltage / CHANNEL_SHUNT_OHM.get(channel, SHUNT_OHM)
+    primary_current = secondary_current * CHANNEL_TURNS_RATIO.get(channel, TURNS_RATIO)
     return primary_current
 
 def calculate_rms(voltages):
@@ -65,10 +155,8 @@ def calculate_rms(voltages):
     i_rms = voltage_to_current(v_rms)
     return i_rms
 
-def acquire_with_rms():
-    """Acquire data continuously and save RMS values"""
-    
-    # Start scan
+def start_scan():
+    """Start the continuous scan"""
     # Syntax: a_in_scan_start(channel_mask, samples_per_channel, sample_rate_per_channel, options)
     # samples_per_channel: 0 = continuous (no limit on buffer size)
     options = OptionFlags.CONTINUOUS
@@ -76,64 +164,118 @@ def acquire_with_rms():
     scan_rate = SAMPLE_RATE_HZ
     
     hat.a_in_scan_start(CH_MASK, samples_per_channel, scan_rate, options)
+
+def restart_scan():
+    """Stop the scan after an overrun and start it again"""
+    hat.a_in_scan_stop()
+    hat.a_in_scan_cleanup()
+    start_scan()
+
+def acquire_with_rms():
+    """Acquire data continuously and save RMS values"""
+    
+    # Start scan
+    start_scan()
+    # Sample 0 is taken right after the scan starts
+    clock = SampleClock(actual_rate)
+    # Monotonic time of sample 0, shared with the other logger on the bus
+    mono_start = time.monotonic()
     print("Scan started. Press Ctrl+C to stop.\n")
+    scheduler = ReadScheduler(actual_rate,
+                              hat.a_in_scan_buffer_size() // len(CHANNELS),
+                              len(CHANNELS), READ_PERIOD_SEC)
+    
+    # Formatting, writes and file rotation run on the writer thread
+    sink_cls = BinaryRmsSink if OUTPUT_FORMAT == "binary" else CsvRmsSink
+    meta = {
+        "channels": CHANNELS,
+        "turns_ratio": [CHANNEL_TURNS_RATIO.get(ch, TURNS_RATIO) for ch in CHANNELS],
+        "shunt_ohm": [CHANNEL_SHUNT_OHM.get(ch, SHUNT_OHM) for ch in CHANNELS],
+        "rms_mode": RMS_MODE,
+        "rms_window": RMS_WINDOW if RMS_MODE == "window" else None,
+        "rms_cycles": RMS_CYCLES if RMS_MODE == "cycle" else None,
+    }
+    index = None
+    if DATA_INDEX:
+        try:
+            index = DataIndex(DATA_INDEX)
+        except Exception as error:
+            print(f"WARNING: Data index disabled: {error}")
+    rollups = RollupWriter(ROLLUP_DIR, CHANNELS, meta) if ROLLUPS else None
+    writer = BlockWriter(get_filename, clock, PERIOD_SEC, ANCHOR_SEC,
+                         sink_cls=sink_cls, meta=meta,
+                         maxsize=WRITER_QUEUE_BLOCKS, index=index,
+                         rollups=rollups)
+    writer.start()
+    
+    capture = None
+    if WAVEFORM_CAPTURE:
+        capture = WaveformCapture(WAVEFORM_DIR, clock, CHANNELS,
+                                  WAVEFORM_BUFFER_SEC, WAVEFORM_PRE_SEC,
+                                  WAVEFORM_POST_SEC, meta=meta,
+                                  block=scheduler.max_block)
     
-    # Initialize file
-    file = open(get_filename(), "w", newline="", encoding="utf-8")
-    writer = csv.writer(file)
-    writer.writerow(["Time (s)", "Timestamp", "RMS Current (A)"])
+    # All windows of all channels in a block are computed in one vectorized
+    # pass; the engine's per-channel scale converts CT voltage to current.
+    if RMS_MODE == "cycle":
+        engine = CycleRmsEngine(
+            actual_rate, FUNDAMENTAL_HZ, RMS_CYCLES, ZERO_CROSS_HYSTERESIS_V,
+            scale=[voltage_to_current(1.0, ch) for ch in CHANNELS],
+            channels=len(CHANNELS))
+    else:
+        engine = BlockRmsEngine(
+            RMS_WINDOW,
+            scale=[voltage_to_current(1.0, ch) for ch in CHANNELS],
+            channels=len(CHANNELS))
     
-    period_start = time.time()
-    t0 = time.time()
-    voltage_buffer = []
+    analyzer = None
+    if HARMONICS:
+        analyzer = HarmonicAnalyzer(
+            actual_rate, len(CHANNELS), FUNDAMENTAL_HZ, HARMONIC_CYCLES,
+            HARMONIC_OVERLAP, HARMONIC_COUNT,
+            scale=[voltage_to_current(1.0, ch) for ch in CHANNELS])
+    
+    # Status for start.py (no-op when started on its own)
+    heartbeat = Heartbeat.from_env()
+    
+    bus = None
+    if RMS_MODE == "cycle":
+        # One row per RMS_CYCLES periods, with room for frequency deviation
+        rows_per_sec = 2 * FUNDAMENTAL_HZ / RMS_CYCLES
+    else:
+        rows_per_sec = actual_rate / RMS_WINDOW
+    if LIVE_BUS:
+        try:
+            bus = LiveRing.create(
+                CURRENT_BUS, current_dtype(len(CHANNELS)),
+                int(LIVE_BUS_SEC * rows_per_sec), meta=meta)
+        except (OSError, RuntimeError) as error:
+            print(f"WARNING: Live bus disabled: {error}")
+    
+    # Per-block work (RMS, timestamps, triggers, live bus, writer, overrun
+    # restarts) is shared with benchmark.py
+    pipeline = CurrentPipeline(
+        hat, scheduler, clock, engine, writer, restart_scan,
+        capture=capture, rms_trigger=RMS_TRIGGER_A,
+        trigger_file=WAVEFORM_TRIGGER_FILE, trigger_poll_sec=TRIGGER_POLL_SEC,
+        analyzer=analyzer, bus=bus, anchor_sec=ANCHOR_SEC, mono_start=mono_start)
+    if capture is not None and hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1,
+                      lambda sig, frame: pipeline.external_triggers.append("signal"))
     
     try:
         while True:
-            # Read available samples
-            read_result = hat.a_in_scan_read(SAMPLES_PER_CHANNEL, -1)
-            
-            if read_result.hardware_overrun:
-                print("\nWARNING: Hardware overrun!")
-            if read_result.buffer_overrun:
-                print("\nWARNING: Buffer overrun!")
-            
-            # Add to buffer
-            voltage_buffer.extend(read_result.data)
-            
-            # Calculate RMS when we have enough samples
-            while len(voltage_buffer) >= RMS_WINDOW:
-                # Take RMS_WINDOW samples
-                window = voltage_buffer[:RMS_WINDOW]
-                voltage_buffer = voltage_buffer[RMS_WINDOW:]
-                
-                # Calculate RMS current
-                i_rms = calculate_rms(window)
-
-                # Write to file with precise timestamp
-                t_rel = time.time() - t0
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
-                writer.writerow([
-                    f"{t_rel:.6f}",
-                    timestamp,
-                    f"{i_rms:.6f}"
-                ])
-            
-            # Check if period is over
-            elapsed = time.time() - period_start
-            if elapsed >= PERIOD_SEC:
-                file.close()
-                samples_written = int(elapsed * SAMPLE_RATE_HZ / RMS_WINDOW)
-                print(f"[KSF] Saved ~{samples_written} RMS values. Rotating file...")
-                
-                # Start new file
-                period_start = time.time()
-                file = open(get_filename(), "w", newline="", encoding="utf-8")
-                writer = csv.writer(file)
-                writer.writerow(["Time (s)", "Timestamp", "RMS Current (A)"])
-                t0 = period_start
+            pipeline.step()
             
-            # Small delay to prevent CPU overload
-            time.sleep(0.001)
+            if heartbeat.due():
+                stats = writer.stats()
+                heartbeat.beat(samples=pipeline.samples_read,
+                               queue_depth=stats['queue_depth'],
+                               blocks_dropped=stats['blocks_dropped'],
+                               last_write=stats['last_write'],
+                               overruns=sum(pipeline.overruns.values()),
+                               samples_lost=pipeline.samples_lost,
+                               **scheduler.stats(reset=True))
             
     except KeyboardInterrupt:
         print("\n[KSF] Stopped by user.")
@@ -143,8 +285,22 @@ def acquire_with_rms():
         # Stop scan
         hat.a_in_scan_stop()
         hat.a_in_scan_cleanup()
-        if not file.closed:
-            file.close()
+        writer.stop()
+        heartbeat.close()
+        if bus is not None:
+            bus.close()
+        stats = writer.stats()
+        print(f"[KSF] Writer: {stats['blocks_written']} blocks written, "
+              f"{stats['blocks_dropped']} dropped, "
+              f"max queue {stats['max_queue_depth']}")
+        overruns = pipeline.overruns
+        print(f"[KSF] Samples: {pipeline.samples_read} read, {pipeline.samples_lost} "
+              f"({pipeline.samples_lost / actual_rate:.3f} s) lost in "
+              f"{overruns['hardware_overrun']} hardware and "
+              f"{overruns['buffer_overrun']} buffer overruns")
+        reads = scheduler.stats()
+        print(f"[KSF] Reads: {reads['reads']}, block {reads['block']}, "
+              f"max backlog {reads['max_backlog']} samples")
         print("[KSF] Scan stopped. Last file closed.")
 
 if __name__ == "__main__":
@@ -0,0 +1,224 @@
+"""
+    Per-block processing of the MCC118 current logger.
+
+    :py:class:`CurrentPipeline` carries the acquisition loop state from one
+    scan block to the next and does the work of one block: RMS, window
+    timestamps from the sample clock, waveform capture and its triggers,
+    harmonics, the live bus, handing the rows to the writer thread and, on
+    a scan overrun, restarting the scan and recording the gap.
+    current_logger.py runs it on the HAT; benchmark.py runs the same code
+    on a paced simulated scan.
+"""
+import time
+
+import numpy as np
+
+from current_writer import RmsBlock, Gap
+from rms_engine import CycleRmsEngine
+from spectral import HarmonicBlock
+from waveform_capture import poll_trigger_file
+
+
+class CurrentPipeline(object):
+    """
+    Acquisition loop of the current logger, one block per :py:meth:`step`.
+
+    Args:
+        hat: Scan source (``mcc118`` or a simulation), read through
+            ``scheduler``.
+        scheduler (ReadScheduler): Blocking reads sized to the backlog.
+        clock (SampleClock): Sample clock of the scan.
+        engine (BlockRmsEngine or CycleRmsEngine): RMS engine.
+        writer (BlockWriter): Started writer thread.
+        restart_scan (callable): Stops and restarts the scan after an
+            overrun; the new scan's sample 0 is taken when it returns.
+        capture (WaveformCapture): Raw waveform capture (None = off).
+        rms_trigger (float): Capture when the RMS rises above this many
+            amps (None = off).
+        trigger_file (str): Trigger file polled for external capture
+            requests (None = off).
+        trigger_poll_sec (float): Scan seconds between trigger file polls.
+        analyzer (HarmonicAnalyzer): Harmonic analysis (None = off).
+        bus (LiveRing): Live bus for every RMS window (None = off).
+        anchor_sec (float): Seconds between measurements of the live bus
+            clock offset.
+        mono_start (float): ``time.monotonic()`` at sample 0.
+    """
+
+    def __init__(self, hat, scheduler, clock, engine, writer, restart_scan,
+                 capture=None, rms_trigger=None, trigger_file=None,
+                 trigger_poll_sec=0.5, analyzer=None, bus=None, anchor_sec=10.0,
+                 mono_start=None):
+        self.hat = hat
+        self.scheduler = scheduler
+        self.clock = clock
+        self.engine = engine
+        self.writer = writer
+        self.restart_scan = restart_scan
+        self.capture = capture
+        self.rms_trigger = rms_trigger
+        self.trigger_file = trigger_file
+        self.trigger_poll_sec = trigger_poll_sec
+        self.analyzer = analyzer
+        self.bus = bus
+        self.anchor_sec = anchor_sec
+        # Reasons appended here (e.g. by a signal handler) trigger a capture
+        self.external_triggers = []
+        self.rms_armed = True
+        self.next_trigger_poll = 0.0
+
+        # Overruns stop the scan; it is restarted and the lost samples are
+        # written as gap records (see current_writer.Gap)
+        self.overruns = {"hardware_overrun": 0, "buffer_overrun": 0}
+        self.samples_read = 0    # samples per channel actually received
+        self.samples_lost = 0    # samples per channel skipped in gaps
+        self.submitted = True    # the last block reached the writer queue
+        self.pending_gaps = []
+        mono_start = time.monotonic() if mono_start is None else mono_start
+        # Scan position (sample index incl. the buffer backlog) at the last
+        # read without overrun; gaps are measured from there
+        self.last_position, self.last_time = 0, mono_start
+        # Live bus time = sample clock + bus_offset; the offset to the
+        # monotonic clock is measured again every anchor_sec (smallest value
+        # seen, i.e. the read with the least latency) so drift cannot build up
+        self.bus_offset = mono_start
+        self.bus_probe = np.inf
+        self.next_bus_anchor = mono_start + anchor_sec
+        self.bus_last_t = -np.inf
+
+    def step(self):
+        """
+        Read the next block (blocks until it is complete) and process it.
+
+        Returns:
+            str: ``"hardware_overrun"`` / ``"buffer_overrun"`` if the scan
+            was restarted, else None.
+        """
+        return self.process(self.scheduler.read(self.hat))
+
+    def process(self, read_result):
+        """Process one scan read; returns the overrun reason like :py:meth:`step`."""
+        overrun = read_result.hardware_overrun or read_result.buffer_overrun
+        channels = self.engine.channels
+        block_samples = len(read_result.data) // channels
+        self.samples_read += block_samples
+
+        # RMS, peak and min for every complete window and channel
+        rms, peak, minimum = self.engine.process(read_result.data)
+        starts = self._window_starts(len(rms))
+        t = self.clock.seconds(starts)
+        scan_time = float(self.clock.seconds(self.engine.samples_in))
+
+        if self.capture is not None:
+            self._capture(read_result.data, rms, starts, scan_time)
+        if self.bus is not None and len(rms):
+            self._publish(t, rms, peak, minimum)
+        harmonics = None
+        if self.analyzer is not None:
+            centers, fundamental, thd, levels = self.analyzer.process(read_result.data)
+            harmonics = HarmonicBlock(self.clock.seconds(centers), fundamental,
+                                      thd, levels)
+        self._submit(RmsBlock(t, rms, peak, minimum, scan_time, time.time(),
+                              harmonics, self.pending_gaps or None), block_samples)
+
+        if not overrun:
+            self._track_position()
+            return None
+        reason = "hardware_overrun" if read_result.hardware_overrun else "buffer_overrun"
+        self._restart(reason)
+        return reason
+
+    def _window_starts(self, count):
+        # Sample index of the first sample of every window (also right for
+        # the windows after a gap)
+        if isinstance(self.engine, CycleRmsEngine):
+            return self.engine.starts
+        window = self.engine.window
+        first = self.engine.samples_in - self.engine.carry_len - count * window
+        return first + window * np.arange(count)
+
+    def _capture(self, data, rms, starts, scan_time):
+        capture = self.capture
+        capture.feed(data)
+        if self.rms_trigger is not None and len(rms):
+            # Rising edge only: re-arm once RMS falls back below.
+            # The trigger is the first window over the threshold.
+            over = np.flatnonzero(rms.max(axis=1) > self.rms_trigger)
+            if len(over) and self.rms_armed:
+                capture.trigger("rms", int(starts[over[0]]))
+            self.rms_armed = not len(over)
+        if self.external_triggers:
+            capture.trigger(self.external_triggers.pop())
+        if self.trigger_file is not None and scan_time >= self.next_trigger_poll:
+            reason = poll_trigger_file(self.trigger_file)
+            if reason:
+                capture.trigger(reason)
+            self.next_trigger_poll = scan_time + self.trigger_poll_sec
+
+    def _publish(self, t, rms, peak, minimum):
+        records = np.empty(len(rms), dtype=self.bus.dtype)
+        records['t'] = t + self.bus_offset
+        # An offset step must not move t backwards
+        np.maximum(records['t'], self.bus_last_t, out=records['t'])
+        self.bus_last_t = records['t'][-1]
+        records['rms'] = rms.reshape(records['rms'].shape)
+        records['peak'] = peak.reshape(records['peak'].shape)
+        records['min'] = minimum.reshape(records['min'].shape)
+        self.bus.publish(records)
+
+    def _submit(self, block, block_samples):
+        self.submitted = self.writer.submit(block)
+        if self.submitted:
+            self.pending_gaps = []
+            return
+        print("\nWARNING: Writer queue full, block dropped!")
+        # The rows of this block are missing from the file
+        rate = self.clock.rate
+        start = float(self.clock.seconds(self.engine.samples_in - block_samples))
+        last = self.pending_gaps[-1] if self.pending_gaps else None
+        if last is not None and last.reason == "writer_queue_full":
+            self.pending_gaps[-1] = Gap(last.start, last.samples + block_samples,
+                                        last.duration + block_samples / rate,
+                                        last.reason)
+        else:
+            self.pending_gaps.append(Gap(start, block_samples, block_samples / rate,
+                                         "writer_queue_full"))
+
+    def _track_position(self):
+        self.last_position = self.engine.samples_in + self.scheduler.backlog
+        self.last_time = time.monotonic()
+        self.bus_probe = min(self.bus_probe,
+                             self.last_time - float(self.clock.seconds(self.last_position)))
+        if self.last_time >= self.next_bus_anchor:
+            self.bus_offset = self.bus_probe
+            self.bus_probe = np.inf
+            self.next_bus_anchor = self.last_time + self.anchor_sec
+
+    def _restart(self, reason):
+        rate = self.clock.rate
+        self.overruns[reason] += 1
+        # Samples read so far end the data before the gap
+        received = self.engine.samples_in
+        self.restart_scan()
+        # Sample index of the new scan's sample 0: the scan position at the
+        # last good read plus the time since then (only this short interval
+        # depends on the ADC vs. monotonic clock)
+        restart = self.last_position + int(round(
+            (time.monotonic() - self.last_time) * rate))
+        lost = restart - received
+        if lost < 0:
+            print(f"\nWARNING: Gap estimate {lost} samples is negative "
+                  f"(clock drift?), recorded as 0")
+            lost = 0
+        self.samples_lost += lost
+        self.last_position, self.last_time = received + lost, time.monotonic()
+        self.engine.reset(lost)
+        if self.analyzer is not None:
+            self.analyzer.reset(lost)
+        if self.capture is not None:
+            self.capture.skip(lost)
+        self.pending_gaps.append(Gap(float(self.clock.seconds(received)), lost,
+                                     lost / rate, reason))
+        print(f"\nWARNING: {reason.replace('_', ' ').capitalize()}! "
+              f"Scan restarted, {lost} samples "
+              f"({lost / rate * 1000:.1f} ms) lost")
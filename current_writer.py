@@ -0,0 +1,481 @@
+"""
+    Background writer stage for the MCC118 current logger.
+
+    The acquisition loop only reads scan blocks, runs the RMS engine and
+    pushes the resulting NumPy arrays onto a bounded queue. A dedicated
+    thread formats and writes the rows and rotates the output files, so a
+    stalled SD card never holds up ``a_in_scan_read``. If the queue is full
+    the block is dropped and counted rather than blocking the reader.
+
+    Samples lost in a scan overrun are marked in the output: a ``# gap``
+    comment line (CSV) or ``<file>.events`` line (binary) with start time,
+    duration and lost samples, and a ``<file>.stats.json`` sidecar with the
+    gap totals of each file. Wall-clock anchors are ``# anchor`` lines in
+    the same places. These lines are ``key=value`` fields after the ``#``,
+    not CSV rows, so the header still describes every row; merge_data.py
+    and data_index.py skip lines that start with ``#``::
+
+        # anchor time_s=10.000000 sample_clock=2026-01-12T10:00:10.000000 wall_clock=2026-01-12T10:00:10.012345 drift_s=0.012345
+        # gap time_s=12.500000 sample_clock=2026-01-12T10:00:12.500000 duration_s=0.250000 samples=2500 reason=hardware_overrun
+"""
+import csv
+import json
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+from binary_records import RecordWriter
+from data_index import FileSummary
+from spectral import harmonic_header
+
+# One engine result: t = sample-clock seconds since scan start (per window),
+# rms/peak/minimum = (windows, channels) arrays in amps,
+# scan_time / wall_time = sample clock and wall clock at the newest sample,
+# harmonics = optional spectral.HarmonicBlock of the same raw samples,
+# gaps = optional list of Gap that happened before this block
+RmsBlock = namedtuple(
+    'RmsBlock', ['t', 'rms', 'peak', 'minimum', 'scan_time', 'wall_time',
+                 'harmonics', 'gaps'], defaults=(None, None))
+
+# Samples lost between two scan blocks: start = sample-clock seconds since
+# scan start of the first lost sample, samples = lost samples per channel,
+# duration in seconds, reason = "hardware_overrun", "buffer_overrun" or
+# "writer_queue_full" (rows dropped because the writer fell behind)
+Gap = namedtuple('Gap', ['start', 'samples', 'duration', 'reason'])
+
+CSV_HEADER = ["Time (s)", "Timestamp", "RMS Current (A)",
+              "Peak Current (A)", "Min Current (A)"]
+
+# Binary record: absolute (epoch) time of the window + RMS/peak/min in amps
+RMS_DTYPE = np.dtype([('t', '<f8'), ('rms', '<f4'), ('peak', '<f4'),
+                      ('min', '<f4')])
+
+
+def csv_header(channels):
+    """CSV header for a channel list (the single-channel header is kept)."""
+    if len(channels) <= 1:
+        return list(CSV_HEADER)
+    header = CSV_HEADER[:2]
+    for ch in channels:
+        header += [f"CH{ch} {name}" for name in CSV_HEADER[2:]]
+    return header
+
+
+def rms_dtype(channel_count):
+    """Binary record type; multi-channel files hold one value per channel."""
+    if channel_count <= 1:
+        return RMS_DTYPE
+    shape = (channel_count,)
+    return np.dtype([('t', '<f8'), ('rms', '<f4', shape),
+                     ('peak', '<f4', shape), ('min', '<f4', shape)])
+
+
+def _comment_line(kind, **fields):
+    # "# <kind> key=value ..." (timestamps without spaces)
+    return "# %s %s\r\n" % (kind, " ".join(
+        "%s=%s" % (key, str(value).replace(" ", "T")) for key, value in fields.items()))
+
+
+def _anchor_line(clock, scan_time, wall_time, period_start):
+    # Anchor: sample clock vs. wall clock at the newest sample
+    return _comment_line(
+        "anchor",
+        time_s=f"{scan_time - period_start:.6f}",
+        sample_clock=clock.format(scan_time),
+        wall_clock=datetime.fromtimestamp(wall_time).strftime("%Y-%m-%d %H:%M:%S.%f"),
+        drift_s=f"{wall_time - clock.start_time - scan_time:.6f}")
+
+
+def _gap_line(clock, gap, period_start):
+    # Gap: start of the lost stretch, duration, lost samples, cause
+    return _comment_line(
+        "gap",
+        time_s=f"{gap.start - period_start:.6f}",
+        sample_clock=clock.format(gap.start),
+        duration_s=f"{gap.duration:.6f}",
+        samples=gap.samples,
+        reason=gap.reason)
+
+
+class GapStats(object):
+    """Overrun gaps of one output file, saved as ``<file>.stats.json``."""
+
+    def __init__(self, path, clock):
+        self.path = path + ".stats.json"
+        self.clock = clock
+        self.gaps = []
+
+    def add(self, gap):
+        self.gaps.append(gap)
+
+    def as_dict(self, rows):
+        samples = sum(gap.samples for gap in self.gaps)
+        return {
+            "file": os.path.basename(self.path[:-len(".stats.json")]),
+            "rows": rows,
+            "gaps": len(self.gaps),
+            "samples_lost": samples,
+            "seconds_lost": round(samples / self.clock.rate, 6),
+            "hardware_overruns": sum(g.reason == "hardware_overrun" for g in self.gaps),
+            "buffer_overruns": sum(g.reason == "buffer_overrun" for g in self.gaps),
+            "writer_drops": sum(g.reason == "writer_queue_full" for g in self.gaps),
+            "gap_list": [{"start": self.clock.start_time + float(gap.start),
+                          "timestamp": str(self.clock.format(gap.start)),
+                          "duration": round(gap.duration, 6),
+                          "samples": gap.samples,
+                          "reason": gap.reason} for gap in self.gaps],
+        }
+
+    def save(self, rows):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.as_dict(rows), f, indent=1)
+
+
+class HarmonicsCsv(object):
+    """
+    ``<file>.harmonics.csv`` next to an RMS file: one row per analysis
+    frame with the same Time (s) / Timestamp columns, then fundamental,
+    THD and harmonics 2..n of each channel.
+    """
+
+    def __init__(self, path, clock, channels, count):
+        self.path = path + ".harmonics.csv"
+        self.clock = clock
+        self.rows = 0
+        self._row_format = ("%.6f,%s," + ",".join(["%.6f"] * (count + 1) * len(channels))
+                            + "\r\n")
+        self._file = open(self.path, "w", newline="", encoding="utf-8")
+        csv.writer(self._file).writerow(harmonic_header(channels, count))
+
+    def write(self, harmonics, period_start):
+        stamps = self.clock.format(harmonics.t)
+        t_rel = harmonics.t - period_start
+        # fundamental, THD, H2..Hn of each channel side by side
+        values = np.concatenate((harmonics.fundamental[:, :, None],
+                                 harmonics.thd[:, :, None],
+                                 harmonics.harmonics[:, :, 1:]), axis=2)
+        values = values.reshape(values.shape[0], -1)
+        fmt = self._row_format
+        self._file.write("".join(
+            fmt % (t, ts, *row)
+            for t, ts, row in zip(t_rel.tolist(), stamps.tolist(),
+                                  values.tolist())
+        ))
+        self.rows += values.shape[0]
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+class CsvRmsSink(object):
+    """Text CSV output, one row per RMS window (RMS/peak/min per channel)."""
+
+    extension = '.csv'
+
+    def __init__(self, path, clock, meta=None):
+        self.path = path
+        self.clock = clock
+        self.rows = 0
+        channels = (meta or {}).get('channels', [None])
+        self.summary = FileSummary(path, 'current', csv_header(channels)[2:])
+        self._row_format = ("%.6f,%s," + ",".join(["%.6f"] * 3 * len(channels))
+                            + "\r\n")
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(csv_header(channels))
+        self._channels = channels
+        self._harmonics = None
+
+    def write_block(self, block, period_start):
+        stamps = self.clock.format(block.t)
+        t_rel = block.t - period_start
+        # rms, peak, min of each channel side by side
+        values = np.stack((block.rms, block.peak, block.minimum), axis=2)
+        values = values.reshape(values.shape[0], -1)
+        fmt = self._row_format
+        # tell() flushes the text buffer, so only at index marks
+        offset = self._file.tell() if self.summary.wants_mark() else None
+        self._file.write("".join(
+            fmt % (t, ts, *row)
+            for t, ts, row in zip(t_rel.tolist(), stamps.tolist(),
+                                  values.tolist())
+        ))
+        self.rows += values.shape[0]
+        self.summary.add(block.t[0] + self.clock.start_time,
+                         block.t[-1] + self.clock.start_time,
+                         values.shape[0], block.rms, offset)
+
+    def write_anchor(self, scan_time, wall_time, period_start):
+        self._file.write(
+            _anchor_line(self.clock, scan_time, wall_time, period_start))
+
+    def write_gap(self, gap, period_start):
+        self._file.write(_gap_line(self.clock, gap, period_start))
+
+    def write_harmonics(self, harmonics, period_start):
+        if self._harmonics is None:
+            self._harmonics = HarmonicsCsv(self.path, self.clock, self._channels,
+                                           harmonics.harmonics.shape[2])
+        self._harmonics.write(harmonics, period_start)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        if self._harmonics is not None:
+            self._harmonics.close()
+
+
+class BinaryRmsSink(object):
+    """
+    Fixed-width binary output (:py:data:`RMS_DTYPE` records, 20 bytes per
+    window for one channel, see :py:func:`rms_dtype`) in a :py:mod:`binary_records` file. Anchor and gap lines go to a
+    small ``<file>.events`` text file next to it. Read back with
+    :py:func:`binary_records.read_records`.
+    """
+
+    extension = '.bin'
+
+    def __init__(self, path, clock, meta=None):
+        self.path = path
+        self.clock = clock
+        meta = dict(meta or {})
+        meta['scan_start'] = clock.start_time
+        meta['sample_rate'] = clock.rate
+        self._dtype = rms_dtype(len(meta.get('channels', [None])))
+        self.summary = FileSummary(
+            path, 'current', csv_header(meta.get('channels', [None]))[2:])
+        self._records = RecordWriter(path, self._dtype, meta)
+        self._events = None
+        self._channels = meta.get('channels', [None])
+        self._harmonics = None
+
+    @property
+    def rows(self):
+        return self._records.records
+
+    def write_block(self, block, period_start):
+        records = np.empty(block.rms.shape[0], dtype=self._dtype)
+        records['t'] = block.t
+        records['t'] += self.clock.start_time
+        shape = records['rms'].shape
+        records['rms'] = block.rms.reshape(shape)
+        records['peak'] = block.peak.reshape(shape)
+        records['min'] = block.minimum.reshape(shape)
+        self._records.append(records)
+        self.summary.add(records['t'][0], records['t'][-1], len(records),
+                         block.rms)
+
+    def _event(self, line):
+        if self._events is None:
+            self._events = open(self.path + ".events", "w", newline="",
+                                encoding="utf-8")
+        self._events.write(line)
+
+    def write_anchor(self, scan_time, wall_time, period_start):
+        self._event(_anchor_line(self.clock, scan_time, wall_time, period_start))
+
+    def write_gap(self, gap, period_start):
+        self._event(_gap_line(self.clock, gap, period_start))
+
+    def write_harmonics(self, harmonics, period_start):
+        if self._harmonics is None:
+            self._harmonics = HarmonicsCsv(self.path, self.clock, self._channels,
+                                           harmonics.harmonics.shape[2])
+        self._harmonics.write(harmonics, period_start)
+
+    def close(self):
+        self._records.close()
+        if self._events is not None and not self._events.closed:
+            self._events.close()
+        if self._harmonics is not None:
+            self._harmonics.close()
+
+
+class BlockWriter(threading.Thread):
+    """
+    Writer thread fed by a bounded queue of :py:class:`RmsBlock` items.
+
+    Args:
+        filename_fn (callable): ``filename_fn(epoch, extension)`` returns the
+            path of a new output file.
+        clock (SampleClock): Sample clock of the running scan.
+        period_sec (float): Rotate to a new file every n seconds of scan time.
+        anchor_sec (float): Write a wall-clock anchor row every n seconds.
+        sink_cls (type): Output format (:py:class:`CsvRmsSink` or
+            :py:class:`BinaryRmsSink`).
+        meta (dict): Acquisition settings stored in binary file headers.
+        maxsize (int): Maximum number of blocks waiting in the queue.
+        index (DataIndex): Catalog that gets an entry for every closed file
+            (None = no index).
+        rollups (RollupWriter): 1 s / 1 min / 1 h aggregates updated with
+            every block (None = off).
+    """
+
+    def __init__(self, filename_fn, clock, period_sec, anchor_sec,
+                 sink_cls=CsvRmsSink, meta=None, maxsize=512, index=None,
+                 rollups=None):
+        super(BlockWriter, self).__init__(name="current-writer", daemon=True)
+        self.filename_fn = filename_fn
+        self.clock = clock
+        self.period_sec = period_sec
+        self.anchor_sec = anchor_sec
+        self.sink_cls = sink_cls
+        self.meta = meta
+        self.index = index
+        self.rollups = rollups
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._stats_lock = threading.Lock()
+        self.sink = None
+        self.gap_stats = None
+        self.period_start = 0.0
+        self.next_anchor = 0.0
+
+        # Counters
+        self.blocks_queued = 0
+        self.blocks_written = 0
+        self.blocks_dropped = 0
+        self.max_queue_depth = 0
+        self.max_wait = 0.0
+        self.max_submit = 0.0
+        self.errors = 0
+        self.last_write = None  # wall time of the last successful write
+
+    def submit(self, block):
+        # type: (RmsBlock) -> bool
+        """
+        Hand a block to the writer without ever blocking the caller.
+
+        Returns:
+            bool: False if the queue was full and the block was dropped.
+        """
+        start = time.perf_counter()
+        try:
+            self._queue.put_nowait((time.perf_counter(), block))
+            queued = True
+        except queue.Full:
+            queued = False
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            if queued:
+                self.blocks_queued += 1
+                depth = self._queue.qsize()
+                if depth > self.max_queue_depth:
+                    self.max_queue_depth = depth
+            else:
+                self.blocks_dropped += 1
+            if elapsed > self.max_submit:
+                self.max_submit = elapsed
+        return queued
+
+    def stats(self, reset_max=False):
+        """
+        Snapshot of the writer counters.
+
+        Args:
+            reset_max (bool): Reset the max_* counters after reading them.
+
+        Returns:
+            dict: queue_depth, max_queue_depth, max_wait_s, max_submit_s,
+            blocks_queued, blocks_written, blocks_dropped, errors,
+            last_write.
+        """
+        with self._stats_lock:
+            snapshot = {
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self.max_queue_depth,
+                'max_wait_s': self.max_wait,
+                'max_submit_s': self.max_submit,
+                'blocks_queued': self.blocks_queued,
+                'blocks_written': self.blocks_written,
+                'blocks_dropped': self.blocks_dropped,
+                'errors': self.errors,
+                'last_write': self.last_write,
+            }
+            if reset_max:
+                self.max_queue_depth = 0
+                self.max_wait = 0.0
+                self.max_submit = 0.0
+        return snapshot
+
+    def stop(self, timeout=None):
+        """Write everything still queued, close the file and end the thread."""
+        self._queue.put((time.perf_counter(), None))
+        self.join(timeout)
+
+    def _open(self, scan_time):
+        self.period_start = scan_time
+        self.next_anchor = scan_time
+        path = self.filename_fn(float(self.clock.start_time + scan_time),
+                                self.sink_cls.extension)
+        self.sink = self.sink_cls(path, self.clock, self.meta)
+        self.gap_stats = GapStats(path, self.clock)
+
+    def _rotate(self, scan_time):
+        stats = self.stats(reset_max=True)
+        print(f"[KSF] Saved {self.sink.rows} RMS values. Rotating file... "
+              f"(queue max {stats['max_queue_depth']}, "
+              f"max wait {stats['max_wait_s'] * 1000:.1f} ms, "
+              f"dropped {stats['blocks_dropped']}, "
+              f"gaps {len(self.gap_stats.gaps)})")
+        self._close_sink()
+        self._open(scan_time)
+
+    def _close_sink(self):
+        self.sink.close()
+        try:
+            self.gap_stats.save(self.sink.rows)
+        except OSError as error:
+            print(f"\n[KSF] Stats file failed: {error}")
+        if self.index is not None:
+            try:
+                self.index.add(self.sink.summary)
+            except Exception as error:  # the data file itself is complete
+                print(f"\n[KSF] Index update failed: {error}")
+
+    def _write(self, block):
+        if self.sink is None:
+            self._open(float(block.t[0]) if block.t.size else block.scan_time)
+        # Gaps end the previous data, so they go to the file before rotating
+        for gap in block.gaps or ():
+            self.sink.write_gap(gap, self.period_start)
+            self.gap_stats.add(gap)
+        if block.scan_time - self.period_start >= self.period_sec:
+            self._rotate(float(block.t[0]) if block.t.size else block.scan_time)
+        if block.t.size:
+            self.sink.write_block(block, self.period_start)
+            if self.rollups is not None:
+                self.rollups.add(block.t + self.clock.start_time, block.rms,
+                                 block.peak, block.minimum)
+        if block.harmonics is not None and block.harmonics.t.size:
+            self.sink.write_harmonics(block.harmonics, self.period_start)
+        if block.scan_time >= self.next_anchor:
+            self.sink.write_anchor(block.scan_time, block.wall_time,
+                                   self.period_start)
+            self.next_anchor = block.scan_time + self.anchor_sec
+
+    def run(self):
+        while True:
+            enqueued, block = self._queue.get()
+            if block is None:
+                break
+            wait = time.perf_counter() - enqueued
+            try:
+                self._write(block)
+                self.last_write = time.time()
+            except Exception as error:  # keep the writer alive on I/O errors
+                self.errors += 1
+                print(f"\n[KSF] Writer error: {error}")
+            with self._stats_lock:
+                self.blocks_written += 1
+                if wait > self.max_wait:
+                    self.max_wait = wait
+        if self.sink is not None:
+            self._close_sink()
+        if self.rollups is not None:
+            self.rollups.close()
@@ -2,7 +2,12 @@
     This file contains helper functions for the MCC DAQ HAT Python examples.
 """
 from __future__ import print_function
-from daqhats import hat_list, HatError
+from sim_mcc118 import simulate_enabled
+
+if simulate_enabled():
+    from sim_mcc118 import hat_list, HatError
+else:
+    from daqhats import hat_list, HatError
 
 
 def select_hat_device(filter_by_id):
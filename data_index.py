@@ -0,0 +1,330 @@
+"""
+Time-range index over the rotated data files
+فهرست زمانی فایل‌های داده (SQLite)
+
+The loggers add one row per data file when they close it: absolute start
+and end time, row count, size, columns, min/max/mean RMS (current files)
+and, for CSV files, the byte offset of a row every ``INDEX_EVERY`` rows.
+A time-range query then opens only the files that overlap the range and
+seeks close to the first row instead of scanning the folders.
+
+Tables::
+
+    files(path, source, format, start, end, rows, bytes, columns,
+          rms_min, rms_max, rms_mean, indexed_at)
+    marks(path, row, offset, t)     -- CSV only, t = time of that row
+
+Command line:
+    python data_index.py rebuild                  # index existing files
+    python data_index.py query "2026-01-12 10:03" "2026-01-12 10:07"
+    python data_index.py extract "2026-01-12 10:03" "2026-01-12 10:07" -o out.csv
+"""
+import argparse
+import contextlib
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+from binary_records import data_exists, open_data
+
+DEFAULT_INDEX = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "data_index.sqlite")
+
+# Byte offset kept every N rows of a CSV file
+INDEX_EVERY = 10000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    format TEXT NOT NULL,
+    start REAL,
+    end REAL,
+    rows INTEGER,
+    bytes INTEGER,
+    columns TEXT,
+    rms_min REAL,
+    rms_max REAL,
+    rms_mean REAL,
+    indexed_at REAL
+);
+CREATE INDEX IF NOT EXISTS files_time ON files (source, start, end);
+CREATE TABLE IF NOT EXISTS marks (
+    path TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    t REAL NOT NULL,
+    PRIMARY KEY (path, row)
+);
+"""
+
+
+class FileSummary(object):
+    """
+    Statistics of one data file, collected while it is written.
+
+    Args:
+        path (str): Data file.
+        source (str): ``"current"`` or ``"opc"``.
+        columns (list): Value column names.
+        every (int): Keep a byte offset every n rows (CSV files).
+    """
+
+    def __init__(self, path, source, columns=None, every=INDEX_EVERY):
+        self.path = os.path.abspath(path)
+        self.source = source
+        self.format = 'bin' if path.endswith('.bin') else 'csv'
+        self.columns = list(columns or [])
+        self.every = every
+        self.start = None
+        self.end = None
+        self.rows = 0
+        self.rms_min = None
+        self.rms_max = None
+        self._rms_sum = 0.0
+        self._rms_count = 0
+        self.marks = []
+        self._next_mark = 0
+
+    def wants_mark(self):
+        """bool: The next rows should get a byte offset (call before writing)."""
+        return self.format == 'csv' and self.rows >= self._next_mark
+
+    def add(self, t_first, t_last, count, rms=None, offset=None):
+        """
+        Account for ``count`` rows written from ``t_first`` to ``t_last``.
+
+        Args:
+            rms (numpy.ndarray): RMS values of these rows (current files).
+            offset (int): Byte offset of the first of these rows.
+        """
+        if count <= 0:
+            return
+        if offset is not None:
+            self.marks.append((self.rows, int(offset), float(t_first)))
+            self._next_mark = self.rows + self.every
+        if self.start is None:
+            self.start = float(t_first)
+        self.end = float(t_last)
+        self.rows += count
+        if rms is not None and np.size(rms):
+            low, high = float(np.min(rms)), float(np.max(rms))
+            self.rms_min = low if self.rms_min is None else min(self.rms_min, low)
+            self.rms_max = high if self.rms_max is None else max(self.rms_max, high)
+            self._rms_sum += float(np.sum(rms))
+            self._rms_count += int(np.size(rms))
+
+    @property
+    def rms_mean(self):
+        return self._rms_sum / self._rms_count if self._rms_count else None
+
+
+class DataIndex(object):
+    """
+    SQLite catalog of data files. A short-lived connection is opened per
+    call, so one index can be shared by both loggers and their threads.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX):
+        self.path = path
+        with self._connect() as db:
+            db.executescript(_SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # WAL: readers never block the loggers adding files
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def add(self, summary):
+        """Store (or replace) the entry of a closed file."""
+        if summary.rows == 0:
+            return
+        size = os.path.getsize(summary.path) if os.path.exists(summary.path) else None
+        with self._connect() as db:
+            db.execute("DELETE FROM marks WHERE path = ?", (summary.path,))
+            db.execute(
+                "INSERT OR REPLACE INTO files VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
+                (summary.path, summary.source, summary.format, summary.start,
+                 summary.end, summary.rows, size, json.dumps(summary.columns),
+                 summary.rms_min, summary.rms_max, summary.rms_mean, time.time()))
+            db.executemany("INSERT INTO marks VALUES (?,?,?,?)",
+                           [(summary.path, row, offset, t)
+                            for row, offset, t in summary.marks])
+
+    def remove(self, path):
+        with self._connect() as db:
+            db.execute("DELETE FROM marks WHERE path = ?", (os.path.abspath(path),))
+            db.execute("DELETE FROM files WHERE path = ?", (os.path.abspath(path),))
+
+    def relocate(self, path, new_path):
+        """
+        Point the entry of a file at its new location (e.g. an archive
+        member). A CSV file moved to a ``.bin`` member (converted by
+        compact_data.py) loses its row offsets.
+        """
+        path = os.path.abspath(path)
+        new_format = 'bin' if new_path.endswith('.bin') else 'csv'
+        with self._connect() as db:
+            if new_format == 'bin':
+                db.execute("DELETE FROM marks WHERE path = ?", (path,))
+            db.execute("UPDATE marks SET path = ? WHERE path = ?", (new_path, path))
+            db.execute("UPDATE files SET path = ?, format = ? WHERE path = ?",
+                       (new_path, new_format, path))
+
+    def files(self, source, start, end):
+        """
+        Files of a source overlapping [start, end], in time order.
+
+        Returns:
+            list: One dict per file (the ``files`` columns).
+        """
+        with self._connect() as db:
+            db.row_factory = sqlite3.Row
+            rows = db.execute(
+                "SELECT * FROM files WHERE source = ? AND start <= ? AND end >= ? "
+                "ORDER BY start", (source, end, start)).fetchall()
+        return [dict(row) for row in rows]
+
+    def seek_offset(self, path, t):
+        """Byte offset of the last marked row at or before ``t`` (0 = start)."""
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT offset FROM marks WHERE path = ? AND t <= ? "
+                "ORDER BY row DESC LIMIT 1", (os.path.abspath(path), t)).fetchone()
+        return row[0] if row else 0
+
+    def known(self):
+        with self._connect() as db:
+            return {row[0] for row in db.execute("SELECT path FROM files")}
+
+
+def read_range(index, source, start, end, chunk_rows=None):
+    """
+    Chunks (:py:class:`merge_data.Chunk`) of one source for a time range,
+    reading only the indexed files that overlap it and seeking to the
+    nearest marked row.
+    """
+    import merge_data
+    reader = merge_data.read_current if source == 'current' else merge_data.read_opc
+    for entry in index.files(source, start, end):
+        if not data_exists(entry['path']):
+            print(f"WARNING: {entry['path']} is in the index but missing")
+            continue
+        offset = index.seek_offset(entry['path'], start) if entry['format'] == 'csv' else 0
+        for chunk in reader(entry['path'], chunk_rows or merge_data.CHUNK_ROWS,
+                            offset=offset):
+            if chunk.t[0] > end:
+                break
+            keep = (chunk.t >= start) & (chunk.t <= end)
+            if keep.any():
+                yield merge_data.Chunk(chunk.t[keep], chunk.values[keep], chunk.columns)
+
+
+def summarize(path, source, every=INDEX_EVERY):
+    """Build the :py:class:`FileSummary` of an existing file (for rebuild)."""
+    import merge_data
+    reader = merge_data.read_current if source == 'current' else merge_data.read_opc
+    summary = None
+    offsets = _line_offsets(path, every) if path.endswith('.csv') else []
+    for chunk in reader(path):
+        if summary is None:
+            summary = FileSummary(path, source, chunk.columns, every)
+        rms = chunk.values[:, 0::3] if source == 'current' else None
+        summary.add(chunk.t[0], chunk.t[-1], len(chunk.t), rms)
+    if summary is not None and offsets:
+        # Time of each marked row: read it back from the file
+        for row, offset in offsets:
+            for chunk in reader(path, 1, offset=offset):
+                summary.marks.append((row, offset, float(chunk.t[0])))
+                break
+    return summary
+
+
+def _line_offsets(path, every):
+    # Byte offsets of every n-th data row (comment rows are not counted)
+    out = []
+    row = 0
+    with open_data(path) as f:
+        f.readline()
+        offset = f.tell()
+        for line in f:
+            if not line.startswith(b'#'):
+                if row % every == 0:
+                    out.append((row, offset))
+                row += 1
+            offset += len(line)
+    return out
+
+
+def rebuild(index, current_folder, opc_folder):
+    """Index the data files that are not in the catalog yet."""
+    import merge_data
+    known = index.known()
+    added = 0
+    for folder, source in ((current_folder, 'current'), (opc_folder, 'opc')):
+        if source == 'current':
+            paths = merge_data.current_files(folder, 0.0, float('inf'))
+        else:
+            from opc_status import select_files
+            paths = select_files(folder, 0.0, float('inf'))
+        for path in paths:
+            if os.path.abspath(path) in known:
+                continue
+            summary = summarize(path, source)
+            if summary is not None:
+                index.add(summary)
+                added += 1
+    return added
+
+
+def main():
+    import merge_data
+    from opc_status import parse_timestamp
+    parser = argparse.ArgumentParser(description="Time-range index of the data files")
+    parser.add_argument("--index", default=DEFAULT_INDEX)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("rebuild", help="index files that are not indexed yet")
+    p.add_argument("--current-folder", default=merge_data.CURRENT_FOLDER)
+    p.add_argument("--opc-folder", default=merge_data.OPC_FOLDER)
+    for name in ("query", "extract"):
+        p = sub.add_parser(name)
+        p.add_argument("start")
+        p.add_argument("end")
+        if name == "extract":
+            p.add_argument("-o", "--output", required=True)
+            p.add_argument("--tolerance", type=float, default=5.0)
+    args = parser.parse_args()
+
+    index = DataIndex(args.index)
+    if args.command == "rebuild":
+        print(f"{rebuild(index, args.current_folder, args.opc_folder)} file(s) indexed")
+        return
+    start, end = parse_timestamp(args.start), parse_timestamp(args.end)
+    if args.command == "query":
+        for source in ("current", "opc"):
+            for entry in index.files(source, start, end):
+                print(f"{source:8s} {entry['path']}  rows {entry['rows']}  "
+                      f"rms {entry['rms_min']}..{entry['rms_max']}")
+        return
+    # OPC samples up to one tolerance before the range still apply to it
+    chunks = merge_data.resample(read_range(index, 'current', start, end),
+                                 read_range(index, 'opc', start - args.tolerance, end),
+                                 args.tolerance)
+    if args.output.endswith('.bin'):
+        rows = merge_data.write_binary(args.output, chunks, {"mode": "resample"})
+    else:
+        rows = merge_data.write_csv(args.output, chunks)
+    print(f"{rows} rows written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
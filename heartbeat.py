@@ -0,0 +1,95 @@
+"""
+Heartbeats from the loggers to the launcher (start.py)
+ارسال وضعیت هر process به launcher
+
+The launcher passes a localhost UDP address in ``KSF_HEARTBEAT_ADDR`` and a
+process key in ``KSF_CHILD_KEY``. A logger calls :py:meth:`Heartbeat.beat`
+from its main loop; at most one JSON datagram per ``interval`` is sent, e.g.::
+
+    {"key": "opc_logger", "pid": 1234, "time": 1768212345.1,
+     "samples_per_sec": 1.0, "queue_depth": 3, "last_write": 1768212344.0}
+
+Without the environment variables (logger started on its own) every call
+is a no-op. Sending never blocks and errors are ignored.
+"""
+import json
+import os
+import socket
+import time
+
+HEARTBEAT_ENV = "KSF_HEARTBEAT_ADDR"
+CHILD_KEY_ENV = "KSF_CHILD_KEY"
+HEARTBEAT_INTERVAL = 1.0
+
+
+class Heartbeat(object):
+    """
+    Rate-limited UDP heartbeat sender.
+
+    Args:
+        address (str): ``host:port`` of the launcher, or None to disable.
+        key (str): Process name reported to the launcher.
+        interval (float): Minimum seconds between two datagrams.
+    """
+
+    def __init__(self, address=None, key=None, interval=HEARTBEAT_INTERVAL):
+        self.key = key or "child"
+        self.interval = interval
+        self.next_beat = 0.0
+        self._last_count = None
+        self._last_time = None
+        self._socket = None
+        if address:
+            host, port = address.rsplit(":", 1)
+            self._address = (host, int(port))
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._socket.setblocking(False)
+
+    @classmethod
+    def from_env(cls, interval=HEARTBEAT_INTERVAL):
+        return cls(os.environ.get(HEARTBEAT_ENV), os.environ.get(CHILD_KEY_ENV),
+                   interval)
+
+    @property
+    def enabled(self):
+        return self._socket is not None
+
+    def due(self):
+        """bool: A heartbeat would be sent now (checks nothing else)."""
+        return self._socket is not None and time.monotonic() >= self.next_beat
+
+    def beat(self, samples=None, **fields):
+        """
+        Send a heartbeat if ``interval`` has passed.
+
+        Args:
+            samples (int): Total samples processed so far; the rate since the
+                previous heartbeat is sent as ``samples_per_sec``.
+            **fields: Other JSON-serializable values (queue_depth,
+                last_write, ...).
+
+        Returns:
+            bool: True if a datagram was sent.
+        """
+        if not self.due():
+            return False
+        now = time.monotonic()
+        self.next_beat = now + self.interval
+        message = {"key": self.key, "pid": os.getpid(), "time": time.time()}
+        if samples is not None:
+            if self._last_count is not None and now > self._last_time:
+                message["samples_per_sec"] = round(
+                    (samples - self._last_count) / (now - self._last_time), 3)
+            message["samples"] = samples
+            self._last_count, self._last_time = samples, now
+        message.update(fields)
+        try:
+            self._socket.sendto(json.dumps(message).encode("utf-8"), self._address)
+        except OSError:
+            return False
+        return True
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
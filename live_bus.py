@@ -0,0 +1,244 @@
+"""
+Shared-memory live data bus between the loggers
+انتقال زنده‌ی داده بین current_logger و opc_logger از طریق shared memory
+
+Each logger owns one ring of fixed-width records in a
+``multiprocessing.shared_memory`` block and publishes its newest samples
+into it; any number of readers attach by name. Every record starts with
+``t``, a ``time.monotonic()`` timestamp. The monotonic clock is shared by
+all processes on the machine, so the records of both rings can be aligned
+directly. The OPC logger stamps each sample with ``time.monotonic()`` when
+it is read. The current logger derives ``t`` from the sample clock (exact
+spacing) plus an offset to the monotonic clock that it measures again
+every ANCHOR_SEC, so the ADC clock drift does not build up between the
+two rings; the offset can step by a few milliseconds at most.
+
+Block layout::
+
+    0   uint64   number of records ever written (the only field that
+                 changes after creation)
+    8   uint64   ring capacity in records
+    64  ...      binary_records header (JSON metadata with the dtype)
+    ...          capacity records
+
+There is a single writer per ring. It copies at most ``reserve =
+capacity // RESERVE_DIV`` records into their slots and then advances the
+counter, so it only ever overwrites the oldest ``reserve`` slots. Readers
+only trust records that the writer cannot be overwriting: the newest
+``capacity - reserve`` records, checked again after the copy.
+
+Rings:
+    ksf_current  t, rms, peak, min per channel (one record per RMS window)
+    ksf_opc      t, one float64 per OPC column (NaN for non-numeric cells)
+"""
+import time
+
+import numpy as np
+
+from binary_records import encode_header, decode_header, record_dtype, \
+    _dtype_to_json
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+CURRENT_BUS = "ksf_current"
+OPC_BUS = "ksf_opc"
+
+_CONTROL = 64
+_ALIGN = 64
+# Readers skip the oldest 1/RESERVE_DIV of the ring (the writer may be
+# overwriting it)
+RESERVE_DIV = 4
+
+
+def _open_block(name, create, size=0):
+    if shared_memory is None:
+        raise RuntimeError('Error: multiprocessing.shared_memory needs Python 3.8+')
+    if not create:
+        try:
+            return shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:  # Python < 3.13 has no track argument
+            block = shared_memory.SharedMemory(name=name)
+            try:
+                # Only the owner may unlink the block when it exits
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(block._name, "shared_memory")
+            except Exception:
+                pass
+            return block
+    try:
+        return shared_memory.SharedMemory(name=name, create=True, size=size)
+    except FileExistsError:
+        # Left behind by a logger that was killed - replace it
+        stale = shared_memory.SharedMemory(name=name)
+        stale.close()
+        stale.unlink()
+        return shared_memory.SharedMemory(name=name, create=True, size=size)
+
+
+class LiveRing(object):
+    """
+    Ring of structured records in shared memory.
+
+    Use :py:meth:`create` in the publishing logger and :py:meth:`attach` in
+    readers.
+    """
+
+    def __init__(self, block, owner):
+        self._block = block
+        self.owner = owner
+        self.name = block.name
+        control = np.ndarray((2,), dtype='<u8', buffer=block.buf)
+        self._count = control[0:1]
+        self.capacity = int(control[1])
+        self.meta, size = decode_header(block.buf[_CONTROL:])
+        self.dtype = record_dtype(self.meta)
+        offset = _CONTROL + size
+        offset += (-offset) % _ALIGN
+        self._records = np.ndarray((self.capacity,), dtype=self.dtype,
+                                   buffer=block.buf, offset=offset)
+        self.reserve = max(1, self.capacity // RESERVE_DIV)
+
+    @classmethod
+    def create(cls, name, dtype, capacity, meta=None):
+        """
+        Create (or replace) the ring and become its only writer.
+
+        Args:
+            name (str): Shared memory name (e.g. :py:data:`CURRENT_BUS`).
+            dtype (numpy.dtype): Record type; the first field must be ``t``.
+            capacity (int): Number of records kept.
+            meta (dict): Extra metadata for readers (channels, columns...).
+        """
+        dtype = np.dtype(dtype)
+        if dtype.names[0] != 't':
+            raise ValueError("Error: first record field must be 't'")
+        meta = dict(meta or {})
+        meta['dtype'] = _dtype_to_json(dtype)
+        header = encode_header(meta)
+        offset = _CONTROL + len(header)
+        offset += (-offset) % _ALIGN
+        block = _open_block(name, True, offset + capacity * dtype.itemsize)
+        control = np.ndarray((2,), dtype='<u8', buffer=block.buf)
+        control[0] = 0
+        control[1] = capacity
+        block.buf[_CONTROL:_CONTROL + len(header)] = header
+        return cls(block, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """Open an existing ring for reading."""
+        return cls(_open_block(name, False), owner=False)
+
+    @property
+    def count(self):
+        """int: Number of records written since the ring was created."""
+        return int(self._count[0])
+
+    def publish(self, records):
+        """
+        Append records (writer only). Never blocks; the oldest records are
+        overwritten. More than ``reserve`` records are written in steps of
+        ``reserve``, each followed by the counter update.
+        """
+        records = np.asarray(records, dtype=self.dtype).ravel()
+        for i in range(0, records.size, self.reserve):
+            part = records[i:i + self.reserve]
+            n = part.size
+            count = self.count
+            pos = count % self.capacity
+            first = min(n, self.capacity - pos)
+            self._records[pos:pos + first] = part[:first]
+            if first < n:
+                self._records[:n - first] = part[first:]
+            # Records first, counter last: readers never see unwritten slots
+            self._count[0] = count + n
+
+    def read_since(self, start):
+        """
+        Copy the records written after record number ``start``.
+
+        Args:
+            start (int): A ``count`` returned by an earlier call (0 at first).
+
+        Returns:
+            tuple: ``(records, count, lost)``: the new records in order, the
+            count to pass next time and the number of records that were
+            overwritten before they could be read.
+        """
+        end = self.count
+        oldest = max(0, end - (self.capacity - self.reserve))
+        first = max(start, oldest)
+        records = self._copy(first, end)
+        # Drop records the writer overwrote while we were copying
+        safe = max(0, self.count - (self.capacity - self.reserve))
+        if safe > first:
+            records = records[min(safe - first, len(records)):]
+            first = safe
+        return records, end, first - start if start < first else 0
+
+    def latest(self, n=1):
+        """Copy of the newest ``n`` records (fewer if not available)."""
+        end = self.count
+        records, _, _ = self.read_since(max(0, end - n))
+        return records
+
+    def since_time(self, t):
+        """Copy of the records with ``t`` (monotonic) at or after ``t``."""
+        records = self.latest(self.capacity)
+        return records[np.searchsorted(records['t'], t):]
+
+    def _copy(self, start, end):
+        out = np.empty(end - start, dtype=self.dtype)
+        pos, n = start % self.capacity, end - start
+        first = min(n, self.capacity - pos)
+        out[:first] = self._records[pos:pos + first]
+        out[first:] = self._records[:n - first]
+        return out
+
+    def close(self):
+        """Detach; the writer also removes the shared memory block."""
+        if self._block is None:
+            return
+        self._records = None
+        self._count = None
+        self._block.close()
+        if self.owner:
+            try:
+                self._block.unlink()
+            except FileNotFoundError:
+                pass
+        self._block = None
+
+
+def current_dtype(channels):
+    """Record type of the current ring: t + rms/peak/min per channel."""
+    shape = (channels,) if channels > 1 else ()
+    return np.dtype([('t', '<f8'), ('rms', '<f4', shape),
+                     ('peak', '<f4', shape), ('min', '<f4', shape)])
+
+
+def opc_dtype(columns):
+    """Record type of the OPC ring: t + one float64 per column."""
+    return np.dtype([('t', '<f8')] + [(name, '<f8') for name in columns])
+
+
+def snapshot(seconds, current=CURRENT_BUS, opc=OPC_BUS):
+    """
+    Time-aligned view of the last ``seconds`` of both loggers.
+
+    Returns:
+        tuple: ``(current_records, opc_records, now)``; ``t`` of both is
+        ``time.monotonic()`` of the publishing process, comparable with
+        ``now``.
+    """
+    rings = [LiveRing.attach(current), LiveRing.attach(opc)]
+    try:
+        now = time.monotonic()
+        return (rings[0].since_time(now - seconds),
+                rings[1].since_time(now - seconds), now)
+    finally:
+        for ring in rings:
+            ring.close()
@@ -0,0 +1,431 @@
+"""
+Time-align and merge current_data and opc data files
+ادغام فایل‌های جریان (RMS) و OPC UA بر اساس زمان
+
+Both file sets are read file by file in time order, in chunks, so memory
+stays bounded however many files there are. Two modes:
+
+resample (default)
+    One output row per RMS window. The OPC values are the latest sample at
+    or before the window (at most ``--tolerance`` seconds old, otherwise
+    empty).
+downsample
+    One output row per OPC sample. The RMS values between this sample and
+    the next one are reduced with ``--stats`` (mean, max, min, pNN) and a
+    sample count.
+
+Supported inputs are currentdata_*.csv / .bin (current_logger) and
+opc_data_*.csv / .bin (opc_logger, including ``.status.csv`` change
+records), in the folders or in their daily archives (compact_data.py). Non-numeric OPC cells become empty. The ``# anchor`` / ``# gap``
+comment lines of the current CSV files (current_writer.py) are skipped;
+a gap is simply a stretch without rows. The output is CSV, or a
+binary_records file when the output name ends in ``.bin``.
+
+Examples:
+    python merge_data.py -o shift.csv --start "2026-01-12 06:00" --end "2026-01-12 14:00"
+    python merge_data.py -o shift_1s.bin --mode downsample --stats mean,max,p95
+"""
+import argparse
+import csv
+import itertools
+import os
+import re
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+from binary_records import RecordWriter, read_records, data_files, open_data, \
+    ARCHIVE_SEP
+from current_writer import csv_header
+from opc_status import parse_timestamp, read_status, select_files
+
+CURRENT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "Ziresch", "current_data")
+OPC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opc data")
+
+CHUNK_ROWS = 100000
+_CURRENT_FILE = re.compile(
+    r"currentdata_(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})\.(csv|bin)$")
+
+# t: epoch seconds, values: (rows, columns) float64
+Chunk = namedtuple('Chunk', ['t', 'values', 'columns'])
+
+
+def current_files(folder, start, end):
+    """فایل‌های currentdata به ترتیب زمان (یک فایل قبل و بعد از بازه هم)"""
+    files = []
+    for name, path in data_files(folder):
+        match = _CURRENT_FILE.match(name)
+        if match:
+            t = datetime.strptime(match.group(1), '%Y-%m-%d_%H-%M-%S').timestamp()
+            files.append((t, path))
+    files.sort()
+    times = [t for t, _ in files]
+    first = max(0, int(np.searchsorted(times, start, side='right')) - 1)
+    last = int(np.searchsorted(times, end, side='right')) + 1
+    return [path for _, path in files[first:last]]
+
+
+def opc_files(folder, start, end, name=None):
+    """فایل‌های opc_data (فقط یک کنترلر: name یا بدون نام)"""
+    if name:
+        pattern = re.compile(r"opc_data_%s_\d{8}_\d{6}" % re.escape(name))
+    else:
+        pattern = re.compile(r"opc_data_\d{8}_\d{6}")
+    return [path for path in select_files(folder, start, end)
+            if pattern.match(os.path.basename(path).rpartition(ARCHIVE_SEP)[2])]
+
+
+def _file_time(path):
+    match = _CURRENT_FILE.search(path)
+    return datetime.strptime(match.group(1), '%Y-%m-%d_%H-%M-%S').timestamp()
+
+
+def read_current(path, chunk_rows=CHUNK_ROWS, offset=0):
+    """Chunks of one currentdata file (CSV or binary).
+
+    offset: byte offset of a CSV row to start from (see data_index).
+    """
+    if path.endswith('.bin'):
+        meta, records = read_records(path)
+        channels = meta.get('channels', [None])
+        columns = csv_header(channels)[2:]
+        for i in range(0, len(records), chunk_rows):
+            part = records[i:i + chunk_rows]
+            values = np.stack([part['rms'], part['peak'], part['min']], axis=-1)
+            yield Chunk(np.asarray(part['t'], dtype=np.float64),
+                        values.reshape(len(part), -1).astype(np.float64), columns)
+        return
+    with open_data(path, text=True) as f:
+        header = next(csv.reader([f.readline()]))
+        # Older files have no Timestamp column: Time (s) counts from the
+        # time in the file name
+        stamped = len(header) > 1 and header[1] == 'Timestamp'
+        columns = header[2:] if stamped else header[1:]
+        usecols = [0] + list(range(2 if stamped else 1, len(header)))
+        base = None if stamped else _file_time(path)
+        if offset:
+            f.seek(offset)
+        while True:
+            lines = [line for line in itertools.islice(f, chunk_rows)
+                     if not line.startswith('#')]
+            if not lines:
+                return
+            if base is None:
+                first = lines[0].split(',')
+                base = parse_timestamp(first[1]) - float(first[0])
+            data = np.loadtxt(lines, delimiter=',', usecols=usecols, ndmin=2)
+            yield Chunk(data[:, 0] + base, data[:, 1:], columns)
+
+
+def _number(cell):
+    try:
+        return float(cell)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def read_opc(path, chunk_rows=CHUNK_ROWS, offset=0):
+    """Chunks of one opc_data file, status change records forward-filled.
+
+    offset: byte offset of a CSV row to start from (see data_index).
+    """
+    status = read_status(path)
+    names = list(dict.fromkeys(name for _, name, _ in status))
+    if path.endswith('.bin'):
+        meta, records = read_records(path)
+        columns = meta['columns']
+        # Non-numeric cells (<file>.errors) stay NaN
+        chunks = ((np.asarray(part['t'], dtype=np.float64),
+                   np.column_stack([part[c] for c in columns]).astype(np.float64))
+                  for part in (records[i:i + chunk_rows]
+                               for i in range(0, len(records), chunk_rows)))
+    else:
+        f = open_data(path, text=True)
+        columns = next(csv.reader([f.readline()]))[1:]
+        if offset:
+            f.seek(offset)
+        reader = csv.reader(f)
+
+        def csv_chunks():
+            with f:
+                while True:
+                    lines = list(itertools.islice(reader, chunk_rows))
+                    if not lines:
+                        return
+                    t = np.array([parse_timestamp(line[0]) for line in lines])
+                    values = np.full((len(lines), len(columns)), np.nan)
+                    for row, line in enumerate(lines):
+                        cells = [_number(cell) for cell in line[1:len(columns) + 1]]
+                        values[row, :len(cells)] = cells
+                    yield t, values
+        chunks = csv_chunks()
+    names = [name for name in names if name not in columns]
+    for t, values in chunks:
+        if names:
+            values = np.hstack([values, _forward_fill(status, names, t)])
+        yield Chunk(t, values, columns + names)
+
+
+def _forward_fill(status, names, t):
+    out = np.full((len(t), len(names)), np.nan)
+    for col, name in enumerate(names):
+        changes = [(when, _number(value)) for when, n, value in status if n == name]
+        when = np.array([c[0] for c in changes])
+        value = np.array([c[1] for c in changes])
+        idx = np.searchsorted(when, t, side='right') - 1
+        out[idx >= 0, col] = value[idx[idx >= 0]]
+    return out
+
+
+def stream(files, reader, start, end, chunk_rows=CHUNK_ROWS):
+    """Chunks of several files in time order, limited to [start, end]."""
+    for path in files:
+        for chunk in reader(path, chunk_rows):
+            if chunk.t[0] > end:
+                return
+            keep = (chunk.t >= start) & (chunk.t <= end)
+            if keep.any():
+                yield Chunk(chunk.t[keep], chunk.values[keep], chunk.columns)
+
+
+class ChunkBuffer(object):
+    """پنجره‌ی متحرک روی یک stream از Chunk ها (حافظه محدود)"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self.columns = None
+        self.t = np.empty(0)
+        self.values = None
+        self.exhausted = False
+
+    def fill_until(self, t):
+        """Load chunks until the buffer reaches time ``t`` (or the end)."""
+        parts_t, parts_v = [self.t], [] if self.values is None else [self.values]
+        while not self.exhausted and (not len(parts_t[-1]) or parts_t[-1][-1] < t):
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                self.exhausted = True
+                break
+            if self.columns is None:
+                self.columns = chunk.columns
+            elif chunk.columns != self.columns:
+                chunk = Chunk(chunk.t, _align(chunk, self.columns), self.columns)
+            parts_t.append(chunk.t)
+            parts_v.append(chunk.values)
+        if len(parts_t) > 1:
+            self.t = np.concatenate(parts_t)
+            self.values = np.concatenate(parts_v)
+
+    def trim_before(self, t, keep_last=False):
+        """Drop rows older than ``t`` (keep_last: keep the newest of them)."""
+        cut = int(np.searchsorted(self.t, t, side='left'))
+        if keep_last:
+            cut = max(0, cut - 1)
+        self.t = self.t[cut:]
+        if self.values is not None:
+            self.values = self.values[cut:]
+
+    @property
+    def last_t(self):
+        return self.t[-1] if len(self.t) else -np.inf
+
+
+def _align(chunk, columns):
+    # Files written with another column set: match by name
+    index = {name: i for i, name in enumerate(chunk.columns)}
+    out = np.full((len(chunk.t), len(columns)), np.nan)
+    for col, name in enumerate(columns):
+        if name in index:
+            out[:, col] = chunk.values[:, index[name]]
+    return out
+
+
+def resample(current, opc, tolerance):
+    """OPC values (latest at or before each RMS window) next to every window."""
+    opc_buf = ChunkBuffer(opc)
+    for chunk in current:
+        opc_buf.fill_until(chunk.t[-1])
+        if opc_buf.columns is None:
+            raise SystemExit("Error: no OPC data in the selected range")
+        idx = np.searchsorted(opc_buf.t, chunk.t, side='right') - 1
+        valid = idx >= 0
+        if tolerance is not None:
+            valid &= chunk.t - opc_buf.t[np.maximum(idx, 0)] <= tolerance
+        joined = np.full((len(chunk.t), len(opc_buf.columns)), np.nan)
+        joined[valid] = opc_buf.values[idx[valid]]
+        yield Chunk(chunk.t, np.hstack([chunk.values, joined]),
+                    chunk.columns + opc_buf.columns)
+        opc_buf.trim_before(chunk.t[-1], keep_last=True)
+
+
+def _parse_stats(stats):
+    out = []
+    for name in stats.split(','):
+        name = name.strip()
+        if name in ('mean', 'max', 'min'):
+            out.append((name, None))
+        elif re.fullmatch(r'p\d+(\.\d+)?', name):
+            out.append((name, float(name[1:])))
+        else:
+            raise SystemExit(f"Error: unknown statistic {name!r}")
+    return out
+
+
+def _reduce(t, values, starts, ends, stats):
+    # Per-interval statistics over the rows with starts <= t < ends
+    lo = np.searchsorted(t, starts, side='left')
+    hi = np.searchsorted(t, ends, side='left')
+    count = hi - lo
+    columns = []
+    for name, q in stats:
+        out = np.full((len(starts), values.shape[1]), np.nan)
+        nonempty = count > 0
+        if name == 'mean':
+            cs = np.vstack([np.zeros((1, values.shape[1])), np.cumsum(values, axis=0)])
+            out[nonempty] = ((cs[hi] - cs[lo])[nonempty] / count[nonempty, None])
+        elif name in ('max', 'min') and nonempty.any():
+            reduce = np.maximum if name == 'max' else np.minimum
+            # reduceat over [lo, hi) pairs; every second result is a segment
+            padded = np.vstack([values, values[-1:]])
+            bounds = np.column_stack([lo, hi]).ravel()
+            out[nonempty] = reduce.reduceat(padded, bounds, axis=0)[::2][nonempty]
+        elif q is not None:
+            for k in np.flatnonzero(nonempty):
+                out[k] = np.percentile(values[lo[k]:hi[k]], q, axis=0)
+        columns.append(out)
+    return np.hstack(columns + [count[:, None].astype(np.float64)])
+
+
+def downsample(current, opc, stats, max_interval):
+    """RMS statistics between consecutive OPC samples, next to every sample."""
+    rms = ChunkBuffer(current)
+    pending = None
+    last_dt = max_interval
+    for chunk in itertools.chain(opc, [None]):
+        if chunk is None:
+            if pending is None:
+                return
+            # The last sample: one typical interval
+            t, values, columns = pending
+            ends = np.append(np.minimum(t[1:], t[:-1] + max_interval),
+                             t[-1] + min(last_dt, max_interval))
+        else:
+            if pending is not None:
+                t = np.concatenate([pending[0], chunk.t])
+                values = np.concatenate([pending[1], chunk.values])
+            else:
+                t, values = chunk.t, chunk.values
+            columns = chunk.columns
+            if len(t) < 2:
+                pending = (t, values, columns)
+                continue
+            last_dt = float(np.median(np.diff(t)))
+            ends = np.minimum(t[1:], t[:-1] + max_interval)
+            pending = (t[-1:], values[-1:], columns)
+            t, values = t[:-1], values[:-1]
+        k = 0
+        while k < len(t):
+            rms.fill_until(ends[k])
+            if rms.columns is None:
+                raise SystemExit("Error: no current data in the selected range")
+            if rms.exhausted:
+                j = len(t)
+            else:
+                j = max(k + 1, int(np.searchsorted(ends, rms.last_t, side='right')))
+            reduced = _reduce(rms.t, rms.values, t[k:j], ends[k:j], stats)
+            names = [f"{column} {name}" for name, _ in stats
+                     for column in rms.columns] + ["RMS samples"]
+            yield Chunk(t[k:j], np.hstack([values[k:j], reduced]), columns + names)
+            rms.trim_before(t[j] if j < len(t) else ends[-1])
+            k = j
+
+
+def _timestamps(t):
+    # Local time strings, vectorized (UTC offset taken at the chunk start)
+    offset = time.localtime(float(t[0])).tm_gmtoff
+    micros = np.round((t + offset) * 1e6).astype('datetime64[us]')
+    stamps = np.datetime_as_string(micros, unit='ms')
+    return np.char.replace(stamps, 'T', ' ')
+
+
+def write_csv(path, chunks):
+    rows = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        for chunk in chunks:
+            if rows == 0:
+                writer.writerow(['timestamp'] + chunk.columns)
+            fmt = "%s" + ",%.9g" * len(chunk.columns) + "\r\n"
+            text = "".join(fmt % (ts, *row) for ts, row in
+                           zip(_timestamps(chunk.t).tolist(), chunk.values.tolist()))
+            f.write(text.replace(",nan", ","))
+            rows += len(chunk.t)
+    return rows
+
+
+def write_binary(path, chunks, meta):
+    writer = None
+    for chunk in chunks:
+        if writer is None:
+            dtype = np.dtype([('t', '<f8')] + [(name, '<f8') for name in chunk.columns])
+            meta = dict(meta, columns=chunk.columns)
+            writer = RecordWriter(path, dtype, meta)
+        records = np.empty(len(chunk.t), dtype=writer.dtype)
+        view = records.view(np.float64).reshape(len(chunk.t), -1)
+        view[:, 0] = chunk.t
+        view[:, 1:] = chunk.values
+        writer.append(records)
+    if writer is None:
+        return 0
+    writer.close()
+    return writer.records
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time-align current (RMS) and OPC UA data into one file")
+    parser.add_argument("-o", "--output", required=True,
+                        help="output file (.csv or .bin)")
+    parser.add_argument("--mode", choices=["resample", "downsample"],
+                        default="resample")
+    parser.add_argument("--start", help="e.g. '2026-01-12 06:00'")
+    parser.add_argument("--end", help="e.g. '2026-01-12 14:00'")
+    parser.add_argument("--current-folder", default=CURRENT_FOLDER)
+    parser.add_argument("--opc-folder", default=OPC_FOLDER)
+    parser.add_argument("--controller", help="opc_data_<name>_* files only")
+    parser.add_argument("--tolerance", type=float, default=5.0,
+                        help="resample: max age of an OPC sample in seconds")
+    parser.add_argument("--stats", default="mean,max,p95",
+                        help="downsample: mean, max, min, pNN")
+    parser.add_argument("--max-interval", type=float, default=60.0,
+                        help="downsample: longest OPC interval in seconds")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    start = parse_timestamp(args.start) if args.start else 0.0
+    end = parse_timestamp(args.end) if args.end else float('inf')
+    current = stream(current_files(args.current_folder, start, end),
+                     read_current, start, end, args.chunk_rows)
+    opc = stream(opc_files(args.opc_folder, start, end, args.controller),
+                 read_opc, start, end, args.chunk_rows)
+    if args.mode == "resample":
+        chunks = resample(current, opc, args.tolerance)
+    else:
+        chunks = downsample(current, opc, _parse_stats(args.stats),
+                            args.max_interval)
+
+    began = time.perf_counter()
+    if args.output.endswith('.bin'):
+        rows = write_binary(args.output, chunks, {"mode": args.mode})
+    else:
+        rows = write_csv(args.output, chunks)
+    print(f"{rows} rows written to {args.output} "
+          f"({time.perf_counter() - began:.1f} s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,340 @@
+"""
+asyncio acquisition engine for the OPC UA logger
+موتور خواندن OPC UA مبتنی بر asyncio
+
+Each controller in CONTROLLERS is polled by its own task on a fixed-rate
+schedule: deadlines are start + k * READ_INTERVAL, so read time never adds
+to the sample period. A slow read only delays its own controller; missed
+deadlines are skipped and counted. Rows go through the same path as the
+sync engine (status tracking, OpcSampleStore, CSV or binary writer,
+STATUS_MODE / STATUS_ENCODING / OUTPUT_FORMAT), but the store and the
+writer belong to a per-controller worker thread, so disk writes overlap
+with the next reads.
+
+Needs the asyncua package (pip install asyncua). Run with:
+    python opc_async.py
+or set ENGINE = "async" in opc_logger.py.
+"""
+import asyncio
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import opc_logger
+from opc_logger import (logger, NODES, STATUS_NODES, OPC_URL, OPC_USERNAME,
+                        OPC_PASSWORD, READ_INTERVAL, SAVE_INTERVAL,
+                        MAX_NODES_PER_READ, DATA_FOLDER, FLUSH_INTERVAL,
+                        STORE_CAPACITY, SUBSCRIPTION_PERIOD_MS,
+                        StreamingCsvWriter, StreamingBinaryWriter,
+                        StatusTracker, StatusChangeLog, StatusChangeHandler,
+                        status_encoder, csv_fieldnames, live_ring, publish_row,
+                        data_index)
+from opc_store import OpcSampleStore
+from heartbeat import Heartbeat
+
+try:
+    from asyncua import Client, ua
+except ImportError:  # asyncua is optional - only needed for this engine
+    Client = None
+    ua = None
+
+# لیست کنترلرها - هر کدام با task جداگانه خوانده می‌شود
+# name: در نام فایل CSV استفاده می‌شود (None = همان نام‌گذاری opc_logger)
+CONTROLLERS = [
+    {
+        "name": None,
+        "url": OPC_URL,
+        "username": OPC_USERNAME,
+        "password": OPC_PASSWORD,
+        "waveform_trigger": True,
+    },
+]
+
+# فاصله بین تلاش‌های اتصال مجدد (ثانیه)
+RECONNECT_DELAY = 2
+RECONNECT_DELAY_MAX = 60
+
+
+class CycleStats(object):
+    """آمار زمان‌بندی: jitter شروع سیکل‌ها، deadline های از دست رفته"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.cycles = 0
+        self.missed = 0
+        self.jitter_sum = 0.0
+        self.jitter_max = 0.0
+        self.read_max = 0.0
+
+    def add(self, jitter, read_time):
+        self.cycles += 1
+        self.jitter_sum += jitter
+        self.jitter_max = max(self.jitter_max, jitter)
+        self.read_max = max(self.read_max, read_time)
+
+    def summary(self):
+        mean = self.jitter_sum / self.cycles if self.cycles else 0.0
+        return (f"cycles {self.cycles}, missed deadlines {self.missed}, "
+                f"jitter mean {mean * 1000:.1f} ms / max {self.jitter_max * 1000:.1f} ms, "
+                f"max read {self.read_max * 1000:.1f} ms")
+
+
+def _datavalue_to_cell(result):
+    """مقدار یک DataValue یا متن خطا بر اساس StatusCode"""
+    status = result.StatusCode
+    if status is not None and not status.is_good():
+        return f"Error: {str(ua.UaStatusCodeError(status.value))}"
+    return result.Value.Value if result.Value is not None else None
+
+
+class ControllerPoller(object):
+    """خواندن یک کنترلر CNC با زمان‌بندی ثابت"""
+
+    def __init__(self, config, interval=READ_INTERVAL, save_interval=SAVE_INTERVAL):
+        self.name = config.get("name")
+        self.label = self.name or config["url"]
+        self.config = config
+        self.interval = interval
+        self.save_interval = save_interval
+        self.subscribe = opc_logger.STATUS_MODE == "subscribe"
+        node_ids = list(NODES.values())
+        if not self.subscribe:
+            node_ids += list(STATUS_NODES.values())
+        self.node_ids = [ua.NodeId.from_string(nodeid) for nodeid in node_ids]
+        # وضعیت STATUS_NODES و trigger مخصوص همین کنترلر
+        self.status = StatusTracker(opc_logger.WAVEFORM_TRIGGER_NODES
+                                    if config.get("waveform_trigger") else [])
+        self.status_handler = None
+        if self.subscribe:
+            self.status_handler = StatusChangeHandler(
+                StatusChangeLog(DATA_FOLDER, self.name), self.status)
+        self.stats = CycleStats()
+        self.samples = 0
+        self.client = None
+        # store و writer فقط در thread همین کنترلر استفاده می‌شوند (ترتیب ردیف‌ها حفظ می‌شود)
+        self.encoder = status_encoder()
+        self.store = OpcSampleStore(csv_fieldnames()[1:], capacity=STORE_CAPACITY)
+        writer_class = (StreamingBinaryWriter if opc_logger.OUTPUT_FORMAT == "binary"
+                        else StreamingCsvWriter)
+        self.writer = writer_class(DATA_FOLDER, name=self.name,
+                                   rotate_seconds=save_interval,
+                                   status_encoder=self.encoder,
+                                   index=data_index())
+        self.last_flush = time.time()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        # تعداد کارهای ارسال شده به thread که هنوز تمام نشده‌اند
+        self.pending = 0
+        self._pending_lock = threading.Lock()
+        # ring حافظه مشترک جداگانه برای هر کنترلر (ksf_opc یا ksf_opc_<name>)
+        self.bus = live_ring(self.name)
+
+    @property
+    def queue_depth(self):
+        """کارهای در صف thread به اضافه نمونه‌های نوشته نشده store"""
+        return self.pending + len(self.store)
+
+    async def connect(self):
+        client = Client(self.config["url"])
+        if self.config.get("username"):
+            client.set_user(self.config["username"])
+            client.set_password(self.config["password"])
+        await client.connect()
+        self.client = client
+        logger.info(f"✓ [{self.label}] Connected")
+        if self.status_handler is not None:
+            # مقدار اولیه STATUS_NODES قبل از اولین notification
+            results = await client.uaclient.read_attributes(
+                [ua.NodeId.from_string(nodeid) for nodeid in STATUS_NODES.values()],
+                ua.AttributeIds.Value)
+            for name, result in zip(STATUS_NODES, results):
+                if result.StatusCode is None or result.StatusCode.is_good():
+                    self.status.update(name, _datavalue_to_cell(result))
+            subscription = await client.create_subscription(SUBSCRIPTION_PERIOD_MS,
+                                                            self.status_handler)
+            await subscription.subscribe_data_change(
+                [client.get_node(nodeid) for nodeid in STATUS_NODES.values()])
+            logger.info(f"✓ [{self.label}] Subscribed to {len(STATUS_NODES)} status nodes "
+                        f"(change log: {self.status_handler.change_log.path})")
+
+    async def disconnect(self):
+        if self.client is not None:
+            try:
+                await self.client.disconnect()
+            except Exception:
+                pass
+            self.client = None
+
+    async def read(self):
+        """یک سیکل خواندن: همه نودها با یک (یا چند) درخواست Read - لیست مقادیر به ترتیب ستون‌ها"""
+        results = []
+        for i in range(0, len(self.node_ids), MAX_NODES_PER_READ):
+            results.extend(await self.client.uaclient.read_attributes(
+                self.node_ids[i:i + MAX_NODES_PER_READ], ua.AttributeIds.Value))
+        cells = [_datavalue_to_cell(result) for result in results[:len(NODES)]]
+        if self.subscribe:
+            # آخرین مقدار دریافت شده از subscription
+            cells.extend(self.status.cells())
+            return cells
+        for name, result in zip(STATUS_NODES, results[len(NODES):]):
+            value = _datavalue_to_cell(result)
+            if result.StatusCode is None or result.StatusCode.is_good():
+                self.status.update(name, value)
+            cells.append(value)
+        return cells
+
+    def _submit(self, fn, *args):
+        """اجرای fn در thread کنترلر (بدون توقف خواندن)"""
+        with self._pending_lock:
+            self.pending += 1
+        self.executor.submit(fn, *args).add_done_callback(self._done)
+
+    def _done(self, future):
+        with self._pending_lock:
+            self.pending -= 1
+        error = future.exception()
+        if error is not None:
+            logger.error(f"[{self.label}] Error saving file: {str(error)}")
+
+    def _store_row(self, timestamp, cells):
+        """(thread کنترلر) افزودن یک نمونه به store و نوشتن آن هر FLUSH_INTERVAL"""
+        if self.encoder is not None:
+            # فقط NODES در فایل داده؛ STATUS_NODES به صورت تغییرات
+            self.encoder.record(timestamp, cells[len(NODES):])
+            cells = cells[:len(NODES)]
+        self.store.append(timestamp, cells)
+        # فایل با اولین ردیف باز می‌شود (نه با اولین flush)
+        self.writer.ensure_open(timestamp)
+        if self.store.full or time.time() - self.last_flush >= FLUSH_INTERVAL:
+            self._flush_store()
+
+    def _flush_store(self):
+        """(thread کنترلر) نوشتن نمونه‌های جمع شده در فایل"""
+        try:
+            self.writer.write_store(self.store)
+        finally:
+            self.store.clear()
+            self.last_flush = time.time()
+
+    def write(self, timestamp, cells):
+        """ارسال یک نمونه به thread کنترلر"""
+        self._submit(self._store_row, timestamp, cells)
+
+    def close(self):
+        """نوشتن ردیف‌های باقیمانده و بستن فایل"""
+        self._submit(self._flush_store)
+        self._submit(self.writer.close)
+        self.executor.shutdown(wait=True)
+        if self.status_handler is not None:
+            self.status_handler.change_log.close()
+        if self.bus is not None:
+            self.bus.close()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        delay = RECONNECT_DELAY
+        while True:
+            try:
+                await self.connect()
+                delay = RECONNECT_DELAY
+                await self._poll(loop)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[{self.label}] OPC UA Error: {str(e)}")
+                logger.debug(traceback.format_exc())
+                await self.disconnect()
+                # نمونه‌های قبل از قطع اتصال منتظر اتصال مجدد نمی‌مانند
+                self._submit(self._flush_store)
+                logger.info(f"[{self.label}] Reconnecting in {delay} s...")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_DELAY_MAX)
+
+    async def _poll(self, loop):
+        start = loop.time()
+        next_deadline = start
+        next_report = start + self.save_interval
+        while True:
+            now = loop.time()
+            if now < next_deadline:
+                await asyncio.sleep(next_deadline - now)
+            cycle_start = loop.time()
+            timestamp = time.time()
+            cells = await self.read()
+            read_time = loop.time() - cycle_start
+            if self.bus is not None:
+                publish_row(self.bus, cells)
+            self.write(timestamp, cells)
+            self.samples += 1
+            self.stats.add(cycle_start - next_deadline, read_time)
+
+            # deadline بعدی روی جدول ثابت؛ سیکل‌های از دست رفته رد می‌شوند
+            next_deadline += self.interval
+            now = loop.time()
+            if now > next_deadline:
+                skipped = int((now - next_deadline) // self.interval) + 1
+                self.stats.missed += skipped
+                next_deadline += skipped * self.interval
+
+            if now >= next_report:
+                logger.info(f"[{self.label}] {self.stats.summary()}")
+                self.stats.reset()
+                next_report += self.save_interval
+
+
+async def send_heartbeats(pollers, heartbeat):
+    """heartbeat مجموع همه کنترلرها برای start.py"""
+    while True:
+        writes = [p.writer.last_write for p in pollers if p.writer.last_write]
+        heartbeat.beat(samples=sum(p.samples for p in pollers),
+                       queue_depth=sum(p.queue_depth for p in pollers),
+                       last_write=max(writes) if writes else None,
+                       connected=sum(p.client is not None for p in pollers))
+        await asyncio.sleep(heartbeat.interval)
+
+
+async def run_controllers(controllers=None):
+    """اجرای همزمان همه کنترلرها در یک event loop"""
+    pollers = [ControllerPoller(config) for config in (controllers or CONTROLLERS)]
+    tasks = [asyncio.create_task(poller.run()) for poller in pollers]
+    heartbeat = Heartbeat.from_env()
+    if heartbeat.enabled:
+        tasks.append(asyncio.create_task(send_heartbeats(pollers, heartbeat)))
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        for poller in pollers:
+            poller.close()
+            await poller.disconnect()
+
+
+def main():
+    """تابع اصلی حالت asyncio"""
+    opc_logger.setup_logging()
+    if Client is None:
+        logger.error("asyncua is not installed (pip install asyncua)")
+        return
+    logger.info("=" * 70)
+    logger.info("Starting OPC UA Data Logger (asyncio engine)...")
+    logger.info(f"Controllers: {', '.join(c.get('name') or c['url'] for c in CONTROLLERS)}")
+    logger.info(f"Status nodes: {opc_logger.STATUS_MODE}, encoding {opc_logger.STATUS_ENCODING}, "
+                f"output {opc_logger.OUTPUT_FORMAT}")
+    logger.info(f"Sample rate: Every {READ_INTERVAL} seconds (fixed schedule)")
+    logger.info(f"Saving interval: Every {SAVE_INTERVAL} seconds")
+    logger.info("=" * 70)
+    if not os.path.exists(DATA_FOLDER):
+        os.makedirs(DATA_FOLDER)
+        logger.info(f"✓ Created folder: {DATA_FOLDER}")
+    try:
+        asyncio.run(run_controllers())
+    except KeyboardInterrupt:
+        logger.info("\nStopping data logger...")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,72 +1,58 @@
-from opcua import Client
+from opcua import Client, ua
 import csv
 import os
 from datetime import datetime
 import time
 import logging
 import sys
+import threading
 import traceback
+import numpy as np
+from waveform_capture import request_capture
+from opc_store import OpcSampleStore, open_binary
+from opc_status import StatusChangeEncoder, parse_timestamp
+from heartbeat import Heartbeat
+from live_bus import LiveRing, OPC_BUS, opc_dtype
+from data_index import DataIndex, FileSummary, DEFAULT_INDEX
+# لیست نودها در opc_nodes.py (بدون اثر جانبی، برای sim_opc_server و ابزارها)
+from opc_nodes import make_indexed_nodes, NODES, STATUS_NODES
 
-# تنظیم logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='[%(asctime)s] %(levelname)s: %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'opc_logger.log'))
-    ]
-)
 logger = logging.getLogger(__name__)
 
-# آدرس سرور OPC UA
-OPC_URL = "opc.tcp://10.2.67.200:4840"
+def setup_logging():
+    """تنظیم logging (کنسول و opc_logger.log) - فقط هنگام اجرای logger، نه در import"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='[%(asctime)s] %(levelname)s: %(message)s',
+        handlers=[
+            logging.StreamHandler(sys.stdout),
+            logging.FileHandler(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'opc_logger.log'))
+        ]
+    )
+
+# آدرس سرور OPC UA (KSF_OPC_URL، مثلاً سرور شبیه‌سازی sim_opc_server.py)
+OPC_URL = os.environ.get("KSF_OPC_URL", "opc.tcp://10.2.67.200:4840")
 OPC_USERNAME = "KSF"
 OPC_PASSWORD = "12345678"
 
-# تابع برای ساخت نودهای اندیس‌دار
-def make_indexed_nodes(base_name, count):
-    """
-    ساخت نودهای اندیس‌دار (از 1 شروع می‌شود)
-    مثال: make_indexed_nodes("vaPower", 6) 
-    نودهای vaPower[1] تا vaPower[6] را می‌سازد
-    """
-    nodes = {}
-    for i in range(1, count + 1):
-        node_name = f"{base_name}[{i}]"
-        # ساخت NodeId بر اساس الگوی Sinumerik
-        node_id = f"ns=2;s=/Nck/MachineAxis/{base_name}[{i}]"
-        nodes[node_name] = node_id
-    return nodes
-
-# ساخت NODES با استفاده از make_indexed_nodes
-NODES = {}
-NODES.update(make_indexed_nodes("vaPower", 6))
-NODES.update(make_indexed_nodes("vaCurr", 6))
-NODES.update(make_indexed_nodes("aaTorque", 6))
-NODES.update(make_indexed_nodes("aaDtbb", 6))
-NODES.update(make_indexed_nodes("cmdSpeedRel", 6))
-
-# Status nodes (only saved when value changes)
-STATUS_NODES = {
-    "channelNo": "ns=2;s=/Nck/LogicalSpindle/channelNo",
-    "speedOvr": "ns=2;s=/Nck/LogicalSpindle/speedOvr",
-    "spindleType": "ns=2;s=/Nck/LogicalSpindle/spindleType",
-    "status_LogicalSpindle": "ns=2;s=/Nck/LogicalSpindle/status",
-    "paramSetNo": "ns=2;s=/Nck/MachineAxis/paramSetNo",
-    "status_Spindle": "ns=2;s=/Nck/Spindle/status",
-    "progEvent": "ns=2;s=/Channel/State/progEvent",
-    "progStatus": "ns=2;s=/Channel/State/progStatus",
-    "actFeedRate": "ns=2;s=/Nck/MachineAxis/actFeedRate",
-    "cmdFeedRate": "ns=2;s=/Nck/MachineAxis/cmdFeedRate",
-    "cmdSpeedRel": "ns=2;s=/Nck/MachineAxis/cmdSpeedRel",
-    "actParts": "ns=2;s=/Channel/State/actParts",
-    "MachiningTimeRecording": "ns=2;s=/Hmi/MachiningTimeRecording",
-    "toolNo": "ns=2;s=/Tool/Catalogue/toolNo",
-    "actSpeed": "ns=2;s=/Channel/Spindle/actSpeed",
-}
-
-# ذخیره مقادیر قبلی STATUS_NODES برای تشخیص تغییر
-previous_status_values = {}
+# ستون‌های داده به ترتیب فایل (بدون timestamp)
+DATA_COLUMNS = list(NODES.keys()) + list(STATUS_NODES.keys())
+
+# NodeId ها یکبار ساخته می‌شوند و همه در یک درخواست Read خوانده می‌شوند
+READ_NODE_IDS = [ua.NodeId.from_string(nodeid)
+                 for nodeid in list(NODES.values()) + list(STATUS_NODES.values())]
+
+# حداکثر تعداد نود در هر درخواست Read (محدودیت سرور)
+MAX_NODES_PER_READ = 100
+
+# حالت خواندن STATUS_NODES:
+#   "poll"      - در هر سیکل همراه NODES خوانده می‌شوند
+#   "subscribe" - با subscription (data change) دریافت و در change log نوشته می‌شوند
+STATUS_MODE = "poll"
+SUBSCRIPTION_PERIOD_MS = 100
+
+# موتور خواندن: "sync" (همین فایل) یا "async" (opc_async.py - نیاز به asyncua)
+ENGINE = "sync"
 
 # فاصله زمانی بین ذخیره‌سازی‌ها (ثانیه)
 SAVE_INTERVAL = 60
@@ -74,129 +60,469 @@ SAVE_INTERVAL = 60
 # فاصله زمانی بین خواندن‌ها (sample rate - ثانیه)
 READ_INTERVAL = 1
 
+# چرخش فایل CSV علاوه بر SAVE_INTERVAL بر اساس حجم (بایت، 0 = غیرفعال)
+ROTATE_BYTES = 0
+
+# هر چند ثانیه بافر فایل روی دیسک نوشته شود (flush) - حداکثر داده از دست رفته در crash
+FLUSH_INTERVAL = 5
+FSYNC_ON_FLUSH = False
+
+# فرمت خروجی: "csv" یا "binary" (فایل ستونی opc_data_<timestamp>.bin)
+OUTPUT_FORMAT = "csv"
+
+# ذخیره ستون‌های STATUS_NODES:
+#   "dense"   - در هر ردیف فایل داده (مثل قبل)
+#   "changes" - فقط تغییرات در فایل همراه <file>.status.csv (بازسازی: opc_status.load_dense)
+STATUS_ENCODING = "dense"
+
+# تعداد نمونه‌های نگه‌داشته شده در حافظه (ستونی) بین دو flush
+STORE_CAPACITY = 1024
+
+# انتشار هر نمونه در shared memory (live_bus.py) برای خواندن زنده - تعداد ردیف‌های نگه‌داشته
+LIVE_BUS = True
+LIVE_BUS_ROWS = 3600
+
+# فهرست زمانی فایل‌ها (data_index.py) - با بسته شدن هر فایل به‌روز می‌شود (None = غیرفعال)
+DATA_INDEX = DEFAULT_INDEX
+
 # مسیر فولدر ذخیره‌سازی
 DATA_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opc data")
 
-def read_opcua_data(client):
-    """خواندن داده‌ها از سرور OPC UA (با client موجود)"""
-    data = {}
-    try:
-        # خواندن NODES (همیشه ذخیره می‌شوند)
-        for name, nodeid in NODES.items():
-            try:
-                node = client.get_node(nodeid)
-                value = node.get_value()
-                data[name] = value
-            except Exception as e:
-                data[name] = f"Error: {str(e)}"
-        
-        # خواندن STATUS_NODES
-        status_changed = False
-        for name, nodeid in STATUS_NODES.items():
+# Changes of these status nodes ask current_logger for a raw waveform snapshot
+WAVEFORM_TRIGGER_NODES = ["progEvent"]
+WAVEFORM_TRIGGER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     "Ziresch", "current_data", "waveform.trigger")
+
+def now_timestamp():
+    """timestamp فعلی با دقت میلی‌ثانیه (برای READ_INTERVAL کمتر از 1 ثانیه)"""
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+def _datavalue_to_cell(result):
+    """مقدار یک DataValue یا متن خطا بر اساس StatusCode"""
+    if not result.StatusCode.is_good():
+        return f"Error: {str(ua.UaStatusCodeError(result.StatusCode.value))}"
+    return result.Value.Value
+
+def read_node_values(client, node_ids):
+    """خواندن Value همه نودها با یک (یا چند) درخواست Read"""
+    results = []
+    for i in range(0, len(node_ids), MAX_NODES_PER_READ):
+        results.extend(client.uaclient.get_attributes(
+            node_ids[i:i + MAX_NODES_PER_READ], ua.AttributeIds.Value))
+    return results
+
+class StatusTracker(object):
+    """
+    آخرین مقدار STATUS_NODES یک کنترلر برای تشخیص تغییر
+    تغییر WAVEFORM_TRIGGER_NODES (بعد از اولین مقدار) درخواست waveform می‌فرستد
+    هر کنترلر tracker جداگانه دارد تا تغییرات آن‌ها با هم قاطی نشوند
+    """
+    
+    def __init__(self, trigger_nodes=WAVEFORM_TRIGGER_NODES):
+        self.values = {}
+        self.trigger_nodes = list(trigger_nodes or [])
+    
+    def update(self, name, value):
+        """ثبت مقدار جدید یک STATUS_NODE - True اگر مقدار تغییر کرده باشد"""
+        if name in self.values and self.values[name] == value:
+            return False
+        if name in self.trigger_nodes and name in self.values:
             try:
-                node = client.get_node(nodeid)
-                value = node.get_value()
-                # بررسی تغییر مقدار
-                if name not in previous_status_values or previous_status_values[name] != value:
-                    status_changed = True
-                    previous_status_values[name] = value
-                data[name] = value
-            except Exception as e:
-                data[name] = f"Error: {str(e)}"
-        
-        data['_status_changed'] = status_changed
-        
-    except Exception as e:
-        logger.error(f"OPC UA Read Error: {str(e)}")
-        logger.error(traceback.format_exc())
-        data = {"Connection": f"Error: {str(e)}"}
-    return data
+                request_capture(WAVEFORM_TRIGGER_FILE, name)
+            except OSError as e:
+                logger.warning(f"Waveform trigger failed: {str(e)}")
+        self.values[name] = value
+        return True
+    
+    def cells(self):
+        """آخرین مقادیر به ترتیب STATUS_NODES ('' اگر هنوز دریافت نشده)"""
+        return [self.values.get(name, '') for name in STATUS_NODES]
 
-def save_to_csv(data_list):
-    """ذخیره لیست داده‌ها در فایل CSV جدید با timestamp"""
-    if not data_list:
-        logger.warning("No data to save")
-        return
+# وضعیت کنترلر اصلی (موتور sync)
+status_tracker = StatusTracker()
+
+def read_opcua_row(client):
+    """
+    خواندن یک نمونه به صورت لیست مقادیر به ترتیب ستون‌ها (NODES سپس STATUS_NODES)
+    خروجی: (cells, status_changed) - خطای اتصال به صورت exception
+    """
+    if STATUS_MODE == "subscribe":
+        # STATUS_NODES از subscription می‌آیند، فقط NODES خوانده می‌شوند
+        results = read_node_values(client, READ_NODE_IDS[:len(NODES)])
+    else:
+        # یک درخواست Read برای NODES و STATUS_NODES
+        results = read_node_values(client, READ_NODE_IDS)
     
-    logger.info(f"\n>>> Starting to save {len(data_list)} rows...")
+    # NODES (همیشه ذخیره می‌شوند)
+    cells = [_datavalue_to_cell(result) for result in results[:len(NODES)]]
     
-    # ایجاد فولدر اگر وجود نداشته باشد
-    if not os.path.exists(DATA_FOLDER):
-        logger.info(f"Creating folder: {DATA_FOLDER}")
-        os.makedirs(DATA_FOLDER)
-        logger.info(f"✓ Created folder: {DATA_FOLDER}")
+    # STATUS_NODES
+    status_changed = False
+    if STATUS_MODE == "subscribe":
+        # آخرین مقدار دریافت شده از subscription
+        cells.extend(status_tracker.cells())
     else:
-        logger.info(f"✓ Folder exists: {DATA_FOLDER}")
+        for name, result in zip(STATUS_NODES, results[len(NODES):]):
+            value = _datavalue_to_cell(result)
+            # بررسی تغییر مقدار
+            if result.StatusCode.is_good() and status_tracker.update(name, value):
+                status_changed = True
+            cells.append(value)
+    return cells, status_changed
+
+class StatusChangeLog(object):
+    """
+    فایل CSV تغییرات STATUS_NODES: هر ردیف یک تغییر با timestamp سرور
+    ستون‌ها: timestamp, source_timestamp, server_timestamp, name, value
+    """
     
-    # ساخت نام فایل با timestamp
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    csv_filename = f"opc_data_{timestamp}.csv"
-    csv_file = os.path.join(DATA_FOLDER, csv_filename)
+    FIELDNAMES = ['timestamp', 'source_timestamp', 'server_timestamp', 'name', 'value']
     
-    logger.info(f"CSV File path: {csv_file}")
-    logger.info(f"Full path: {os.path.abspath(csv_file)}")
+    def __init__(self, folder, name=None):
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        base = f"status_changes_{name}_{timestamp}" if name else f"status_changes_{timestamp}"
+        self.path = os.path.join(folder, base + ".csv")
+        self._lock = threading.Lock()
+        self._file = open(self.path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.FIELDNAMES)
+        self._file.flush()
+        self.changes = 0
     
-    try:
-        # نوشتن در فایل CSV جدید
-        logger.info(f"Opening file for writing...")
-        with open(csv_file, 'w', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['timestamp'] + list(NODES.keys()) + list(STATUS_NODES.keys())
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            
-            # نوشتن هدر
-            logger.info(f"Writing header...")
-            writer.writeheader()
-            
-            # نوشتن همه ردیف‌های داده
-            logger.info(f"Writing {len(data_list)} data rows...")
-            for i, data in enumerate(data_list):
-                # کپی کردن data برای جلوگیری از تغییر داده اصلی
-                row_data = {}
-                row_data['timestamp'] = data.get('timestamp', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-                
-                # حذف فلگ تغییر از داده
-                data_copy = data.copy()
-                data_copy.pop('_status_changed', None)
-                
-                # همیشه NODES را اضافه می‌کنیم
-                for name in NODES.keys():
-                    row_data[name] = data_copy.get(name, '')
-                
-                # اضافه کردن STATUS_NODES
-                for name in STATUS_NODES.keys():
-                    row_data[name] = data_copy.get(name, '')
-                
-                # نوشتن ردیف
-                writer.writerow(row_data)
-                if (i+1) % 10 == 0:
-                    logger.debug(f"  Written {i+1}/{len(data_list)} rows")
-        
-        logger.info(f"✓ File written successfully")
-        
-        # بررسی فایل ایجاد شده
-        if os.path.exists(csv_file):
-            file_size = os.path.getsize(csv_file)
-            logger.info(f"✓ File exists: {csv_file} ({file_size} bytes)")
+    @staticmethod
+    def _format_time(value):
+        # زمان‌های OPC UA به UTC هستند (datetime بدون tzinfo)
+        if value is None:
+            return ''
+        return value.isoformat(timespec='milliseconds') + ('Z' if value.tzinfo is None else '')
+    
+    def write(self, name, value, source_timestamp=None, server_timestamp=None):
+        with self._lock:
+            self._writer.writerow([
+                now_timestamp(),
+                self._format_time(source_timestamp),
+                self._format_time(server_timestamp),
+                name,
+                value,
+            ])
+            # تغییرات کم هستند - هر ردیف فوراً روی دیسک می‌رود
+            self._file.flush()
+            self.changes += 1
+    
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+class StatusChangeHandler(object):
+    """
+    Handler برای data change notification های STATUS_NODES
+    با opcua و asyncua کار می‌کند (نودها با NodeId متنی شناخته می‌شوند)
+    """
+    
+    def __init__(self, change_log, tracker=None):
+        self.change_log = change_log
+        self.tracker = tracker or status_tracker
+        self.names = {nodeid: name for name, nodeid in STATUS_NODES.items()}
+    
+    def datachange_notification(self, node, val, data):
+        nodeid = node.nodeid.to_string()
+        name = self.names.get(nodeid, nodeid)
+        dv = data.monitored_item.Value
+        if dv.StatusCode is not None and not dv.StatusCode.is_good():
+            val = f"Error: {str(ua.UaStatusCodeError(dv.StatusCode.value))}"
         else:
-            logger.error(f"ERROR: File not created: {csv_file}")
+            self.tracker.update(name, val)
+        self.change_log.write(name, val, dv.SourceTimestamp, dv.ServerTimestamp)
+    
+    def status_change_notification(self, status):
+        logger.warning(f"Subscription status changed: {status}")
+
+def read_status_values(client, tracker):
+    """
+    یک خواندن همزمان STATUS_NODES قبل از subscription
+    ردیف‌ها و snapshot فایل همراه (STATUS_ENCODING = "changes") از همان ابتدا مقدار دارند
+    """
+    results = read_node_values(client, READ_NODE_IDS[len(NODES):])
+    for name, result in zip(STATUS_NODES, results):
+        if result.StatusCode.is_good():
+            tracker.update(name, result.Value.Value)
+
+def subscribe_status_nodes(client, handler):
+    """ساخت subscription برای STATUS_NODES روی client"""
+    read_status_values(client, handler.tracker)
+    subscription = client.create_subscription(SUBSCRIPTION_PERIOD_MS, handler)
+    nodes = [client.get_node(nodeid) for nodeid in STATUS_NODES.values()]
+    subscription.subscribe_data_change(nodes)
+    logger.info(f"✓ Subscribed to {len(nodes)} status nodes "
+                f"(change log: {handler.change_log.path})")
+    return subscription
+
+def connect_client(status_handler=None):
+    """اتصال به سرور OPC UA (و ساخت subscription در حالت subscribe)"""
+    client = Client(OPC_URL)
+    client.set_user(OPC_USERNAME)
+    client.set_password(OPC_PASSWORD)
+    client.connect()
+    if status_handler is not None:
+        subscribe_status_nodes(client, status_handler)
+    return client
+
+def live_ring(name=None):
+    """ring حافظه مشترک برای NODES و STATUS_NODES (None اگر غیرفعال یا ناموفق)"""
+    if not LIVE_BUS:
+        return None
+    try:
+        return LiveRing.create(f"{OPC_BUS}_{name}" if name else OPC_BUS,
+                               opc_dtype(DATA_COLUMNS), LIVE_BUS_ROWS,
+                               meta={"columns": DATA_COLUMNS, "source": OPC_URL})
+    except (OSError, RuntimeError) as e:
+        logger.warning(f"Live bus disabled: {str(e)}")
+        return None
+
+def publish_row(ring, cells):
+    """انتشار یک نمونه با timestamp مشترک time.monotonic() (مقادیر غیر عددی = NaN)"""
+    record = np.zeros(1, dtype=ring.dtype)
+    row = record.view(np.float64)
+    row[0] = time.monotonic()
+    row[1:] = [cell if isinstance(cell, (int, float)) else np.nan for cell in cells]
+    ring.publish(record)
+
+def data_index():
+    """DataIndex مشترک (None اگر غیرفعال یا ناموفق)"""
+    if not DATA_INDEX:
+        return None
+    try:
+        return DataIndex(DATA_INDEX)
+    except Exception as e:
+        logger.warning(f"Data index disabled: {str(e)}")
+        return None
+
+def csv_fieldnames():
+    """ستون‌های فایل CSV"""
+    if STATUS_ENCODING == "changes":
+        return ['timestamp'] + list(NODES)
+    return ['timestamp'] + DATA_COLUMNS
+
+def status_encoder():
+    """encoder تغییرات STATUS_NODES (فقط در حالت STATUS_ENCODING = "changes")"""
+    if STATUS_ENCODING == "changes":
+        return StatusChangeEncoder(STATUS_NODES)
+    return None
+
+class StreamingCsvWriter(object):
+    """
+    نوشتن پیوسته ردیف‌ها در فایل CSV به محض خواندن
+    - چرخش فایل بر اساس زمان (rotate_seconds) یا حجم (rotate_bytes)
+    - flush هر flush_interval ثانیه
+    - بدون کپی dict: هر ردیف مستقیماً به لیست مقادیر ستون‌ها تبدیل می‌شود
+    - status_encoder: تغییرات STATUS_NODES در فایل همراه <file>.status.csv
+    - index: DataIndex که با بسته شدن هر فایل به‌روز می‌شود
+    نام فایل‌ها: opc_data_<timestamp>.csv (یا opc_data_<name>_<timestamp>.csv)
+    """
+    
+    extension = ".csv"
+    
+    def __init__(self, folder, fieldnames=None, name=None,
+                 rotate_seconds=SAVE_INTERVAL, rotate_bytes=ROTATE_BYTES,
+                 flush_interval=FLUSH_INTERVAL, fsync=FSYNC_ON_FLUSH,
+                 status_encoder=None, index=None):
+        self.folder = folder
+        self.fieldnames = fieldnames or csv_fieldnames()
+        self.name = name
+        self.rotate_seconds = rotate_seconds
+        self.rotate_bytes = rotate_bytes
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.status_encoder = status_encoder
+        self.index = index
+        self.summary = None
+        self.files = 0
+        self.path = None
+        self.rows = 0
+        self.last_write = None
+        self._file = None
+        self._writer = None
+    
+    def _new_path(self, first_time):
+        timestamp = datetime.fromtimestamp(first_time).strftime('%Y%m%d_%H%M%S')
+        base = f"opc_data_{self.name}_{timestamp}" if self.name else f"opc_data_{timestamp}"
+        path = os.path.join(self.folder, base + self.extension)
+        suffix = 1
+        while os.path.exists(path):
+            path = os.path.join(self.folder, f"{base}_{suffix}{self.extension}")
+            suffix += 1
+        return path
+    
+    def _open(self, first_time):
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+            logger.info(f"✓ Created folder: {self.folder}")
+        self.path = self._new_path(first_time)
+        self._open_file()
+        self.opened = time.time()
+        self.last_flush = self.opened
+        self.rows = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.summary = FileSummary(self.path, 'opc', self.fieldnames[1:])
+        logger.info(f"[File #{self.files + 1}] Writing to: {self.path}")
+    
+    def _open_file(self):
+        self._file = open(self.path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.fieldnames)
+    
+    def _write_store(self, store):
+        store.to_csv(self._file, header=False)
+    
+    def _check_rotation(self, now):
+        if (now - self.opened >= self.rotate_seconds or
+                (self.rotate_bytes and self._file.tell() >= self.rotate_bytes)):
+            self.close()
+    
+    def ensure_open(self, first_time):
+        """
+        باز کردن فایل جدید با رسیدن اولین ردیف (اگر فایلی باز نیست)
+        نام فایل از زمان همان ردیف (epoch) ساخته می‌شود
+        """
+        if self._file is None:
+            self._open(first_time)
+            if self.status_encoder is not None:
+                self.status_encoder.open(self.path, first_time)
+    
+    def write_store(self, store):
+        """نوشتن همه نمونه‌های یک OpcSampleStore و flush فایل"""
+        if not len(store):
             return
+        self.ensure_open(store.times[0])
+        offset = self._file.tell() if self.summary.wants_mark() else None
+        self._write_store(store)
+        self.summary.add(store.times[0], store.times[len(store) - 1], len(store),
+                         offset=offset)
+        if self.status_encoder is not None:
+            self.status_encoder.flush()
+        self.rows += len(store)
+        first, last = store.times[0], store.times[len(store) - 1]
+        if self.first_timestamp is None:
+            self.first_timestamp = datetime.fromtimestamp(first).strftime('%Y-%m-%d %H:%M:%S')
+        self.last_timestamp = datetime.fromtimestamp(last).strftime('%Y-%m-%d %H:%M:%S')
+        now = time.time()
+        self.flush()
+        self.last_flush = now
+        self.last_write = now
+        self._check_rotation(now)
+    
+    def write(self, data):
+        """نوشتن یک ردیف (dict خوانده شده) در فایل جاری"""
+        timestamp = data.get('timestamp')
+        self.ensure_open(parse_timestamp(timestamp))
+        offset = self._file.tell() if self.summary.wants_mark() else None
+        self.summary.add(parse_timestamp(timestamp), parse_timestamp(timestamp), 1,
+                         offset=offset)
+        self._writer.writerow([data.get(key, '') for key in self.fieldnames])
+        self.rows += 1
+        if self.status_encoder is not None:
+            self.status_encoder.record(parse_timestamp(timestamp),
+                                       [data.get(name, '') for name in self.status_encoder.names])
+            self.status_encoder.flush()
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+        self.last_timestamp = timestamp
         
-        first_timestamp = data_list[0].get('timestamp', '')
-        last_timestamp = data_list[-1].get('timestamp', '')
-        logger.info(f"✓ Data saved to {csv_file}")
-        logger.info(f"  Rows: {len(data_list)} (from {first_timestamp} to {last_timestamp})\n")
-        
-    except Exception as e:
-        logger.error(f"ERROR saving file: {str(e)}")
-        logger.error(traceback.format_exc())
+        now = time.time()
+        self.last_write = now
+        if now - self.last_flush >= self.flush_interval:
+            self.flush()
+            self.last_flush = now
+        self._check_rotation(now)
+    
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+    
+    def close(self):
+        """بستن فایل جاری (ردیف بعدی فایل جدید باز می‌کند)"""
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        if self.status_encoder is not None:
+            self.status_encoder.close()
+        if self.index is not None:
+            try:
+                self.index.add(self.summary)
+            except Exception as e:
+                logger.warning(f"Index update failed: {str(e)}")
+        self.files += 1
+        file_size = os.path.getsize(self.path)
+        logger.info(f"✓ Data saved to {self.path} ({file_size} bytes)")
+        logger.info(f"  Rows: {self.rows} (from {self.first_timestamp} to {self.last_timestamp})\n")
+
+class StreamingBinaryWriter(StreamingCsvWriter):
+    """
+    همان چرخش و flush با خروجی ستونی باینری (opc_data_<timestamp>.bin)
+    - write (یک ردیف dict): ردیف‌ها در یک OpcSampleStore جمع و هر flush_interval
+      (یا با پر شدن آن) به صورت یک chunk نوشته می‌شوند
+    خواندن: binary_records.read_records - خطاها در <file>.errors
+    """
+    
+    extension = ".bin"
+    
+    def __init__(self, *args, **kwargs):
+        super(StreamingBinaryWriter, self).__init__(*args, **kwargs)
+        self._rows = None
+    
+    def _open_file(self):
+        self._file = open_binary(self.path, self.fieldnames[1:], {"source": OPC_URL})
+    
+    def _write_store(self, store):
+        store.to_binary(self._file)
+    
+    def _check_rotation(self, now):
+        if (now - self.opened >= self.rotate_seconds or
+                (self.rotate_bytes and os.path.getsize(self.path) >= self.rotate_bytes)):
+            self.close()
+    
+    def write(self, data):
+        """نوشتن یک ردیف (dict خوانده شده) - تا flush بعدی در حافظه ستونی"""
+        timestamp = parse_timestamp(data.get('timestamp'))
+        if self._rows is None:
+            self._rows = OpcSampleStore(self.fieldnames[1:], capacity=STORE_CAPACITY)
+        self.ensure_open(timestamp)
+        if self.status_encoder is not None:
+            self.status_encoder.record(timestamp,
+                                       [data.get(name, '') for name in self.status_encoder.names])
+        self._rows.append(timestamp, [data.get(key, '') for key in self.fieldnames[1:]])
+        if self._rows.full or time.time() - self.last_flush >= self.flush_interval:
+            self._write_rows()
+    
+    def _write_rows(self):
+        # write_store ممکن است فایل را بچرخاند (close) - ردیف‌ها فقط یکبار نوشته می‌شوند
+        rows, self._rows = self._rows, None
+        if rows is None:
+            return
+        try:
+            self.write_store(rows)
+        finally:
+            rows.clear()
+            self._rows = rows
+    
+    def close(self):
+        """نوشتن ردیف‌های جمع شده و بستن فایل جاری"""
+        self._write_rows()
+        super(StreamingBinaryWriter, self).close()
 
 def main():
     """تابع اصلی"""
+    setup_logging()
     logger.info("=" * 70)
     logger.info("Starting OPC UA Data Logger...")
     logger.info(f"Connecting to: {OPC_URL}")
     logger.info(f"Username: {OPC_USERNAME}")
-    logger.info(f"Monitoring {len(NODES)} indexed nodes and {len(STATUS_NODES)} status nodes")
+    logger.info(f"Monitoring {len(NODES)} indexed nodes and {len(STATUS_NODES)} status nodes ({STATUS_MODE})")
     logger.info(f"Sample rate: Every {READ_INTERVAL} seconds")
     logger.info(f"Saving interval: Every {SAVE_INTERVAL} seconds")
     logger.info("=" * 70)
@@ -233,16 +559,15 @@ def main():
         logger.error(traceback.format_exc())
         return
     
-    file_count = 0
     client = None
+    status_handler = None
+    if STATUS_MODE == "subscribe":
+        status_handler = StatusChangeHandler(StatusChangeLog(DATA_FOLDER))
     
     try:
         # اتصال یکبار در شروع
         logger.info("\nConnecting to OPC UA server...")
-        client = Client(OPC_URL)
-        client.set_user(OPC_USERNAME)
-        client.set_password(OPC_PASSWORD)
-        client.connect()
+        client = connect_client(status_handler)
         logger.info("✓ Connected successfully!\n")
         
     except Exception as e:
@@ -250,71 +575,96 @@ def main():
         logger.error(traceback.format_exc())
         return
     
+    # نمونه‌ها در حافظه ستونی جمع و هر FLUSH_INTERVAL در فایل نوشته می‌شوند (حافظه ثابت)
+    encoder = status_encoder()
+    store = OpcSampleStore(csv_fieldnames()[1:], capacity=STORE_CAPACITY)
+    if OUTPUT_FORMAT == "binary":
+        data_writer = StreamingBinaryWriter(DATA_FOLDER, status_encoder=encoder,
+                                            index=data_index())
+    else:
+        data_writer = StreamingCsvWriter(DATA_FOLDER, status_encoder=encoder,
+                                         index=data_index())
+    last_flush = time.time()
+    samples = 0
+    connection_errors = 0
+    # وضعیت برای start.py (بدون start.py کاری انجام نمی‌دهد)
+    heartbeat = Heartbeat.from_env()
+    bus = live_ring()
+    
     try:
         while True:
-            logger.info(f"\n[File #{file_count + 1}] Reading data continuously...")
-            
-            # خواندن پیوسته با sample rate بالا تا زمان ذخیره
-            start_time = time.time()
-            all_data = []  # لیست همه داده‌های خوانده شده
-            connection_errors = 0
-            
-            while (time.time() - start_time) < SAVE_INTERVAL:
-                data = read_opcua_data(client)
-                
-                # بررسی خطای اتصال
-                connection_error = data.get("Connection", "")
-                if connection_error and "Error:" in str(connection_error):
-                    connection_errors += 1
-                    logger.warning(f"Read error (attempt {connection_errors}): {connection_error}")
-                    # سعی مجدد برای اتصال
-                    try:
-                        client.disconnect()
-                        time.sleep(2)
-                        client = Client(OPC_URL)
-                        client.set_user(OPC_USERNAME)
-                        client.set_password(OPC_PASSWORD)
-                        client.connect()
-                        logger.info("✓ Reconnected successfully")
-                    except Exception as e:
-                        logger.error(f"Reconnection failed: {str(e)}")
-                else:
-                    # اضافه کردن timestamp به داده
-                    data['timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    # اضافه کردن داده به لیست
-                    all_data.append(data)
-                    elapsed = int(time.time() - start_time)
-                    remaining = SAVE_INTERVAL - elapsed
-                    if len(all_data) % 5 == 0:  # لاگ هر 5 ثانیه
-                        logger.info(f"Data read OK. Time: {elapsed}s / {SAVE_INTERVAL}s - Samples: {len(all_data)}")
-                
-                # صبر قبل از خواندن بعدی (sample rate)
-                time.sleep(READ_INTERVAL)
+            cycle_start = time.time()
+            try:
+                cells, status_changed = read_opcua_row(client)
+            except Exception as read_error:
+                # خطای اتصال
+                connection_errors += 1
+                logger.warning(f"Read error (attempt {connection_errors}): Error: {str(read_error)}")
+                logger.debug(traceback.format_exc())
+                # سعی مجدد برای اتصال
+                try:
+                    client.disconnect()
+                    time.sleep(2)
+                    client = connect_client(status_handler)
+                    logger.info("✓ Reconnected successfully")
+                except Exception as e:
+                    logger.error(f"Reconnection failed: {str(e)}")
+            else:
+                if bus is not None:
+                    publish_row(bus, cells)
+                if encoder is not None:
+                    # فقط NODES در فایل داده؛ STATUS_NODES به صورت تغییرات
+                    encoder.record(cycle_start, cells[len(NODES):])
+                    cells = cells[:len(NODES)]
+                store.append(cycle_start, cells)
+                # فایل با اولین ردیف باز می‌شود (نه با اولین flush)
+                data_writer.ensure_open(cycle_start)
+                samples += 1
+                if samples % 5 == 0:  # لاگ هر 5 نمونه
+                    logger.info(f"Data read OK. Samples: {samples} (file rows: {data_writer.rows + len(store)})")
             
-            # ذخیره همه داده‌های خوانده شده
-            if all_data:
+            # نوشتن نمونه‌های جمع شده در فایل
+            if store.full or time.time() - last_flush >= FLUSH_INTERVAL:
                 try:
-                    save_to_csv(all_data)
-                    file_count += 1
-                    logger.info(f"Waiting {SAVE_INTERVAL} seconds until next save...\n")
+                    data_writer.write_store(store)
                 except Exception as save_error:
                     logger.error(f"Error saving file: {str(save_error)}")
                     logger.error(traceback.format_exc())
-                    logger.info(f"Retrying in {SAVE_INTERVAL} seconds...\n")
-            else:
-                logger.warning(f"No valid data to save. Retrying in {SAVE_INTERVAL} seconds...\n")
+                store.clear()
+                last_flush = time.time()
+            
+            heartbeat.beat(samples=samples, queue_depth=len(store),
+                           last_write=data_writer.last_write,
+                           connection_errors=connection_errors)
+            
+            # صبر قبل از خواندن بعدی (sample rate) - زمان خواندن کم می‌شود
+            time.sleep(max(0.0, READ_INTERVAL - (time.time() - cycle_start)))
             
     except KeyboardInterrupt:
         logger.info("\nStopping data logger...")
-        logger.info(f"Total {file_count} file(s) created during this session")
-        logger.info("=" * 70)
     finally:
+        # آخرین نمونه‌ها فقط یکبار نوشته و فایل بسته می‌شود
+        try:
+            data_writer.write_store(store)
+            store.clear()
+        finally:
+            data_writer.close()
+        logger.info(f"Total {data_writer.files} file(s) created during this session")
+        logger.info("=" * 70)
         if client is not None:
             try:
                 client.disconnect()
                 logger.info("✓ Disconnected from OPC UA server")
             except:
                 pass
+        if status_handler is not None:
+            status_handler.change_log.close()
+        if bus is not None:
+            bus.close()
 
 if __name__ == '__main__':
-    main()
+    if ENGINE == "async":
+        import opc_async
+        opc_async.main()
+    else:
+        main()
@@ -0,0 +1,49 @@
+"""
+OPC UA nodes read by the loggers
+لیست نودهای OPC UA (بدون اثر جانبی در import)
+
+Used by opc_logger.py / opc_async.py and by sim_opc_server.py, which must
+not pull in the logger's logging setup.
+"""
+
+# تابع برای ساخت نودهای اندیس‌دار
+def make_indexed_nodes(base_name, count):
+    """
+    ساخت نودهای اندیس‌دار (از 1 شروع می‌شود)
+    مثال: make_indexed_nodes("vaPower", 6) 
+    نودهای vaPower[1] تا vaPower[6] را می‌سازد
+    """
+    nodes = {}
+    for i in range(1, count + 1):
+        node_name = f"{base_name}[{i}]"
+        # ساخت NodeId بر اساس الگوی Sinumerik
+        node_id = f"ns=2;s=/Nck/MachineAxis/{base_name}[{i}]"
+        nodes[node_name] = node_id
+    return nodes
+
+# ساخت NODES با استفاده از make_indexed_nodes
+NODES = {}
+NODES.update(make_indexed_nodes("vaPower", 6))
+NODES.update(make_indexed_nodes("vaCurr", 6))
+NODES.update(make_indexed_nodes("aaTorque", 6))
+NODES.update(make_indexed_nodes("aaDtbb", 6))
+NODES.update(make_indexed_nodes("cmdSpeedRel", 6))
+
+# Status nodes (only saved when value changes)
+STATUS_NODES = {
+    "channelNo": "ns=2;s=/Nck/LogicalSpindle/channelNo",
+    "speedOvr": "ns=2;s=/Nck/LogicalSpindle/speedOvr",
+    "spindleType": "ns=2;s=/Nck/LogicalSpindle/spindleType",
+    "status_LogicalSpindle": "ns=2;s=/Nck/LogicalSpindle/status",
+    "paramSetNo": "ns=2;s=/Nck/MachineAxis/paramSetNo",
+    "status_Spindle": "ns=2;s=/Nck/Spindle/status",
+    "progEvent": "ns=2;s=/Channel/State/progEvent",
+    "progStatus": "ns=2;s=/Channel/State/progStatus",
+    "actFeedRate": "ns=2;s=/Nck/MachineAxis/actFeedRate",
+    "cmdFeedRate": "ns=2;s=/Nck/MachineAxis/cmdFeedRate",
+    "cmdSpeedRel": "ns=2;s=/Nck/MachineAxis/cmdSpeedRel",
+    "actParts": "ns=2;s=/Channel/State/actParts",
+    "MachiningTimeRecording": "ns=2;s=/Hmi/MachiningTimeRecording",
+    "toolNo": "ns=2;s=/Tool/Catalogue/toolNo",
+    "actSpeed": "ns=2;s=/Channel/Spindle/actSpeed",
+}
@@ -0,0 +1,231 @@
+"""
+Change-only encoding for OPC UA status columns
+ذخیره STATUS_NODES فقط هنگام تغییر
+
+The status columns (toolNo, progStatus, channelNo, ...) change a few times
+per hour but were repeated on every row. In "changes" mode the dense data
+file (opc_data_<timestamp>.csv / .bin) holds only the high-rate NODES
+columns, and each data file gets a companion ``<file>.status.csv`` with
+change records::
+
+    timestamp,name,value
+
+The first records of every companion file are a snapshot of all status
+values, so each file pair can be decoded on its own. :py:func:`load_dense`
+rebuilds the full dense table (NODES + status columns) for any time range.
+
+Command line:
+    python opc_status.py "2026-01-12 10:03" "2026-01-12 10:07" -o merged.csv
+"""
+import argparse
+import bisect
+import csv
+import math
+import os
+import re
+from datetime import datetime
+
+from binary_records import read_records, data_exists, data_files, open_data
+from opc_store import OpcSampleStore, read_errors
+
+STATUS_SUFFIX = ".status.csv"
+_FILE_TIME = re.compile(r"opc_data_(?:.+_)?(\d{8}_\d{6})(?:_\d+)?\.(csv|bin)$")
+
+
+def format_timestamp(epoch):
+    return datetime.fromtimestamp(epoch).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+
+def parse_timestamp(text):
+    """timestamp ردیف‌ها (با یا بدون میلی‌ثانیه) به epoch"""
+    for fmt in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M'):
+        try:
+            return datetime.strptime(text, fmt).timestamp()
+        except ValueError:
+            pass
+    raise ValueError(f"Error: invalid timestamp {text!r}")
+
+
+class StatusChangeEncoder(object):
+    """
+    Track status values and write only their changes.
+
+    Changes are buffered by :py:meth:`record` and written by :py:meth:`flush`
+    together with the dense rows they belong to, so a file rotation never
+    splits them from their data.
+
+    Args:
+        names (list): Status column names, in file order.
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.current = {}
+        self._flushed = {}
+        self._pending = []
+        self._file = None
+        self._writer = None
+        self.changes = 0
+
+    def record(self, timestamp, values):
+        """Compare one sample's status values with the last ones."""
+        for name, value in zip(self.names, values):
+            if name not in self.current or self.current[name] != value:
+                self.current[name] = value
+                self._pending.append((timestamp, name, value))
+
+    def open(self, data_path, first_timestamp):
+        """Start the companion file of a new data file with a snapshot."""
+        self.close()
+        self._file = open(data_path + STATUS_SUFFIX, 'w', newline='',
+                          encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(['timestamp', 'name', 'value'])
+        stamp = format_timestamp(first_timestamp)
+        self._writer.writerows([stamp, name, self._flushed[name]]
+                               for name in self.names if name in self._flushed)
+
+    def flush(self):
+        """Write the buffered change records."""
+        if self._writer is not None and self._pending:
+            self._writer.writerows([format_timestamp(t), name, value]
+                                   for t, name, value in self._pending)
+            self.changes += len(self._pending)
+        for _, name, value in self._pending:
+            self._flushed[name] = value
+        self._pending = []
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+        self._file = None
+        self._writer = None
+
+
+def file_start_time(path):
+    """زمان شروع فایل از نام آن (opc_data_YYYYmmdd_HHMMSS)"""
+    match = _FILE_TIME.search(os.path.basename(path))
+    if not match:
+        return None
+    return datetime.strptime(match.group(1), '%Y%m%d_%H%M%S').timestamp()
+
+
+def select_files(folder, start, end):
+    """فایل‌های داده‌ای که بازه [start, end] را پوشش می‌دهند (به ترتیب زمان)"""
+    files = []
+    for name, path in data_files(folder):
+        t = file_start_time(name) if name.startswith("opc_data_") else None
+        if t is not None:
+            files.append((t, path))
+    files.sort()
+    times = [t for t, _ in files]
+    # نام فایل زمان اولین ردیف آن است، پس فایل قبل از start هم خوانده می‌شود؛
+    # فایل‌های قدیمی‌تر با زمان اولین flush نام‌گذاری شده‌اند (تا FLUSH_INTERVAL
+    # بعد از اولین ردیف) و یک فایل بعد از بازه هم خوانده می‌شود
+    first = max(0, bisect.bisect_right(times, start) - 1)
+    last = bisect.bisect_right(times, end) + 1
+    return [path for _, path in files[first:last]]
+
+
+def _cell(text):
+    """متن CSV به عدد (در صورت امکان)"""
+    for kind in (int, float):
+        try:
+            return kind(text)
+        except ValueError:
+            pass
+    return text
+
+
+def read_dense(path, start, end):
+    """ردیف‌های یک فایل داده: (columns, [(epoch, cells), ...])"""
+    rows = []
+    if path.endswith('.bin'):
+        meta, records = read_records(path)
+        columns = meta['columns']
+        errors = {(t, column): text for t, column, text in read_errors(path)}
+        for record in records[(records['t'] >= start) & (records['t'] <= end)]:
+            t = float(record['t'])
+            rows.append((t, [errors.get((t, column), math.nan) if record[column] != record[column]
+                             else float(record[column]) for column in columns]))
+        return columns, rows
+    with open_data(path, text=True) as f:
+        reader = csv.reader(f)
+        columns = next(reader)[1:]
+        for line in reader:
+            t = parse_timestamp(line[0])
+            if start <= t <= end:
+                rows.append((t, [_cell(text) for text in line[1:]]))
+    return columns, rows
+
+
+def read_status(path):
+    """رکوردهای تغییر وضعیت فایل همراه: [(epoch, name, value), ...]"""
+    status_path = path + STATUS_SUFFIX
+    if not data_exists(status_path):
+        return []
+    with open_data(status_path, text=True) as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        return [(parse_timestamp(t), name, _cell(value)) for t, name, value in reader]
+
+
+def load_dense(folder, start, end, capacity=None):
+    """
+    Rebuild the full dense table (data + status columns) for a time range.
+
+    Args:
+        folder (str): Folder with opc_data files and their status companions.
+        start (float): Range start (epoch seconds).
+        end (float): Range end (epoch seconds).
+        capacity (int): Store size; defaults to the number of rows found.
+
+    Returns:
+        OpcSampleStore: Rows in time order, status values forward-filled.
+    """
+    columns, rows, changes, status_names = None, [], [], []
+    for path in select_files(folder, start, end):
+        file_columns, file_rows = read_dense(path, start, end)
+        columns = columns or file_columns
+        rows.extend(file_rows)
+        for record in read_status(path):
+            changes.append(record)
+            if record[1] not in status_names:
+                status_names.append(record[1])
+    # فایل‌هایی که ستون وضعیت را خودشان دارند (حالت dense) تغییری ندارند
+    status_names = [name for name in status_names if name not in (columns or [])]
+    rows.sort(key=lambda row: row[0])
+    changes.sort(key=lambda change: change[0])
+
+    store = OpcSampleStore((columns or []) + status_names,
+                           capacity=capacity or max(1, len(rows)))
+    state = dict.fromkeys(status_names, '')
+    index = 0
+    for t, cells in rows:
+        while index < len(changes) and changes[index][0] <= t:
+            _, name, value = changes[index]
+            state[name] = value
+            index += 1
+        store.append(t, list(cells) + [state[name] for name in status_names])
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rebuild dense OPC data (with status columns) for a time range")
+    parser.add_argument("start", help="e.g. '2026-01-12 10:03'")
+    parser.add_argument("end", help="e.g. '2026-01-12 10:07'")
+    parser.add_argument("--folder", default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "opc data"))
+    parser.add_argument("-o", "--output", default="opc_dense.csv")
+    args = parser.parse_args()
+    store = load_dense(args.folder, parse_timestamp(args.start),
+                       parse_timestamp(args.end))
+    store.to_csv(args.output)
+    print(f"{len(store)} rows written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
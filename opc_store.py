@@ -0,0 +1,177 @@
+"""
+Typed columnar sample store for OPC UA data
+ذخیره ستونی نمونه‌های OPC UA به جای لیست dict ها
+
+Samples are kept in preallocated NumPy arrays with a fixed column order
+(NODES then STATUS_NODES): one float64 timestamp per row and one float64
+value per cell. Cells that are not numbers (``Error: ...`` texts or any
+other non-numeric value) are stored as NaN in the value array plus an entry
+in a small sparse table keyed by (row, column); missing cells (None or
+'') get an empty entry there, so a NaN value read from the server stays
+distinct from a missing one and is written as ``nan``.
+
+A chunk can be exported to CSV (same layout as the existing opc_data files)
+or appended to a binary columnar file (:py:mod:`binary_records`).
+"""
+import csv
+import math
+from datetime import datetime
+
+import numpy as np
+
+from binary_records import RecordWriter, data_exists, open_data
+
+
+class OpcSampleStore(object):
+    """
+    Fixed-capacity columnar buffer of OPC UA samples.
+
+    Args:
+        columns (list): Column names, in file order (without timestamp).
+        capacity (int): Number of rows preallocated.
+    """
+
+    def __init__(self, columns, capacity=1024):
+        self.columns = list(columns)
+        self.capacity = int(capacity)
+        self.times = np.empty(self.capacity, dtype=np.float64)
+        self.values = np.empty((self.capacity, len(self.columns)),
+                               dtype=np.float64)
+        # Columns that received Python ints / bools are written back as such
+        self.int_columns = np.zeros(len(self.columns), dtype=bool)
+        self.bool_columns = np.zeros(len(self.columns), dtype=bool)
+        self.text = {}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def full(self):
+        return self.size >= self.capacity
+
+    def clear(self):
+        """Drop all rows (the arrays are reused)."""
+        self.size = 0
+        self.text.clear()
+
+    def append(self, timestamp, cells):
+        """
+        Add one sample.
+
+        Args:
+            timestamp (float): Epoch seconds.
+            cells (sequence): One value per column, in column order.
+
+        Raises:
+            IndexError: The store is full.
+        """
+        if self.size >= self.capacity:
+            raise IndexError('Error: sample store is full')
+        row = self.size
+        values = self.values[row]
+        for col, cell in enumerate(cells):
+            # bool is a subclass of int - check it first
+            if isinstance(cell, bool):
+                values[col] = cell
+                self.bool_columns[col] = True
+            elif isinstance(cell, (int, float)):
+                values[col] = cell
+                if not isinstance(cell, float):
+                    self.int_columns[col] = True
+            else:
+                values[col] = math.nan
+                self.text[(row, col)] = '' if cell is None else str(cell)
+        self.times[row] = timestamp
+        self.size += 1
+
+    def nbytes(self):
+        """Approximate memory used by the stored rows."""
+        per_row = self.times.itemsize + self.values.itemsize * len(self.columns)
+        return per_row * self.size + 100 * len(self.text)
+
+    def _cell(self, row, col, value):
+        if value != value:  # NaN: text, missing ('') or a real NaN value
+            return self.text.get((row, col), value)
+        if self.bool_columns[col]:
+            return bool(value)
+        if self.int_columns[col] and value.is_integer():
+            return int(value)
+        return value
+
+    def rows(self):
+        """Yield ``[timestamp_text, cell, ...]`` rows as in the CSV files."""
+        values = self.values[:self.size].tolist()
+        for row in range(self.size):
+            stamp = datetime.fromtimestamp(self.times[row]).strftime(
+                '%Y-%m-%d %H:%M:%S.%f')[:-3]
+            yield [stamp] + [self._cell(row, col, value)
+                             for col, value in enumerate(values[row])]
+
+    def to_csv(self, file, header=True):
+        """
+        Write the rows to an open text file (or a path).
+
+        Returns:
+            int: Number of rows written.
+        """
+        if isinstance(file, str):
+            with open(file, 'w', newline='', encoding='utf-8') as f:
+                return self.to_csv(f, header)
+        writer = csv.writer(file)
+        if header:
+            writer.writerow(['timestamp'] + self.columns)
+        writer.writerows(self.rows())
+        return self.size
+
+    def record_dtype(self):
+        """Binary record type: t + one float64 field per column."""
+        return np.dtype([('t', '<f8')] + [(name, '<f8') for name in self.columns])
+
+    def to_records(self):
+        """Rows as a NumPy structured array (:py:meth:`record_dtype`)."""
+        records = np.empty(self.size, dtype=self.record_dtype())
+        records['t'] = self.times[:self.size]
+        # The value columns are contiguous after 't' - fill them in one copy
+        view = records.view(np.float64).reshape(self.size, -1)
+        view[:, 1:] = self.values[:self.size]
+        return records
+
+    def to_binary(self, writer):
+        """
+        Append the rows to a binary record file.
+
+        Args:
+            writer (RecordWriter): Open writer with :py:meth:`record_dtype`.
+                Non-numeric cells are appended to ``<file>.errors`` as
+                ``t,column,text`` lines (empty text: missing cell; NaN
+                without a line: NaN value).
+
+        Returns:
+            int: Number of rows written.
+        """
+        writer.append(self.to_records())
+        if self.text:
+            with open(writer.path + '.errors', 'a', newline='',
+                      encoding='utf-8') as f:
+                csv.writer(f).writerows(
+                    [repr(float(self.times[row])), self.columns[col], text]
+                    for (row, col), text in sorted(self.text.items()))
+        return self.size
+
+
+def open_binary(path, columns, meta=None):
+    """Create (or reopen for appending) a binary columnar OPC file."""
+    store = OpcSampleStore(columns, capacity=0)
+    meta = dict(meta or {})
+    meta.setdefault('columns', list(columns))
+    return RecordWriter(path, store.record_dtype(), meta)
+
+
+def read_errors(path):
+    """Read the sparse ``<file>.errors`` table of a binary OPC file."""
+    errors_path = path + '.errors'
+    if not data_exists(errors_path):
+        return []
+    with open_data(errors_path, text=True) as f:
+        return [(float(t), column, text) for t, column, text in csv.reader(f)]
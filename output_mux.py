@@ -0,0 +1,226 @@
+"""
+Non-blocking output multiplexer for the launcher (start.py)
+خواندن خروجی همه‌ی processes بدون مسدود کردن آن‌ها
+
+Every child's stdout pipe is drained continuously, so a child never blocks
+on a full pipe. Each line is prefixed with a timestamp and the child name,
+written to a rotating log file per child (logs/<key>.log) and printed to
+the console. A token bucket per child limits the lines printed per
+second; the log file still gets every line. Lines over the limit are
+counted, and the count is printed once the child is below the limit
+again.
+
+POSIX uses one ``selectors`` loop in the launcher thread. Windows pipes
+can't be selected, so there each pipe gets a small reader thread that
+feeds a queue.
+"""
+import logging
+import os
+import queue
+import selectors
+import threading
+import time
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+# چرخش فایل لاگ هر process
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
+# حداکثر خطوط چاپ شده در کنسول در ثانیه برای هر process (و تعداد مجاز پشت سر هم)
+# فایل لاگ همه خطوط را دارد
+LINE_RATE = 50
+LINE_BURST = 200
+
+READ_SIZE = 65536
+USE_SELECTORS = os.name != 'nt'
+
+
+class TokenBucket(object):
+    """محدودیت نرخ: rate توکن در ثانیه، حداکثر burst توکن"""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class ChildOutput(object):
+    """خروجی یک process: بافر خط ناقص، فایل لاگ و محدودیت نرخ کنسول"""
+
+    def __init__(self, key, name, log_dir, echo=True,
+                 rate=LINE_RATE, burst=LINE_BURST):
+        self.key = key
+        self.name = name
+        self.echo = echo
+        self.bucket = TokenBucket(rate, burst)
+        self.partial = b''
+        self.lines = 0
+        self.suppressed = 0
+        self._pending_suppressed = 0
+        os.makedirs(log_dir, exist_ok=True)
+        self.log = logging.getLogger(f"output_mux.{key}")
+        self.log.propagate = False
+        self.log.setLevel(logging.INFO)
+        if not self.log.handlers:
+            handler = RotatingFileHandler(os.path.join(log_dir, f"{key}.log"),
+                                          maxBytes=LOG_MAX_BYTES,
+                                          backupCount=LOG_BACKUP_COUNT,
+                                          encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.log.addHandler(handler)
+
+    def feed(self, data):
+        """داده‌ی خام pipe - خطوط کامل پردازش می‌شوند"""
+        data = self.partial + data
+        # \r هم پایان خط است (خطوط progress)
+        lines = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n').split(b'\n')
+        self.partial = lines.pop()
+        for line in lines:
+            self.emit(line)
+
+    def finish(self):
+        """EOF: خط ناقص باقیمانده هم نوشته می‌شود"""
+        if self.partial:
+            self.emit(self.partial)
+            self.partial = b''
+        self._report_suppressed()
+
+    def emit(self, raw):
+        text = raw.decode('utf-8', errors='replace').rstrip()
+        if not text:
+            return
+        self.lines += 1
+        line = self._format(text)
+        # فایل لاگ همه خطوط را می‌گیرد، فقط کنسول محدود می‌شود
+        self.log.info(line)
+        if not self.echo:
+            return
+        if not self.bucket.take():
+            self.suppressed += 1
+            self._pending_suppressed += 1
+            return
+        self._report_suppressed()
+        print(line, flush=True)
+
+    def _report_suppressed(self):
+        if self._pending_suppressed:
+            count, self._pending_suppressed = self._pending_suppressed, 0
+            print(self._format(f"... {count} line(s) not shown (console rate limit "
+                               f"{self.bucket.rate:g}/s, all in the log file)"), flush=True)
+
+    def _format(self, text):
+        return f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}] [{self.name}] {text}"
+
+    def close(self):
+        for handler in list(self.log.handlers):
+            handler.close()
+            self.log.removeHandler(handler)
+
+
+class OutputMultiplexer(object):
+    """
+    Drain the stdout pipes of several child processes.
+
+    Args:
+        log_dir (str): Folder for the per-child rotating log files.
+        echo (bool): Also print the prefixed lines to the console.
+    """
+
+    def __init__(self, log_dir, echo=True):
+        self.log_dir = log_dir
+        self.echo = echo
+        self.outputs = {}
+        if USE_SELECTORS:
+            self._selector = selectors.DefaultSelector()
+        else:
+            self._queue = queue.Queue()
+
+    def add(self, process, key, name):
+        """ثبت pipe خروجی یک process (Popen با stdout=PIPE در حالت باینری)"""
+        output = self.outputs.get(key)
+        if output is None:
+            output = ChildOutput(key, name, self.log_dir, self.echo)
+            self.outputs[key] = output
+        pipe = process.stdout
+        if USE_SELECTORS:
+            os.set_blocking(pipe.fileno(), False)
+            self._selector.register(pipe, selectors.EVENT_READ, output)
+        else:
+            threading.Thread(target=self._reader, args=(pipe, output),
+                             name=f"output-{key}", daemon=True).start()
+
+    def _reader(self, pipe, output):
+        # فقط در Windows: خواندن blocking در thread جداگانه
+        while True:
+            data = pipe.read1(READ_SIZE) if hasattr(pipe, 'read1') else pipe.read(READ_SIZE)
+            self._queue.put((output, data))
+            if not data:
+                pipe.close()
+                return
+
+    def poll(self, timeout=1.0):
+        """
+        Handle all available output, waiting at most ``timeout`` seconds.
+
+        Returns:
+            int: Number of bytes read.
+        """
+        total = 0
+        if USE_SELECTORS:
+            for key, _ in self._selector.select(timeout):
+                output = key.data
+                try:
+                    data = os.read(key.fd, READ_SIZE)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    data = b''
+                if data:
+                    output.feed(data)
+                    total += len(data)
+                else:
+                    self._selector.unregister(key.fileobj)
+                    key.fileobj.close()
+                    output.finish()
+            return total
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                output, data = self._queue.get(
+                    timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                return total
+            if data:
+                output.feed(data)
+                total += len(data)
+            else:
+                output.finish()
+            if time.monotonic() >= deadline:
+                return total
+
+    def drain(self, timeout=1.0):
+        """خواندن خروجی باقیمانده (مثلاً بعد از توقف processes)"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and self.poll(0.05):
+            pass
+
+    def close(self):
+        if USE_SELECTORS:
+            for key in list(self._selector.get_map().values()):
+                self._selector.unregister(key.fileobj)
+                key.fileobj.close()
+            self._selector.close()
+        for output in self.outputs.values():
+            output.finish()
+            output.close()
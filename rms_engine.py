@@ -0,0 +1,267 @@
+"""
+    Vectorized RMS engine for the MCC118 current logger.
+
+    Each block returned by ``a_in_scan_read_numpy`` is processed in one pass:
+    the interleaved samples are de-interleaved into a (samples, channels)
+    array, reshaped into all complete RMS windows at once and the RMS, peak
+    and minimum of every window and channel are computed together. Samples
+    that do not fill a complete window are kept in a preallocated carry
+    buffer and prepended to the next block.
+"""
+import numpy as np
+
+
+class BlockRmsEngine(object):
+    """
+    Windowed RMS / peak / min over a continuous stream of scan blocks.
+
+    Args:
+        window (int): Number of samples (per channel) per RMS window.
+        scale (float or sequence): Factor applied to the results (e.g.
+            volts -> amps), either one value or one value per channel.
+        channels (int): Number of channels interleaved in each block.
+        capacity (int): Initial size of the work buffer in samples per
+            channel. The buffer grows only if a block larger than
+            ``capacity - window`` arrives.
+    """
+
+    def __init__(self, window, scale=1.0, channels=1, capacity=4096):
+        if window < 1:
+            raise ValueError('Error: RMS window must be at least 1 sample')
+        self.window = int(window)
+        self.channels = int(channels)
+        self.scale = np.broadcast_to(
+            np.asarray(scale, dtype=np.float64), (self.channels,)).copy()
+        # The head of the work buffer is the carry buffer: leftover samples
+        # from the previous block live in _work[:_carry_len].
+        self._work = np.empty((max(int(capacity), 2 * self.window),
+                               self.channels), dtype=np.float64)
+        self._carry_len = 0
+        self.samples_in = 0
+        self.windows_out = 0
+
+    @property
+    def carry_len(self):
+        """int: Number of samples per channel waiting for the next block."""
+        return self._carry_len
+
+    def reset(self, skipped=0):
+        """
+        Drop any carried samples (e.g. after a scan restart).
+
+        Args:
+            skipped (int): Samples per channel lost before the next block;
+                ``samples_in`` moves past them so sample indices stay on
+                the scan's time line.
+        """
+        self._carry_len = 0
+        self.samples_in += int(skipped)
+
+    def process(self, block):
+        # type: (np.ndarray) -> tuple
+        """
+        Process one block of samples.
+
+        Args:
+            block (numpy.ndarray): Raw voltage samples from the scan,
+                interleaved by channel as returned by the daqhats library.
+
+        Returns:
+            tuple: ``(rms, peak, minimum)`` arrays of shape
+            ``(windows, channels)``, one row per complete window, already
+            multiplied by ``scale``.
+        """
+        block = np.asarray(block, dtype=np.float64).reshape(-1, self.channels)
+        count_in = block.shape[0]
+        total = self._carry_len + count_in
+        if total > self._work.shape[0]:
+            grown = np.empty((2 * total, self.channels), dtype=np.float64)
+            grown[:self._carry_len] = self._work[:self._carry_len]
+            self._work = grown
+        self._work[self._carry_len:total] = block
+        self.samples_in += count_in
+
+        count = total // self.window
+        used = count * self.window
+        windows = self._work[:used].reshape(count, self.window, self.channels)
+
+        rms = np.einsum('ijk,ijk->ik', windows, windows)
+        rms /= self.window
+        np.sqrt(rms, out=rms)
+        if count:
+            peak = windows.max(axis=1)
+            minimum = windows.min(axis=1)
+        else:
+            peak = np.empty((0, self.channels))
+            minimum = np.empty((0, self.channels))
+        rms *= self.scale
+        peak *= self.scale
+        minimum *= self.scale
+
+        # Move the leftover samples to the head of the work buffer
+        self._carry_len = total - used
+        if self._carry_len and used:
+            self._work[:self._carry_len] = self._work[used:total]
+        self.windows_out += count
+        return rms, peak, minimum
+
+
+class CycleRmsEngine(object):
+    """
+    Cycle-synchronous RMS / peak / min: one result row per ``cycles``
+    periods of the line frequency.
+
+    Period boundaries are the rising zero crossings of the reference
+    channel, detected for the whole block at once with a hysteresis band
+    (samples inside ``+-hysteresis`` keep the previous sign, so noise
+    around zero gives no extra crossings). Every channel is integrated
+    over the same whole periods, which makes the RMS independent of where
+    a window happens to start. A row covering N periods is the running
+    mean of the squared signal decimated by N.
+
+    When no crossing is found for 1.5 nominal rows (machine off, current
+    below the hysteresis), rows of the nominal length are emitted instead
+    so the output never stalls. Such forced boundaries do not count as
+    synchronized: the next real crossing closes the open row and the
+    following rows start on crossings again. Samples before the first
+    boundary are dropped.
+
+    Args:
+        rate (float): Per-channel sample rate.
+        fundamental (float): Nominal line frequency in Hz.
+        cycles (int): Periods per result row.
+        hysteresis (float): Half-width of the zero band in raw units (V).
+        scale (float or sequence): As in :py:class:`BlockRmsEngine`.
+        channels (int): Number of channels interleaved in each block.
+        reference (int): Position of the channel used for the crossings.
+        capacity (int): Initial work buffer size in samples per channel.
+    """
+
+    def __init__(self, rate, fundamental=50.0, cycles=1, hysteresis=0.02,
+                 scale=1.0, channels=1, reference=0, capacity=4096):
+        if cycles < 1:
+            raise ValueError('Error: at least one cycle per RMS value')
+        self.cycles = int(cycles)
+        self.hysteresis = float(hysteresis)
+        self.channels = int(channels)
+        self.reference = int(reference)
+        self.scale = np.broadcast_to(
+            np.asarray(scale, dtype=np.float64), (self.channels,)).copy()
+        self.nominal = max(1, int(round(rate * self.cycles / fundamental)))
+        self.max_len = int(self.nominal * 1.5)
+        self._work = np.empty((max(int(capacity), 2 * self.max_len),
+                               self.channels), dtype=np.float64)
+        self._carry_len = 0
+        self._sign = 0        # hysteresis state after the last sample
+        self._count = 0       # periods in the open row
+        self._started = False  # a row is open (after the first boundary)
+        self._synced = False   # the open row started at a real crossing
+        self.samples_in = 0
+        self.windows_out = 0
+        # Sample index of the first sample of each row of the last block
+        self.starts = np.empty(0, dtype=np.int64)
+
+    @property
+    def carry_len(self):
+        """int: Samples per channel of the open (incomplete) row."""
+        return self._carry_len
+
+    def reset(self, skipped=0):
+        """
+        Drop the open row and resynchronize (e.g. after a scan restart).
+
+        Args:
+            skipped (int): Samples per channel lost before the next block
+                (see :py:meth:`BlockRmsEngine.reset`).
+        """
+        self._carry_len = 0
+        self.samples_in += int(skipped)
+        self._sign = 0
+        self._count = 0
+        self._started = False
+        self._synced = False
+
+    def _crossings(self, signal):
+        # Indices where the hysteresis state goes from -1 to +1
+        state = np.zeros(signal.size + 1, dtype=np.int8)
+        state[0] = self._sign
+        state[1:][signal > self.hysteresis] = 1
+        state[1:][signal < -self.hysteresis] = -1
+        # Forward-fill the zero band with the last sign
+        index = np.where(state != 0, np.arange(state.size), 0)
+        np.maximum.accumulate(index, out=index)
+        state = state[index]
+        self._sign = int(state[-1])
+        return np.flatnonzero((state[1:] == 1) & (state[:-1] == -1))
+
+    def _boundary(self, rows, begin, end, crossing):
+        # Close the open row at ``end``; returns the new row start.
+        # ``crossing``: end is a real zero crossing (not a forced boundary)
+        if self._started:
+            rows.append((begin, end))
+        self._started = True
+        self._synced = crossing
+        self._count = 0
+        return end
+
+    def process(self, block):
+        # type: (np.ndarray) -> tuple
+        """
+        Process one block of samples.
+
+        Returns:
+            tuple: ``(rms, peak, minimum)`` arrays of shape
+            ``(rows, channels)`` as in :py:meth:`BlockRmsEngine.process`;
+            :py:attr:`starts` holds the first sample index of each row.
+        """
+        block = np.asarray(block, dtype=np.float64).reshape(-1, self.channels)
+        old = self._carry_len
+        total = old + block.shape[0]
+        if total > self._work.shape[0]:
+            grown = np.empty((2 * total, self.channels), dtype=np.float64)
+            grown[:old] = self._work[:old]
+            self._work = grown
+        self._work[old:total] = block
+        base = self.samples_in - old
+        self.samples_in += block.shape[0]
+
+        rows = []
+        begin = 0
+        for cross in (self._crossings(block[:, self.reference]) + old).tolist():
+            while cross - begin > self.max_len:
+                begin = self._boundary(rows, begin, begin + self.nominal, False)
+            if not self._synced:
+                begin = self._boundary(rows, begin, cross, True)
+                continue
+            self._count += 1
+            if self._count == self.cycles:
+                begin = self._boundary(rows, begin, cross, True)
+        while total - begin > self.max_len:
+            begin = self._boundary(rows, begin, begin + self.nominal, False)
+
+        if rows:
+            first, end = rows[0][0], rows[-1][1]
+            offsets = np.array([b for b, _ in rows]) - first
+            lengths = np.array([e - b for b, e in rows], dtype=np.float64)
+            segment = self._work[first:end]
+            rms = np.add.reduceat(segment * segment, offsets, axis=0)
+            rms /= lengths[:, None]
+            np.sqrt(rms, out=rms)
+            peak = np.maximum.reduceat(segment, offsets, axis=0)
+            minimum = np.minimum.reduceat(segment, offsets, axis=0)
+            rms *= self.scale
+            peak *= self.scale
+            minimum *= self.scale
+            self.starts = base + first + offsets
+        else:
+            rms = np.empty((0, self.channels))
+            peak = np.empty((0, self.channels))
+            minimum = np.empty((0, self.channels))
+            self.starts = np.empty(0, dtype=np.int64)
+
+        # The open row moves to the head of the work buffer
+        self._carry_len = total - begin
+        if self._carry_len and begin:
+            self._work[:self._carry_len] = self._work[begin:total]
+        self.windows_out += len(rows)
+        return rms, peak, minimum
@@ -0,0 +1,239 @@
+"""
+    Multi-resolution rollups of the current RMS stream.
+
+    The writer thread of current_logger feeds every block of RMS rows into
+    a :py:class:`RollupWriter`. It keeps 1 s, 1 min and 1 h aggregates per
+    channel: mean RMS, RMS of the RMS values, maximum peak, minimum and
+    the number of RMS values. Each resolution goes to small
+    :py:mod:`binary_records` files in ``ROLLUP_DIR``::
+
+        current_rollup_1s_2026-10-18.bin     (one file per day)
+        current_rollup_1min_2026-10.bin      (one file per month)
+        current_rollup_1h_2026.bin           (one file per year)
+
+    A record is appended when its bucket starts. The last record of a
+    file is the open bucket and is rewritten in place (about once a
+    second) until the next bucket starts, so readers always see the
+    current hour and minute. Buckets follow local time. A logger restart
+    within a bucket continues that bucket's record. A bucket without RMS
+    values (count 0) has NaN aggregates. Only RMS rows are aggregated:
+    the ``# anchor`` / ``# gap`` lines of the data files never reach the
+    rollups, so samples lost in a gap just lower the bucket's count.
+
+    Read back with :py:func:`read_rollups` or
+    ``python rollups.py 1min "2026-10-18 08:00" "2026-10-18 12:00"``.
+"""
+import argparse
+import glob
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+from binary_records import RecordWriter, read_records
+
+# name, bucket seconds, file name date format
+LEVELS = [("1s", 1, "%Y-%m-%d"), ("1min", 60, "%Y-%m"), ("1h", 3600, "%Y")]
+# Wall-clock seconds between in-place updates of the open buckets
+FLUSH_SEC = 1.0
+
+
+def rollup_dtype(channels):
+    """Record type: bucket start (epoch), count and per-channel aggregates."""
+    shape = (channels,) if channels > 1 else ()
+    return np.dtype([('t', '<f8'), ('count', '<u4'), ('mean', '<f4', shape),
+                     ('rms', '<f4', shape), ('max', '<f4', shape),
+                     ('min', '<f4', shape)])
+
+
+class _Level(object):
+    """Accumulator and output file of one resolution"""
+
+    def __init__(self, folder, name, seconds, pattern, channels, meta):
+        self.folder = folder
+        self.name = name
+        self.seconds = seconds
+        self.pattern = pattern
+        self.channels = channels
+        self.dtype = rollup_dtype(channels)
+        self.meta = dict(meta, level=name, bucket_sec=seconds)
+        self.bucket = None      # start (epoch) of the open bucket
+        self.file = None
+        self.path = None
+        self._clear()
+
+    def _clear(self):
+        self.count = 0
+        self.total = np.zeros(self.channels)
+        self.squares = np.zeros(self.channels)
+        self.high = np.full(self.channels, -np.inf)
+        self.low = np.full(self.channels, np.inf)
+
+    def _record(self):
+        record = np.zeros(1, dtype=self.dtype)
+        shape = record['mean'].shape
+        record['t'] = self.bucket
+        record['count'] = self.count
+        if not self.count:
+            for name in ('mean', 'rms', 'max', 'min'):
+                record[name] = np.nan
+            return record
+        count = self.count
+        record['mean'] = (self.total / count).reshape(shape)
+        record['rms'] = np.sqrt(self.squares / count).reshape(shape)
+        record['max'] = self.high.reshape(shape)
+        record['min'] = self.low.reshape(shape)
+        return record
+
+    def _open(self, bucket):
+        path = os.path.join(self.folder, "current_rollup_%s_%s.bin" % (
+            self.name, datetime.fromtimestamp(bucket).strftime(self.pattern)))
+        last = None
+        if path != self.path:
+            if self.file is not None:
+                self.file.close()
+            self.path = path
+            self.file = RecordWriter(path, self.dtype, self.meta)
+            if self.file.records:
+                # Existing file (restart): only its last record can be continued
+                _, records = read_records(path)
+                last = np.array(records[-1])
+        self._clear()
+        self.bucket = bucket
+        if last is not None and last['t'] == bucket:
+            # Restarted within this bucket: continue its record
+            count = int(last['count'])
+            if count:
+                self.count = count
+                self.total = np.asarray(last['mean'], dtype=np.float64).ravel() * count
+                self.squares = np.asarray(last['rms'], dtype=np.float64).ravel() ** 2 * count
+                self.high = np.asarray(last['max'], dtype=np.float64).ravel().copy()
+                self.low = np.asarray(last['min'], dtype=np.float64).ravel().copy()
+            return
+        self.file.append(self._record())
+
+    def add(self, local, t, rms, peak, minimum):
+        """
+        Add RMS rows; ``local`` = t shifted to local time (for the bucket
+        boundaries).
+        """
+        ids = np.floor(local / self.seconds)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(ids)) + 1))
+        counts = np.diff(np.append(starts, len(ids)))
+        totals = np.add.reduceat(rms, starts, axis=0)
+        squares = np.add.reduceat(rms * rms, starts, axis=0)
+        highs = np.maximum.reduceat(peak, starts, axis=0)
+        lows = np.minimum.reduceat(minimum, starts, axis=0)
+        for i, first in enumerate(starts.tolist()):
+            bucket = t[first] - (local[first] - ids[first] * self.seconds)
+            if self.bucket is None or abs(bucket - self.bucket) > 0.5:
+                if self.bucket is not None:
+                    self.flush()
+                self._open(float(round(bucket)))
+            self.count += int(counts[i])
+            self.total += totals[i]
+            self.squares += squares[i]
+            np.maximum(self.high, highs[i], out=self.high)
+            np.minimum(self.low, lows[i], out=self.low)
+
+    def flush(self):
+        """Rewrite the open bucket's record."""
+        if self.file is not None and self.file.records:
+            self.file.overwrite(self.file.records - 1, self._record())
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+
+class RollupWriter(object):
+    """
+    Incremental 1 s / 1 min / 1 h aggregates of RMS rows.
+
+    Args:
+        folder (str): Output folder (created if missing).
+        channels (list): Scanned channel numbers.
+        meta (dict): Extra metadata stored in the file headers.
+        levels (list): ``(name, seconds, date format)`` of each resolution.
+    """
+
+    def __init__(self, folder, channels, meta=None, levels=LEVELS):
+        os.makedirs(folder, exist_ok=True)
+        meta = dict(meta or {}, channels=list(channels))
+        self.levels = [_Level(folder, name, seconds, pattern, len(channels), meta)
+                       for name, seconds, pattern in levels]
+        self._next_flush = 0.0
+
+    def add(self, t, rms, peak, minimum):
+        """
+        Add a block of RMS rows.
+
+        Args:
+            t (numpy.ndarray): Epoch time of each row (ascending).
+            rms, peak, minimum (numpy.ndarray): ``(rows, channels)`` values.
+        """
+        if not len(t):
+            return
+        t = np.asarray(t, dtype=np.float64)
+        # Local time: buckets of 1 h start at the full local hour
+        local = t + time.localtime(float(t[0])).tm_gmtoff
+        for level in self.levels:
+            level.add(local, t, rms, peak, minimum)
+        now = time.monotonic()
+        if now >= self._next_flush:
+            self.flush()
+            self._next_flush = now + FLUSH_SEC
+
+    def flush(self):
+        for level in self.levels:
+            level.flush()
+
+    def close(self):
+        for level in self.levels:
+            level.close()
+
+
+def read_rollups(folder, level, start, end):
+    """
+    Aggregates of one resolution with bucket start in [start, end].
+
+    Returns:
+        numpy.ndarray: Records (:py:func:`rollup_dtype`) in time order.
+    """
+    parts = []
+    for path in sorted(glob.glob(os.path.join(folder, "current_rollup_%s_*.bin" % level))):
+        _, records = read_records(path)
+        if len(records) and records['t'][0] <= end and records['t'][-1] >= start:
+            keep = (records['t'] >= start) & (records['t'] <= end)
+            parts.append(np.array(records[keep]))
+    if not parts:
+        return np.empty(0)
+    return np.concatenate(parts)
+
+
+def main():
+    from opc_status import parse_timestamp
+    parser = argparse.ArgumentParser(description="Print current rollups as CSV")
+    parser.add_argument("level", choices=[name for name, _, _ in LEVELS])
+    parser.add_argument("start")
+    parser.add_argument("end")
+    parser.add_argument("--folder", default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "Ziresch", "current_data", "rollups"))
+    args = parser.parse_args()
+    records = read_rollups(args.folder, args.level, parse_timestamp(args.start),
+                           parse_timestamp(args.end))
+    print("Timestamp,Count,Mean (A),RMS (A),Max (A),Min (A)")
+    for record in records:
+        values = [np.ravel(record[name]) for name in ("mean", "rms", "max", "min")]
+        print("%s,%d,%s" % (
+            datetime.fromtimestamp(record['t']).strftime("%Y-%m-%d %H:%M:%S"),
+            record['count'],
+            ",".join(" ".join("%.4f" % v for v in column) for column in values)))
+
+
+if __name__ == '__main__':
+    main()
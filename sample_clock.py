@@ -0,0 +1,74 @@
+"""
+    Sample-clock timestamps for hardware-paced scans.
+
+    Instead of asking the OS for the time on every row, the time of each
+    sample is derived from its index in the scan: scan start time plus
+    sample index divided by the actual scan rate. Timestamps for a whole
+    block are computed as one vectorized array.
+"""
+import time
+from datetime import datetime
+
+import numpy as np
+
+
+class SampleClock(object):
+    """
+    Map sample indices of a continuous scan to absolute time.
+
+    Args:
+        rate (float): Actual per-channel scan rate from
+            ``a_in_scan_actual_rate``.
+        start_time (float): Wall-clock time (``time.time()``) of sample 0.
+            Defaults to now.
+    """
+
+    def __init__(self, rate, start_time=None):
+        self.rate = float(rate)
+        self.start_time = time.time() if start_time is None else start_time
+        self._start_us = np.datetime64(
+            datetime.fromtimestamp(self.start_time), 'us')
+
+    def seconds(self, sample_index):
+        """Seconds since scan start for a sample index (scalar or array)."""
+        return np.asarray(sample_index, dtype=np.float64) / self.rate
+
+    def epoch(self, sample_index):
+        """Absolute (epoch) time of a sample index."""
+        return self.start_time + self.seconds(sample_index)
+
+    def window_seconds(self, first_window, count, window):
+        """
+        Seconds since scan start of the first sample of each window.
+
+        Args:
+            first_window (int): Index of the first window in the block.
+            count (int): Number of windows in the block.
+            window (int): Samples per window.
+
+        Returns:
+            numpy.ndarray: float64 offsets, one per window.
+        """
+        index = np.arange(first_window, first_window + count,
+                          dtype=np.float64)
+        index *= window / self.rate
+        return index
+
+    def format(self, seconds):
+        """
+        Format offsets from scan start as local ``%Y-%m-%d %H:%M:%S.%f``
+        strings, vectorized over the whole array.
+        """
+        micros = np.round(np.asarray(seconds) * 1e6).astype('timedelta64[us]')
+        stamps = np.datetime_as_string(self._start_us + micros, unit='us')
+        return np.char.replace(stamps, 'T', ' ')
+
+    def drift(self, sample_index, wall_time=None):
+        """
+        Difference between the wall clock and the sample clock at a sample.
+
+        A positive value means the wall clock is ahead of the sample clock
+        (which includes the scan buffer latency of the read).
+        """
+        wall_time = time.time() if wall_time is None else wall_time
+        return wall_time - float(self.epoch(sample_index))
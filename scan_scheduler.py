@@ -0,0 +1,180 @@
+"""
+    Adaptive read scheduling for the MCC118 scan.
+
+    Instead of reading a fixed small block and sleeping, the logger asks the
+    scheduler how many samples to request and reads them with the library's
+    blocking timeout. The scan thread of the daqhats library wakes the
+    caller once the samples are there, so there is no polling. After each
+    read the samples still waiting in the scan buffer (the backlog) decide
+    the next request:
+
+    - normally ``TARGET_PERIOD`` seconds of samples per read (e.g. 20 reads
+      per second instead of 200);
+    - when the backlog is above ``HIGH_FILL`` of the buffer, the request
+      grows so the backlog is drained in a few reads;
+    - the request never exceeds ``MAX_FILL`` of the buffer, so one slow
+      read cannot run the buffer into ``buffer_overrun``.
+
+    Histograms of the per-read wait (time blocked in the read), processing
+    time and buffer fill are kept for the heartbeat and log output, once
+    for the whole run and once for the current heartbeat interval.
+"""
+import time
+
+import numpy as np
+
+# Seconds of samples per read when the logger keeps up
+TARGET_PERIOD = 0.05
+# Smallest request (samples per channel)
+MIN_BLOCK = 100
+# Backlog (fraction of the scan buffer) above which reads grow
+HIGH_FILL = 0.1
+# Largest request as a fraction of the scan buffer
+MAX_FILL = 0.25
+# Extra time allowed for a blocking read beyond the block duration
+TIMEOUT_MARGIN = 0.5
+
+# Histogram bin edges: wait / processing time (ms) and buffer fill (%)
+LATENCY_EDGES_MS = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+FILL_EDGES_PCT = [0, 1, 2, 5, 10, 20, 30, 50, 75, 100]
+
+
+class Histogram(object):
+    """Counts per bin; the last bin also takes everything above the edges."""
+
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.counts = np.zeros(len(edges), dtype=np.int64)
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[max(0, int(np.searchsorted(self.edges, value, side='right')) - 1)] += 1
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """Lower edge of the bin holding the q-th percentile (None if empty)."""
+        total = int(self.counts.sum())
+        if not total:
+            return None
+        index = int(np.searchsorted(np.cumsum(self.counts), q / 100.0 * total))
+        return float(self.edges[min(index, len(self.edges) - 1)])
+
+    def as_dict(self):
+        return {"edges": self.edges.tolist(), "counts": self.counts.tolist(),
+                "max": round(self.max, 3)}
+
+    def reset(self):
+        self.counts[:] = 0
+        self.max = 0.0
+
+
+class ReadScheduler(object):
+    """
+    Request size and timeout of each scan read.
+
+    Args:
+        rate (float): Per-channel scan rate.
+        buffer_size (int): Scan buffer size in samples per channel.
+        channels (int): Number of scanned channels.
+        target_period (float): Seconds of samples per read when idle.
+        min_block (int): Smallest request (samples per channel).
+    """
+
+    def __init__(self, rate, buffer_size, channels=1,
+                 target_period=TARGET_PERIOD, min_block=MIN_BLOCK):
+        self.rate = float(rate)
+        self.buffer_size = int(buffer_size)
+        self.channels = int(channels)
+        self.max_block = max(int(min_block), int(self.buffer_size * MAX_FILL))
+        self.base_block = int(np.clip(round(self.rate * target_period),
+                                      min_block, self.max_block))
+        self.block = self.base_block
+        self.reads = 0
+        self.short_reads = 0
+        self.max_backlog = 0
+        self.backlog = 0        # samples left in the buffer after the last read
+        self.wait_ms = Histogram(LATENCY_EDGES_MS)
+        self.process_ms = Histogram(LATENCY_EDGES_MS)
+        self.fill_pct = Histogram(FILL_EDGES_PCT)
+        # Same values since the last stats(reset=True)
+        self.interval_reads = 0
+        self.interval_max_backlog = 0
+        self.interval = {"wait_ms": Histogram(LATENCY_EDGES_MS),
+                         "process_ms": Histogram(LATENCY_EDGES_MS),
+                         "fill_pct": Histogram(FILL_EDGES_PCT)}
+        self._read_end = None
+
+    def _add(self, name, value):
+        getattr(self, name).add(value)
+        self.interval[name].add(value)
+
+    def timeout(self, samples=None):
+        """Seconds a blocking read of ``samples`` may wait."""
+        return (samples or self.block) / self.rate + TIMEOUT_MARGIN
+
+    def read(self, hat):
+        """
+        Read the next block: blocks until it is complete (or the timeout).
+
+        Returns:
+            The ``a_in_scan_read_numpy`` result.
+        """
+        start = time.perf_counter()
+        if self._read_end is not None:
+            self._add("process_ms", (start - self._read_end) * 1000.0)
+        request = self.block
+        result = hat.a_in_scan_read_numpy(request, self.timeout(request))
+        end = time.perf_counter()
+        self._read_end = end
+        self._add("wait_ms", (end - start) * 1000.0)
+        self.reads += 1
+        self.interval_reads += 1
+        if len(result.data) < request * self.channels:
+            self.short_reads += 1
+        self.update(hat.a_in_scan_status().samples_available)
+        return result
+
+    def update(self, backlog):
+        """Choose the next request from the samples still in the buffer."""
+        backlog = int(backlog)
+        self.backlog = backlog
+        self.max_backlog = max(self.max_backlog, backlog)
+        self.interval_max_backlog = max(self.interval_max_backlog, backlog)
+        self._add("fill_pct", 100.0 * backlog / self.buffer_size)
+        if backlog > HIGH_FILL * self.buffer_size:
+            # Falling behind: take the backlog and the next block in one read
+            self.block = min(self.max_block, backlog + self.base_block)
+        elif self.block > self.base_block:
+            self.block = max(self.base_block, self.block // 2)
+
+    def stats(self, reset=False):
+        """
+        Args:
+            reset (bool): Start a new interval; the run totals are kept.
+
+        Returns:
+            dict: Run totals (reads, short_reads, block, max_backlog and
+            p50/p99/max of wait_ms, process_ms and fill_pct) and the same
+            values of the interval with an ``interval_`` prefix.
+        """
+        snapshot = {"reads": self.reads, "short_reads": self.short_reads,
+                    "block": self.block, "max_backlog": self.max_backlog,
+                    "interval_reads": self.interval_reads,
+                    "interval_max_backlog": self.interval_max_backlog}
+        for name in ("wait_ms", "process_ms", "fill_pct"):
+            for prefix, histogram in (("", getattr(self, name)),
+                                      ("interval_", self.interval[name])):
+                snapshot[prefix + name + "_p50"] = histogram.percentile(50)
+                snapshot[prefix + name + "_p99"] = histogram.percentile(99)
+                snapshot[prefix + name + "_max"] = round(histogram.max, 3)
+        if reset:
+            self.interval_reads = 0
+            self.interval_max_backlog = 0
+            for histogram in self.interval.values():
+                histogram.reset()
+        return snapshot
+
+    def histograms(self):
+        return {name: getattr(self, name).as_dict()
+                for name in ("wait_ms", "process_ms", "fill_pct")}
@@ -0,0 +1,273 @@
+"""
+    Simulated MCC 118 backend for running current_logger.py without the HAT.
+
+    Provides the subset of the ``daqhats`` API used by the loggers
+    (:py:class:`mcc118`, :py:class:`OptionFlags`, :py:class:`HatIDs`,
+    :py:class:`HatError`, :py:func:`hat_list`). The scan produces a
+    synthetic CT signal per channel: a 50 Hz sine with a 3rd harmonic and
+    noise, phase shifted by 120 degrees between channels and switched
+    between a low and a high load every ``SIM_LOAD_PERIOD`` seconds. The
+    signal depends only on the sample index and ``SIM_SEED``, so two runs
+    with the same settings produce the same data.
+
+    Enabled with the environment variable ``KSF_SIMULATE=1`` (see
+    current_logger.py and daqhats_utils.py). Settings, also from the
+    environment:
+
+    ====================  ======================================  =======
+    KSF_SIM_VRMS          Shunt voltage RMS at full load (V)      1.0
+    KSF_SIM_FREQ          Line frequency (Hz)                     50
+    KSF_SIM_NOISE         Noise RMS (V)                           0.005
+    KSF_SIM_LOAD_PERIOD   Seconds between load changes (0 = off)  20
+    KSF_SIM_JITTER_MS     Extra random delay of every read (ms)   0
+    KSF_SIM_OVERRUN_SEC   Hardware overrun n s after scan start   0
+    KSF_SIM_REALTIME      0 = samples as fast as they are read    1
+    KSF_SIM_SEED          Random seed                             1
+    ====================  ======================================  =======
+
+    Like the real device, the scan stops on an overrun (injected, or the
+    read buffer filling up because the logger reads too slowly); the
+    remaining samples are returned with the overrun flag set.
+"""
+import os
+import time
+from collections import namedtuple
+from enum import IntEnum
+
+import numpy as np
+
+SIMULATE_ENV = "KSF_SIMULATE"
+
+
+def _env(name, default):
+    return type(default)(os.environ.get(name, default))
+
+
+SIM_VRMS = _env("KSF_SIM_VRMS", 1.0)
+SIM_FREQ = _env("KSF_SIM_FREQ", 50.0)
+SIM_NOISE = _env("KSF_SIM_NOISE", 0.005)
+SIM_LOAD_PERIOD = _env("KSF_SIM_LOAD_PERIOD", 20.0)
+SIM_JITTER_MS = _env("KSF_SIM_JITTER_MS", 0.0)
+SIM_OVERRUN_SEC = _env("KSF_SIM_OVERRUN_SEC", 0.0)
+SIM_REALTIME = _env("KSF_SIM_REALTIME", 1) != 0
+SIM_SEED = _env("KSF_SIM_SEED", 1)
+
+# MCC 118 limits
+MAX_SCAN_RATE = 100000.0
+NUM_AI_CHANNELS = 8
+# Scan buffer: at least one second of samples (like the library default)
+MIN_BUFFER_SEC = 1.0
+
+
+def simulate_enabled():
+    """bool: ``KSF_SIMULATE`` is set to something other than 0."""
+    return os.environ.get(SIMULATE_ENV, "0") not in ("", "0")
+
+
+class HatIDs(IntEnum):
+    ANY = 0
+    MCC_118 = 0x0142
+
+
+class OptionFlags(IntEnum):
+    DEFAULT = 0x0000
+    NOSCALEDATA = 0x0001
+    NOCALIBRATEDATA = 0x0002
+    EXTCLOCK = 0x0004
+    EXTTRIGGER = 0x0008
+    CONTINUOUS = 0x0010
+
+
+class HatError(Exception):
+    def __init__(self, address, value):
+        super(HatError, self).__init__(value)
+        self.address = address
+        self.value = value
+
+    def __str__(self):
+        return "Addr {}: ".format(self.address) + self.value
+
+
+HatInfo = namedtuple("HatInfo", ["address", "id", "version", "product_name"])
+Mcc118Info = namedtuple("Mcc118Info", ["NUM_AI_CHANNELS", "AI_MIN_CODE", "AI_MAX_CODE",
+                                       "AI_MIN_VOLTAGE", "AI_MAX_VOLTAGE",
+                                       "AI_MIN_RANGE", "AI_MAX_RANGE"])
+ScanReadResult = namedtuple("ScanReadResult", ["running", "hardware_overrun",
+                                               "buffer_overrun", "triggered",
+                                               "timeout", "data"])
+ScanStatus = namedtuple("ScanStatus", ["running", "hardware_overrun",
+                                       "buffer_overrun", "triggered",
+                                       "samples_available"])
+
+
+def hat_list(filter_by_id=0):
+    """One simulated MCC 118 at address 0."""
+    if filter_by_id not in (HatIDs.ANY, HatIDs.MCC_118):
+        return []
+    return [HatInfo(0, HatIDs.MCC_118, 0, "MCC 118 (simulated)")]
+
+
+class SignalModel(object):
+    """
+    Synthetic CT shunt voltage as a function of the sample index.
+
+    Args:
+        rate (float): Samples per second per channel.
+        channels (int): Number of channels in the scan.
+    """
+
+    def __init__(self, rate, channels, vrms=SIM_VRMS, freq=SIM_FREQ,
+                 noise=SIM_NOISE, load_period=SIM_LOAD_PERIOD, seed=SIM_SEED):
+        self.rate = float(rate)
+        self.channels = int(channels)
+        self.amplitude = vrms * np.sqrt(2.0)
+        self.freq = freq
+        self.noise = noise
+        self.load_period = load_period
+        self._random = np.random.default_rng(seed)
+        self._phase = -2.0 * np.pi / 3.0 * np.arange(self.channels)
+
+    def block(self, start, count):
+        """
+        Samples ``start`` .. ``start + count`` of all channels, interleaved
+        like ``a_in_scan_read_numpy``.
+        """
+        t = (start + np.arange(count)) / self.rate
+        angle = 2.0 * np.pi * self.freq * t[:, None] + self._phase
+        signal = np.sin(angle) + 0.05 * np.sin(3.0 * angle)
+        if self.load_period > 0:
+            # 20 % load / full load, alternating
+            high = (t // self.load_period) % 2 == 1
+            signal *= np.where(high, 1.0, 0.2)[:, None]
+        signal *= self.amplitude
+        if self.noise > 0:
+            signal += self._random.normal(0.0, self.noise, signal.shape)
+        return np.clip(signal, -10.0, 10.0).ravel()
+
+
+class mcc118(object):
+    """Simulated MCC 118 (scan functions only)."""
+
+    def __init__(self, address=0):
+        self._address = address
+        self._scan = None
+
+    @staticmethod
+    def info():
+        return Mcc118Info(NUM_AI_CHANNELS, 0, 4095, -10.0, 10.0 - 20.0 / 4096,
+                          -10.0, 10.0)
+
+    def address(self):
+        return self._address
+
+    def a_in_scan_actual_rate(self, channel_count, sample_rate_per_channel):
+        if channel_count < 1 or channel_count > NUM_AI_CHANNELS:
+            raise ValueError("Invalid channel count")
+        # The scan clock is 1 / n of the maximum total rate
+        divisor = np.ceil(MAX_SCAN_RATE / (channel_count * sample_rate_per_channel))
+        return MAX_SCAN_RATE / channel_count / max(divisor, 1.0)
+
+    def a_in_scan_start(self, channel_mask, samples_per_channel, sample_rate_per_channel,
+                        options):
+        if self._scan is not None:
+            raise HatError(self._address, "A scan is already active.")
+        channels = bin(channel_mask).count("1")
+        if channels == 0:
+            raise ValueError("Invalid channel mask")
+        rate = self.a_in_scan_actual_rate(channels, sample_rate_per_channel)
+        continuous = bool(options & OptionFlags.CONTINUOUS)
+        self._scan = {
+            "model": SignalModel(rate, channels),
+            "channels": channels,
+            "rate": rate,
+            "total": None if continuous else int(samples_per_channel),
+            "buffer": max(int(samples_per_channel), int(rate * MIN_BUFFER_SEC)),
+            "start": time.monotonic(),
+            "read": 0,          # samples per channel returned so far
+            "made": 0,          # samples per channel produced (REALTIME off)
+            "stopped_at": None,
+            "hardware_overrun": False,
+            "buffer_overrun": False,
+            "next_overrun": SIM_OVERRUN_SEC if SIM_OVERRUN_SEC > 0 else None,
+            "random": np.random.default_rng(SIM_SEED + 1),
+        }
+
+    def a_in_scan_buffer_size(self):
+        self._check_scan()
+        return self._scan["buffer"] * self._scan["channels"]
+
+    def a_in_scan_status(self):
+        available, running = self._available()
+        return ScanStatus(running, self._scan["hardware_overrun"],
+                          self._scan["buffer_overrun"], True, available)
+
+    def _check_scan(self):
+        if self._scan is None:
+            raise HatError(self._address, "No scan is active.")
+
+    def _produced(self):
+        # Samples per channel the simulated ADC has taken so far
+        scan = self._scan
+        if scan["stopped_at"] is not None:
+            return scan["stopped_at"]
+        if SIM_REALTIME:
+            produced = int((time.monotonic() - scan["start"]) * scan["rate"])
+        else:
+            produced = scan["made"]
+        if scan["total"] is not None:
+            produced = min(produced, scan["total"])
+        if scan["next_overrun"] is not None and produced >= scan["next_overrun"] * scan["rate"]:
+            scan["hardware_overrun"] = True
+            produced = int(scan["next_overrun"] * scan["rate"])
+            scan["stopped_at"] = produced
+        elif produced - scan["read"] > scan["buffer"]:
+            scan["buffer_overrun"] = True
+            produced = scan["read"] + scan["buffer"]
+            scan["stopped_at"] = produced
+        return produced
+
+    def _available(self):
+        self._check_scan()
+        produced = self._produced()
+        scan = self._scan
+        finished = scan["total"] is not None and produced >= scan["total"]
+        return produced - scan["read"], scan["stopped_at"] is None and not finished
+
+    def a_in_scan_read_numpy(self, samples_per_channel, timeout):
+        """
+        Read scan data like the library: wait up to ``timeout`` seconds
+        (-1 = forever) for ``samples_per_channel`` samples (-1 = all
+        available).
+        """
+        self._check_scan()
+        scan = self._scan
+        if SIM_JITTER_MS > 0:
+            time.sleep(scan["random"].uniform(0.0, SIM_JITTER_MS) / 1000.0)
+        if not SIM_REALTIME and samples_per_channel > 0 and scan["stopped_at"] is None:
+            scan["made"] = max(scan["made"], scan["read"] + samples_per_channel)
+        available, running = self._available()
+        timed_out = False
+        if samples_per_channel > 0 and available < samples_per_channel and running:
+            deadline = None if timeout < 0 else time.monotonic() + timeout
+            while available < samples_per_channel and running:
+                missing = (samples_per_channel - available) / scan["rate"]
+                if deadline is not None:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        timed_out = True
+                        break
+                    missing = min(missing, left)
+                time.sleep(max(missing, 0.0005))
+                available, running = self._available()
+        count = available if samples_per_channel < 0 else min(available, samples_per_channel)
+        data = scan["model"].block(scan["read"], count)
+        scan["read"] += count
+        return ScanReadResult(running, scan["hardware_overrun"], scan["buffer_overrun"],
+                              True, timed_out, data)
+
+    def a_in_scan_stop(self):
+        if self._scan is not None and self._scan["stopped_at"] is None:
+            self._scan["stopped_at"] = self._produced()
+
+    def a_in_scan_cleanup(self):
+        self._scan = None
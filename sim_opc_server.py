@@ -0,0 +1,163 @@
+"""
+Local OPC UA stand-in for the Sinumerik server
+سرور OPC UA شبیه‌سازی شده برای تست opc_logger بدون ماشین
+
+Exposes the node tree read by opc_logger.py (``ns=2;s=/Nck/MachineAxis/...``
+and the status nodes) with synthetic values: the axis values follow slow
+sine curves, the status nodes change every few seconds (progEvent,
+actParts, toolNo...). Every read request is delayed by ``--latency``
+milliseconds (plus random ``--jitter``; defaults from
+``KSF_SIM_OPC_LATENCY_MS`` / ``KSF_SIM_OPC_JITTER_MS``) to model a slow
+controller.
+
+    python sim_opc_server.py --port 4840 --latency 20
+
+The loggers use it when ``KSF_OPC_URL`` points to it, e.g.
+``KSF_OPC_URL=opc.tcp://127.0.0.1:4840``; with ``KSF_SIMULATE=1``
+start.py starts this server and sets ``KSF_OPC_URL`` itself.
+"""
+import argparse
+import logging
+import math
+import os
+import random
+import time
+
+from opcua import Server, ua
+
+from heartbeat import Heartbeat
+from opc_nodes import NODES, STATUS_NODES
+
+SIM_PORT = 4840
+SIM_URL = f"opc.tcp://127.0.0.1:{SIM_PORT}"
+NAMESPACE_URI = "http://ksf/sim/sinumerik"
+
+# فاصله به‌روزرسانی مقادیر (ثانیه)
+UPDATE_INTERVAL = 0.1
+# هر چند ثانیه وضعیت برنامه (progEvent, actParts, ...) تغییر کند
+STATUS_PERIOD = 15.0
+# تاخیر هر درخواست Read (میلی‌ثانیه) - پیش‌فرض از environment
+SIM_LATENCY_MS = float(os.environ.get("KSF_SIM_OPC_LATENCY_MS", 0))
+SIM_JITTER_MS = float(os.environ.get("KSF_SIM_OPC_JITTER_MS", 0))
+
+
+def _string_id(node_id):
+    # "ns=2;s=/Nck/MachineAxis/vaPower[1]" -> "/Nck/MachineAxis/vaPower[1]"
+    return node_id.split(";s=", 1)[1]
+
+
+class SimulatedMachine(object):
+    """مقادیر مصنوعی همه‌ی نودها به عنوان تابعی از زمان"""
+
+    def __init__(self, seed=1):
+        self._random = random.Random(seed)
+        self._phase = {name: self._random.uniform(0, 2 * math.pi) for name in NODES}
+
+    def values(self, t):
+        """
+        Returns:
+            dict: ``{name: value}`` for all NODES and STATUS_NODES at time t.
+        """
+        cycle = int(t // STATUS_PERIOD)
+        running = cycle % 4 != 3  # هر چهارمین دوره ماشین متوقف است
+        load = 1.0 if running else 0.05
+        values = {}
+        for name in NODES:
+            wave = math.sin(2 * math.pi * t / 30.0 + self._phase[name])
+            if name.startswith("vaPower"):
+                values[name] = load * (2000.0 + 800.0 * wave)
+            elif name.startswith("vaCurr"):
+                values[name] = load * (8.0 + 3.0 * wave)
+            elif name.startswith("aaTorque"):
+                values[name] = load * (25.0 + 10.0 * wave)
+            elif name.startswith("aaDtbb"):
+                values[name] = 0.01 * wave
+            else:
+                values[name] = 100.0 * load
+        values.update({
+            "channelNo": 1,
+            "speedOvr": 100.0,
+            "spindleType": 0,
+            "status_LogicalSpindle": 1 if running else 0,
+            "paramSetNo": 1,
+            "status_Spindle": 1 if running else 0,
+            "progEvent": cycle % 8,
+            "progStatus": 3 if running else 2,
+            "actFeedRate": 1500.0 * load,
+            "cmdFeedRate": 1500.0 if running else 0.0,
+            "cmdSpeedRel": 100.0 * load,
+            "actParts": cycle // 4,
+            "MachiningTimeRecording": 1 if running else 0,
+            "toolNo": 1 + (cycle // 2) % 6,
+            "actSpeed": 3000.0 * load,
+        })
+        return values
+
+
+def build_server(endpoint, latency_ms=0.0, jitter_ms=0.0):
+    """
+    Create the server with the Sinumerik node tree.
+
+    Returns:
+        tuple: ``(server, variables)``; ``variables`` maps node names to
+        their OPC UA variables.
+    """
+    server = Server()
+    server.set_endpoint(endpoint)
+    server.set_server_name("KSF simulated Sinumerik")
+    ns = server.register_namespace(NAMESPACE_URI)
+    if ns != 2:
+        raise RuntimeError(f"Error: simulated namespace has index {ns}, expected 2")
+    folder = server.get_objects_node().add_folder(ua.NodeId("/", ns), "Sinumerik")
+    variables = {}
+    machine = SimulatedMachine()
+    for name, value in machine.values(0.0).items():
+        node_id = NODES.get(name) or STATUS_NODES[name]
+        variables[name] = folder.add_variable(ua.NodeId(_string_id(node_id), ns),
+                                              name, value)
+    if latency_ms > 0 or jitter_ms > 0:
+        service = server.iserver.attribute_service
+        read = service.read
+
+        def slow_read(params):
+            time.sleep((latency_ms + random.uniform(0, jitter_ms)) / 1000.0)
+            return read(params)
+        service.read = slow_read
+    return server, variables
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated Sinumerik OPC UA server")
+    parser.add_argument("--port", type=int, default=SIM_PORT)
+    parser.add_argument("--latency", type=float, default=SIM_LATENCY_MS, help="read delay (ms)")
+    parser.add_argument("--jitter", type=float, default=SIM_JITTER_MS,
+                        help="extra random delay (ms)")
+    args = parser.parse_args()
+    # opc_logger configured the root logger on import; keep the library quiet
+    logging.getLogger("opcua").setLevel(logging.WARNING)
+
+    server, variables = build_server(f"opc.tcp://0.0.0.0:{args.port}",
+                                     args.latency, args.jitter)
+    machine = SimulatedMachine()
+    heartbeat = Heartbeat.from_env()
+    server.start()
+    print(f"Simulated OPC UA server on opc.tcp://127.0.0.1:{args.port} "
+          f"({len(variables)} nodes, latency {args.latency:g} ms)")
+    start = time.monotonic()
+    updates = 0
+    try:
+        while True:
+            for name, value in machine.values(time.monotonic() - start).items():
+                variables[name].set_value(value)
+            updates += 1
+            heartbeat.beat(samples=updates)
+            time.sleep(UPDATE_INTERVAL)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        heartbeat.close()
+
+
+if __name__ == '__main__':
+    main()
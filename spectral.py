@@ -0,0 +1,167 @@
+"""
+    Streaming harmonic analysis of the raw current stream.
+
+    Raw scan blocks are cut into overlapping frames of ``cycles`` line
+    periods. Each frame is multiplied by a Hann window and projected onto
+    the DFT bins around the fundamental and its harmonics only. The
+    windowed cosine/sine basis is precomputed, and all frames and channels
+    of a block go through one matrix product into a reused output buffer,
+    so there is no full FFT and no per-frame allocation. The magnitude of
+    harmonic h is taken from the energy of bins ``h * cycles +- 2``. This
+    covers the Hann main lobe, so a line frequency a little off 50 Hz does
+    not lose amplitude (no scalloping).
+
+    Like :py:class:`rms_engine.BlockRmsEngine`, samples that do not
+    complete a frame are carried over to the next block.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+# One analyzer result: t = sample-clock seconds since scan start of the
+# frame centers; fundamental = (frames, channels) RMS of the fundamental;
+# thd = (frames, channels) total harmonic distortion in percent;
+# harmonics = (frames, channels, count) RMS of harmonics 1..count
+HarmonicBlock = namedtuple('HarmonicBlock', ['t', 'fundamental', 'thd', 'harmonics'])
+
+# Bins on each side of a harmonic that belong to its main lobe
+LOBE_BINS = 2
+
+
+def harmonic_header(channels, count):
+    """CSV header of the harmonics file (same layout rules as the RMS file)."""
+    names = ["Fundamental (A)", "THD (%)"] + [f"H{h} (A)" for h in range(2, count + 1)]
+    header = ["Time (s)", "Timestamp"]
+    if len(channels) <= 1:
+        return header + names
+    for ch in channels:
+        header += [f"CH{ch} {name}" for name in names]
+    return header
+
+
+class HarmonicAnalyzer(object):
+    """
+    Per-frame fundamental, THD and harmonic magnitudes.
+
+    Args:
+        rate (float): Per-channel sample rate.
+        channels (int): Number of channels interleaved in each block.
+        fundamental (float): Line frequency in Hz.
+        cycles (int): Line periods per frame (frequency resolution is
+            ``fundamental / cycles``).
+        overlap (float): Fraction of a frame shared with the next one.
+        count (int): Number of harmonics (1 = fundamental only).
+        scale (float or sequence): Factor applied to the magnitudes (e.g.
+            volts -> amps), one value or one per channel.
+
+    Raises:
+        ValueError: ``cycles`` is not above ``2 * LOBE_BINS`` (the lobes of
+            neighbouring harmonics would share bins) or the highest
+            harmonic is above the Nyquist frequency.
+    """
+
+    def __init__(self, rate, channels=1, fundamental=50.0, cycles=10,
+                 overlap=0.5, count=10, scale=1.0):
+        # Harmonics are ``cycles`` bins apart; each takes 2 * LOBE_BINS + 1
+        if cycles <= 2 * LOBE_BINS:
+            raise ValueError('Error: cycles must be above %d, got %s'
+                             % (2 * LOBE_BINS, cycles))
+        self.rate = float(rate)
+        self.channels = int(channels)
+        self.count = int(count)
+        self.frame = int(round(self.rate * cycles / fundamental))
+        self.hop = max(1, int(round(self.frame * (1.0 - overlap))))
+        # Bin spacing is rate / frame, so harmonic h sits at bin h * cycles
+        step = self.rate / self.frame
+        top = int(round(self.count * fundamental / step)) + LOBE_BINS
+        if top >= self.frame // 2:
+            raise ValueError('Error: harmonic %d is above the Nyquist frequency'
+                             % self.count)
+        self.scale = np.broadcast_to(
+            np.asarray(scale, dtype=np.float64), (self.channels,)).copy()
+
+        window = np.hanning(self.frame + 1)[:-1]  # periodic Hann
+        # RMS of a sine from the energy of its main lobe bins
+        self._norm = 2.0 / (self.frame * np.sum(window ** 2))
+        bins = []
+        for h in range(1, self.count + 1):
+            center = int(round(h * fundamental / step))
+            bins.extend(range(center - LOBE_BINS, center + LOBE_BINS + 1))
+        self.bins = np.array(bins)
+        phase = 2.0 * np.pi * np.outer(np.arange(self.frame), self.bins) / self.frame
+        self._basis = np.concatenate((np.cos(phase), np.sin(phase)), axis=1)
+        self._basis *= window[:, None]
+
+        self._work = np.empty((4 * self.frame, self.channels), dtype=np.float64)
+        self._carry_len = 0
+        self._out = np.empty((0, self._basis.shape[1]))
+        self.samples_in = 0
+        # Index (in samples) of the first sample of the next frame
+        self.next_frame = 0
+
+    def reset(self, skipped=0):
+        """
+        Drop the carried samples (e.g. after a scan restart).
+
+        Args:
+            skipped (int): Samples per channel lost before the next block;
+                the next frame starts after them.
+        """
+        self._carry_len = 0
+        self.samples_in += int(skipped)
+        self.next_frame = self.samples_in
+
+    def process(self, block):
+        # type: (np.ndarray) -> tuple
+        """
+        Analyze one raw block (interleaved like ``a_in_scan_read_numpy``).
+
+        Returns:
+            tuple: ``(centers, fundamental, thd, harmonics)``: sample index
+            of each frame center and the arrays of :py:data:`HarmonicBlock`
+            (no rows if no frame was completed).
+        """
+        block = np.asarray(block, dtype=np.float64).reshape(-1, self.channels)
+        total = self._carry_len + block.shape[0]
+        if total > self._work.shape[0]:
+            grown = np.empty((2 * total, self.channels), dtype=np.float64)
+            grown[:self._carry_len] = self._work[:self._carry_len]
+            self._work = grown
+        self._work[self._carry_len:total] = block
+        # Sample index of _work[0]
+        base = self.samples_in - self._carry_len
+        self.samples_in += block.shape[0]
+
+        first = self.next_frame - base
+        frames = 0 if total < first + self.frame else \
+            (total - first - self.frame) // self.hop + 1
+        if frames:
+            # (frames, channels, frame) strided view, no copy
+            view = np.lib.stride_tricks.sliding_window_view(
+                self._work[first:total], self.frame, axis=0)[::self.hop][:frames]
+            rows = frames * self.channels
+            if self._out.shape[0] < rows:
+                self._out = np.empty((rows, self._basis.shape[1]))
+            out = self._out[:rows].reshape(frames, self.channels, -1)
+            np.matmul(view, self._basis, out=out)
+            out *= out
+            lobes = out.reshape(frames, self.channels, 2, self.count, 2 * LOBE_BINS + 1)
+            harmonics = np.sqrt(lobes.sum(axis=(2, 4)) * self._norm)
+            harmonics *= self.scale[None, :, None]
+            fundamental = harmonics[:, :, 0]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                thd = 100.0 * np.sqrt(np.sum(harmonics[:, :, 1:] ** 2, axis=2)) / fundamental
+            centers = self.next_frame + self.hop * np.arange(frames) + self.frame // 2
+            self.next_frame += frames * self.hop
+        else:
+            harmonics = np.empty((0, self.channels, self.count))
+            fundamental = harmonics[:, :, 0]
+            thd = fundamental.copy()
+            centers = np.empty(0, dtype=np.int64)
+
+        # Keep the samples from the next frame start on
+        keep = total - (self.next_frame - base)
+        if keep and keep < total:
+            self._work[:keep] = self._work[total - keep:total]
+        self._carry_len = keep
+        return centers, fundamental, thd, harmonics
@@ -10,15 +10,55 @@ import os
 import signal
 import time
 from datetime import datetime
+from functools import partial
+
+from output_mux import OutputMultiplexer
+from heartbeat import HEARTBEAT_ENV, CHILD_KEY_ENV
+from supervisor import RestartPolicy, HeartbeatReceiver, ProcessSampler, write_status
+from sim_mcc118 import simulate_enabled
 
 # مسیر فایل‌های اسکریپت
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 SCRIPT_1 = os.path.join(CURRENT_DIR, "current_logger.py")
 SCRIPT_2 = os.path.join(CURRENT_DIR, "opc_logger.py")
+SCRIPT_3 = os.path.join(CURRENT_DIR, "compact_data.py")
+SCRIPT_SIM = os.path.join(CURRENT_DIR, "sim_opc_server.py")
+
+# فشرده‌سازی فایل‌های روزهای قبل در پس‌زمینه (با اولویت پایین)
+COMPACTION = True
+
+# لاگ خروجی processes (با چرخش فایل): logs/current_logger.log, logs/opc_logger.log
+LOG_DIR = os.path.join(CURRENT_DIR, "logs")
+
+# فایل وضعیت (هر STATUS_INTERVAL ثانیه): restart ها، heartbeat، CPU و RSS هر process
+STATUS_FILE = os.path.join(LOG_DIR, "status.json")
+STATUS_INTERVAL = 5
+# heartbeat قدیمی‌تر از این (ثانیه) = process سالم نیست
+HEARTBEAT_TIMEOUT = 10
+
+SCRIPTS = [SCRIPT_1, SCRIPT_2]
+NAMES = ["Current Logger", "OPC UA Logger"]
+if COMPACTION:
+    SCRIPTS.append(SCRIPT_3)
+    NAMES.append("Compaction")
+
+# KSF_SIMULATE=1: شبیه‌سازی MCC118 و سرور OPC UA محلی (بدون سخت‌افزار)
+SIMULATE = simulate_enabled()
+SIM_OPC_URL = "opc.tcp://127.0.0.1:4840"
+if SIMULATE:
+    SCRIPTS.append(SCRIPT_SIM)
+    NAMES.append("Simulated OPC UA Server")
+    os.environ.setdefault("KSF_OPC_URL", SIM_OPC_URL)
 
 # لیست برای نگهداری از processes
 processes = []
 
+# راه‌اندازی مجدد با تاخیر نمایی و تشخیص crash loop
+policies = [RestartPolicy() for _ in SCRIPTS]
+samplers = [None for _ in SCRIPTS]
+exit_codes = [None for _ in SCRIPTS]
+started_at = time.time()
+
 def print_header():
     """چاپ هدر شروع برنامه"""
     print("\n" + "="*70)
@@ -28,8 +68,11 @@ def print_header():
     print(f"Working Directory: {CURRENT_DIR}")
     print("="*70 + "\n")
 
-def start_process(script_path, name):
-    """شروع یک process جدید"""
+def start_process(script_path, name, mux, heartbeats):
+    """
+    شروع یک process جدید
+    mux: OutputMultiplexer خروجی processes - heartbeats: HeartbeatReceiver
+    """
     if not os.path.exists(script_path):
         print(f"ERROR: Script not found: {script_path}")
         return None
@@ -38,59 +81,113 @@ def start_process(script_path, name):
     try:
         # اجرای اسکریپت با Python
         # shell=False برای امنیت بیشتر
+        # خروجی بدون بافر تا هر خط فوراً به launcher برسد
+        key = os.path.splitext(os.path.basename(script_path))[0]
+        env = dict(os.environ, PYTHONUNBUFFERED="1")
+        env[HEARTBEAT_ENV] = heartbeats.address
+        env[CHILD_KEY_ENV] = key
         process = subprocess.Popen(
             [sys.executable, script_path],
             cwd=CURRENT_DIR,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1  # Line buffered
+            bufsize=0,
+            env=env
         )
+        mux.add(process, key, name)
         print(f"[{datetime.now().strftime('%H:%M:%S')}] {name} started (PID: {process.pid})")
         return process
     except Exception as e:
         print(f"ERROR starting {name}: {str(e)}")
         return None
 
-def monitor_processes():
+def status_snapshot(heartbeats):
+    """وضعیت همه‌ی processes برای status.json"""
+    now = time.time()
+    children = []
+    for i, (script, name) in enumerate(zip(SCRIPTS, NAMES)):
+        process = processes[i] if i < len(processes) else None
+        running = process is not None and process.poll() is None
+        policy = policies[i]
+        key = os.path.splitext(os.path.basename(script))[0]
+        beat = heartbeats.last.get(key)
+        if beat is not None and process is not None and beat.get("pid") != process.pid:
+            beat = None  # heartbeat قبل از restart
+        child = {
+            "name": name,
+            "key": key,
+            "state": policy.state(running),
+            "pid": process.pid if running else None,
+            "restarts": policy.restarts,
+            "recent_crashes": len(policy.crashes),
+            "last_exit_code": exit_codes[i],
+            "restart_in_s": (round(max(0.0, policy.restart_at - time.monotonic()), 1)
+                             if policy.restart_at is not None else None),
+            "heartbeat": beat,
+            "heartbeat_age_s": round(now - beat["received"], 1) if beat else None,
+            "healthy": bool(running and beat and now - beat["received"] <= HEARTBEAT_TIMEOUT),
+        }
+        if running and samplers[i] is not None:
+            child.update(samplers[i].sample())
+        children.append(child)
+    return {"time": now, "uptime_s": round(now - started_at, 1), "children": children}
+
+def restart_process(i, mux, heartbeats):
+    """شروع مجدد process شماره i (بعد از پایان تاخیر)"""
+    policies[i].restarts += 1
+    processes[i] = start_process(SCRIPTS[i], NAMES[i], mux, heartbeats)
+    if processes[i] is None:
+        wait = policies[i].on_exit()
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Restart of {NAMES[i]} failed, next attempt in {wait:.0f} s")
+    else:
+        policies[i].on_start()
+        samplers[i] = ProcessSampler(processes[i].pid)
+
+def monitor_processes(mux, heartbeats):
     """نگاه‌داشتن بر روی processes و نمایش خروجی آن‌ها"""
     print(f"[{datetime.now().strftime('%H:%M:%S')}] All processes started. Monitoring...\n")
     print("Press Ctrl+C to stop all processes\n")
+    print(f"Status file: {STATUS_FILE}")
     print("-"*70)
     
+    next_status = 0.0
     try:
         while True:
             # بررسی اینکه آیا processes هنوز زنده‌اند
-            for i, (process, name) in enumerate(zip(processes, ["Current Logger", "OPC UA Logger"])):
+            for i, (process, name) in enumerate(zip(processes, NAMES)):
                 if process is not None:
                     poll_result = process.poll()
                     if poll_result is not None:
+                        exit_codes[i] = poll_result
+                        processes[i] = None
+                        wait = policies[i].on_exit()
                         print(f"\n[{datetime.now().strftime('%H:%M:%S')}] WARNING: {name} has stopped (exit code: {poll_result})")
-                        print("Attempting to restart...\n")
-                        processes[i] = start_process(
-                            [SCRIPT_1, SCRIPT_2][i],
-                            name
-                        )
+                        if policies[i].crash_loop:
+                            print(f"Crash loop detected ({len(policies[i].crashes)} exits), restarting in {wait:.0f} s...\n")
+                        else:
+                            print(f"Attempting to restart in {wait:.0f} s...\n")
+                elif policies[i].due():
+                    restart_process(i, mux, heartbeats)
             
-            # خواندن خروجی از processes
-            for process, name in zip(processes, ["Current Logger", "OPC UA Logger"]):
-                if process is not None and process.poll() is None:
-                    try:
-                        # تلاش برای خواندن خروجی بدون مسدود کردن
-                        # این روش ساده‌تر است
-                        pass
-                    except:
-                        pass
+            # heartbeat ها و فایل وضعیت
+            heartbeats.poll()
+            if time.monotonic() >= next_status:
+                try:
+                    write_status(STATUS_FILE, status_snapshot(heartbeats))
+                except OSError as e:
+                    print(f"ERROR writing status file: {str(e)}")
+                next_status = time.monotonic() + STATUS_INTERVAL
             
-            time.sleep(1)
+            # خواندن خروجی از processes (حداکثر 1 ثانیه انتظار)
+            mux.poll(1.0)
     
     except KeyboardInterrupt:
         print(f"\n\n[{datetime.now().strftime('%H:%M:%S')}] Ctrl+C detected. Stopping all processes...\n")
-        stop_all_processes()
+        stop_all_processes(mux)
 
-def stop_all_processes():
+def stop_all_processes(mux):
     """متوقف کردن همه‌ی processes"""
-    for process, name in zip(processes, ["Current Logger", "OPC UA Logger"]):
+    for process, name in zip(processes, NAMES):
         if process is not None and process.poll() is None:
             print(f"[{datetime.now().strftime('%H:%M:%S')}] Stopping {name} (PID: {process.pid})...")
             try:
@@ -108,46 +205,76 @@ def stop_all_processes():
                     print(f"[{datetime.now().strftime('%H:%M:%S')}] {name} killed")
             except Exception as e:
                 print(f"ERROR stopping {name}: {str(e)}")
+    # آخرین خطوط خروجی
+    mux.drain()
+    mux.close()
 
-def signal_handler(sig, frame):
+def signal_handler(mux, sig, frame):
     """مدیریت سیگنال‌های interrupt"""
     print(f"\n\n[{datetime.now().strftime('%H:%M:%S')}] Signal {sig} received. Shutting down...\n")
-    stop_all_processes()
+    stop_all_processes(mux)
     sys.exit(0)
 
-def main():
-    """تابع اصلی"""
-    print_header()
-    
+def supervise(mux, heartbeats):
+    """شروع processes و مراقبت از آن‌ها تا Ctrl+C یا سیگنال"""
     # ثبت signal handlers
-    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGINT, partial(signal_handler, mux))
     if hasattr(signal, 'SIGTERM'):
-        signal.signal(signal.SIGTERM, signal_handler)
+        signal.signal(signal.SIGTERM, partial(signal_handler, mux))
     
     # اجرای اسکریپت‌ها
     print("Starting data collection processes...\n")
     
-    p1 = start_process(SCRIPT_1, "Current Logger (MCC118 RMS)")
+    if SIMULATE:
+        print("SIMULATION MODE: no hardware, OPC UA at " + os.environ["KSF_OPC_URL"] + "\n")
+        sim = start_process(SCRIPT_SIM, "Simulated OPC UA Server", mux, heartbeats)
+        time.sleep(2)  # سرور قبل از opc_logger آماده باشد
+    
+    p1 = start_process(SCRIPT_1, "Current Logger (MCC118 RMS)", mux, heartbeats)
     time.sleep(1)  # تاخیر کوچک بین شروع دو process
-    p2 = start_process(SCRIPT_2, "OPC UA Logger (Sinumerik)")
+    p2 = start_process(SCRIPT_2, "OPC UA Logger (Sinumerik)", mux, heartbeats)
     
     processes.append(p1)
     processes.append(p2)
+    if COMPACTION:
+        # خطا در شروع compaction مانع جمع‌آوری داده نمی‌شود (restart بعدی)
+        processes.append(start_process(SCRIPT_3, "Compaction (low priority)", mux, heartbeats))
+    if SIMULATE:
+        processes.append(sim)
+    for i, process in enumerate(processes):
+        if process is not None:
+            policies[i].on_start()
+            samplers[i] = ProcessSampler(process.pid)
+        else:
+            policies[i].on_exit()
     
     # بررسی اینکه آیا هر دو process شروع شدند
     if p1 is None or p2 is None:
         print("\nERROR: Failed to start one or more processes")
-        stop_all_processes()
+        stop_all_processes(mux)
         sys.exit(1)
     
     print()
     
     # مراقبت از processes
-    monitor_processes()
+    monitor_processes(mux, heartbeats)
     
     print(f"\n[{datetime.now().strftime('%H:%M:%S')}] All processes have been stopped")
     print(f"End Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("="*70 + "\n")
 
+def main():
+    """تابع اصلی"""
+    print_header()
+    
+    # خواندن خروجی همه‌ی processes بدون مسدود کردن
+    mux = OutputMultiplexer(LOG_DIR)
+    # heartbeat های processes روی UDP محلی
+    heartbeats = HeartbeatReceiver()
+    try:
+        supervise(mux, heartbeats)
+    finally:
+        heartbeats.close()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,163 @@
+"""
+Process supervision for the launcher (start.py)
+نظارت بر processes: راه‌اندازی مجدد با تاخیر، heartbeat و مصرف منابع
+
+- :py:class:`RestartPolicy`: exponential restart backoff; a child that
+  crashes ``CRASH_LOOP_COUNT`` times within ``CRASH_LOOP_WINDOW`` seconds
+  is held in the "crash-loop" state for ``CRASH_LOOP_HOLD`` seconds.
+- :py:class:`HeartbeatReceiver`: localhost UDP socket for the JSON
+  heartbeats sent by :py:mod:`heartbeat`.
+- :py:class:`ProcessSampler`: CPU % and RSS of a child from /proc (Linux;
+  other systems report None).
+- :py:func:`write_status`: atomic JSON snapshot of all children
+  (logs/status.json).
+"""
+import json
+import os
+import socket
+import time
+
+# تاخیر راه‌اندازی مجدد: 1, 2, 4, ... تا 60 ثانیه
+RESTART_DELAY = 1.0
+RESTART_DELAY_MAX = 60.0
+# اگر process این مدت سالم اجرا شود، تاخیر به مقدار اولیه برمی‌گردد
+STABLE_SEC = 60.0
+# تشخیص crash loop
+CRASH_LOOP_COUNT = 5
+CRASH_LOOP_WINDOW = 120.0
+CRASH_LOOP_HOLD = 300.0
+
+
+class RestartPolicy(object):
+    """زمان‌بندی راه‌اندازی مجدد یک process"""
+
+    def __init__(self, delay=RESTART_DELAY, delay_max=RESTART_DELAY_MAX,
+                 stable_sec=STABLE_SEC, loop_count=CRASH_LOOP_COUNT,
+                 loop_window=CRASH_LOOP_WINDOW, loop_hold=CRASH_LOOP_HOLD):
+        self.delay_min = delay
+        self.delay_max = delay_max
+        self.stable_sec = stable_sec
+        self.loop_count = loop_count
+        self.loop_window = loop_window
+        self.loop_hold = loop_hold
+        self.delay = delay
+        self.crashes = []
+        self.restarts = 0
+        self.started = None
+        self.restart_at = None
+        self.crash_loop = False
+
+    def on_start(self, now=None):
+        self.started = time.monotonic() if now is None else now
+        self.restart_at = None
+
+    def on_exit(self, now=None):
+        """
+        Record an exit and schedule the restart.
+
+        Returns:
+            float: Seconds until the restart.
+        """
+        now = time.monotonic() if now is None else now
+        if self.started is not None and now - self.started >= self.stable_sec:
+            self.delay = self.delay_min
+        self.crashes = [t for t in self.crashes if now - t < self.loop_window]
+        self.crashes.append(now)
+        self.crash_loop = len(self.crashes) >= self.loop_count
+        wait = self.loop_hold if self.crash_loop else self.delay
+        self.delay = min(self.delay * 2, self.delay_max)
+        self.started = None
+        self.restart_at = now + wait
+        return wait
+
+    def due(self, now=None):
+        """bool: The scheduled restart time has come."""
+        now = time.monotonic() if now is None else now
+        return self.restart_at is not None and now >= self.restart_at
+
+    def state(self, running):
+        if running:
+            return "running"
+        if self.restart_at is None:
+            return "stopped"
+        return "crash-loop" if self.crash_loop else "backoff"
+
+
+class HeartbeatReceiver(object):
+    """دریافت heartbeat های UDP از processes (فقط localhost)"""
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind((host, port))
+        self._socket.setblocking(False)
+        self.address = "%s:%d" % self._socket.getsockname()
+        self.last = {}
+
+    def poll(self):
+        """خواندن همه‌ی heartbeat های رسیده - آخرین پیام هر process نگه داشته می‌شود"""
+        count = 0
+        while True:
+            try:
+                data, _ = self._socket.recvfrom(65536)
+            except (BlockingIOError, InterruptedError):
+                return count
+            except OSError:
+                return count
+            try:
+                message = json.loads(data.decode("utf-8"))
+            except ValueError:
+                continue
+            message["received"] = time.time()
+            self.last[message.get("key")] = message
+            count += 1
+
+    def close(self):
+        self._socket.close()
+
+
+class ProcessSampler(object):
+    """CPU (درصد یک هسته) و RSS یک process از /proc"""
+
+    _ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def __init__(self, pid):
+        self.pid = pid
+        self._last = None
+
+    def _cpu_seconds(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            # فیلدهای بعد از نام (پرانتز آخر) - utime و stime فیلدهای 14 و 15
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self._ticks
+
+    def _rss_bytes(self):
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+        return None
+
+    def sample(self):
+        """
+        Returns:
+            dict: cpu_percent (since the previous call) and rss_bytes; None
+            values where /proc is not available.
+        """
+        try:
+            cpu, rss = self._cpu_seconds(), self._rss_bytes()
+        except (OSError, IndexError, ValueError):
+            return {"cpu_percent": None, "rss_bytes": None}
+        now = time.monotonic()
+        percent = None
+        if self._last is not None and now > self._last[0]:
+            percent = round(100.0 * (cpu - self._last[1]) / (now - self._last[0]), 1)
+        self._last = (now, cpu)
+        return {"cpu_percent": percent, "rss_bytes": rss}
+
+
+def write_status(path, snapshot):
+    """نوشتن اتمی فایل وضعیت (خواننده هیچ‌وقت فایل نیمه‌کاره نمی‌بیند)"""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, indent=2, default=str)
+    os.replace(tmp, path)
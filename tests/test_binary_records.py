@@ -0,0 +1,89 @@
+import os
+import zipfile
+
+import numpy as np
+import pytest
+
+from binary_records import (RecordWriter, read_records, read_header, data_files,
+                            open_data, ARCHIVE_SEP)
+
+DTYPE = np.dtype([('t', '<f8'), ('rms', '<f4', (3,)), ('count', '<u4')])
+
+
+def records(n, start=0):
+    out = np.zeros(n, dtype=DTYPE)
+    out['t'] = start + np.arange(n) * 0.25
+    out['rms'] = np.arange(3 * n).reshape(n, 3)
+    out['count'] = np.arange(n)
+    return out
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "data.bin")
+    writer = RecordWriter(path, DTYPE, {"channels": [4, 5, 6]})
+    writer.append(records(10))
+    writer.close()
+    meta, data = read_records(path)
+    assert meta["channels"] == [4, 5, 6]
+    assert data.dtype == DTYPE
+    np.testing.assert_array_equal(data, records(10))
+
+
+def test_reopen_appends_and_drops_partial_record(tmp_path):
+    path = str(tmp_path / "data.bin")
+    writer = RecordWriter(path, DTYPE)
+    writer.append(records(4))
+    writer.close()
+    # Interrupted write: half a record at the end
+    with open(path, 'ab') as f:
+        f.write(b'\0' * (DTYPE.itemsize // 2))
+    writer = RecordWriter(path, DTYPE)
+    assert writer.records == 4
+    writer.append(records(3, start=1))
+    writer.overwrite(0, records(1, start=100))
+    writer.close()
+    _, data = read_records(path)
+    assert len(data) == 7
+    assert data['t'][0] == 100
+    np.testing.assert_array_equal(data[4:], records(3, start=1))
+
+
+def test_dtype_mismatch(tmp_path):
+    path = str(tmp_path / "data.bin")
+    RecordWriter(path, DTYPE).close()
+    with pytest.raises(ValueError):
+        RecordWriter(path, np.dtype([('t', '<f8')]))
+
+
+def test_archive_member(tmp_path):
+    path = str(tmp_path / "data.bin")
+    writer = RecordWriter(path, DTYPE, {"source": "test"})
+    writer.append(records(5))
+    writer.close()
+    archive = str(tmp_path / "archive.zip")
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.write(path, "data.bin")
+    member = archive + ARCHIVE_SEP + "data.bin"
+    assert read_header(member)[0]["source"] == "test"
+    np.testing.assert_array_equal(read_records(member)[1], records(5))
+    with open_data(member) as f:
+        assert f.read() == open(path, 'rb').read()
+
+
+def test_data_files_prefers_plain_files(tmp_path):
+    folder = tmp_path
+    (folder / "archive").mkdir()
+    with zipfile.ZipFile(str(folder / "archive" / "day.zip"), 'w') as z:
+        z.writestr("a.csv", "x\n")
+        z.writestr("b.csv", "x\n")
+    (folder / "b.csv").write_text("y\n")
+    files = dict(data_files(str(folder)))
+    assert files["b.csv"] == os.path.join(str(folder), "b.csv")
+    assert files["a.csv"].endswith("day.zip" + ARCHIVE_SEP + "a.csv")
+    (folder / "c.csv").write_text("z\n")
+    with zipfile.ZipFile(str(folder / "archive" / "day2.zip"), 'w') as z:
+        z.writestr("c.bin", b"")
+        z.writestr("c.bin.status.csv", "x\n")
+    files = dict(data_files(str(folder)))
+    # A plain file hides the converted copy of it in the archive
+    assert "c.bin" not in files and "c.bin.status.csv" not in files
@@ -0,0 +1,87 @@
+import os
+import zipfile
+from datetime import datetime
+
+import numpy as np
+
+import compact_data
+import merge_data
+from binary_records import read_records, data_files, ARCHIVE_SEP
+from compact_data import compact, Throttle, archive_day
+from opc_status import load_dense
+
+BASE = datetime(2020, 1, 12, 10, 0, 0).timestamp()
+
+
+def stamp(t):
+    return datetime.fromtimestamp(t).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def write_current_csv(folder):
+    path = os.path.join(str(folder), "currentdata_2020-01-12_10-00-00.csv")
+    lines = ["Time (s),Timestamp,RMS Current (A),Peak Current (A),Min Current (A)"]
+    for i in range(5):
+        lines.append(f"{i * 0.5:.6f},{stamp(BASE + i * 0.5)},{i}.5,{i + 1}.0,-{i + 1}.0")
+        if i == 2:
+            lines.append("# anchor time_s=1.000000 drift_s=0.000100")
+    with open(path, "w", newline="") as f:
+        f.write("\r\n".join(lines) + "\r\n")
+    return path
+
+
+def write_opc_csv(folder):
+    path = os.path.join(str(folder), "opc_data_20200112_100000.csv")
+    with open(path, "w", newline="") as f:
+        f.write("timestamp,speed,load\r\n")
+        f.write(f"{stamp(BASE)[:-3]},1.5,Error: timeout\r\n")
+        f.write(f"{stamp(BASE + 1)[:-3]},2.5,\r\n")
+        f.write(f"{stamp(BASE + 2)[:-3]},3.5,40\r\n")
+    with open(path + ".status.csv", "w", newline="") as f:
+        f.write(f"timestamp,name,value\r\n{stamp(BASE)[:-3]},tool,7\r\n")
+    return path
+
+
+def test_current_csv_archived_as_binary_records(tmp_path):
+    path = write_current_csv(tmp_path)
+    before = list(merge_data.read_current(path))
+    assert compact([(str(tmp_path), "current")], min_age=0) == 1
+    assert not os.path.exists(path)
+
+    archive = str(tmp_path / "archive" / "current_2020-01-12.zip")
+    with zipfile.ZipFile(archive) as zf:
+        assert sorted(zf.namelist()) == ["currentdata_2020-01-12_10-00-00.bin",
+                                         "currentdata_2020-01-12_10-00-00.bin.events"]
+        assert zf.read("currentdata_2020-01-12_10-00-00.bin.events").startswith(b"# anchor ")
+    meta, records = read_records(archive + ARCHIVE_SEP + "currentdata_2020-01-12_10-00-00.bin")
+    assert meta["archived_from"] == os.path.basename(path)
+    np.testing.assert_allclose(records["t"], BASE + np.arange(5) * 0.5)
+
+    files = merge_data.current_files(str(tmp_path), BASE, BASE + 10)
+    after = [chunk for f in files for chunk in merge_data.read_current(f)]
+    assert after[0].columns == before[0].columns
+    np.testing.assert_allclose(after[0].t, before[0].t)
+    np.testing.assert_allclose(after[0].values, before[0].values, rtol=1e-6)
+
+
+def test_opc_csv_keeps_text_cells_and_status(tmp_path):
+    path = write_opc_csv(tmp_path)
+    assert compact([(str(tmp_path), "opc")], min_age=0) == 2
+    assert os.listdir(str(tmp_path)) == ["archive"]
+    store = load_dense(str(tmp_path), BASE, BASE + 2)
+    assert store.columns == ["speed", "load", "tool"]
+    rows = [row[1:] for row in store.rows()]
+    assert rows == [[1.5, "Error: timeout", 7], [2.5, "", 7], [3.5, 40.0, 7]]
+
+
+def test_failed_check_keeps_the_source(tmp_path, monkeypatch):
+    path = write_opc_csv(tmp_path)
+    # Archived rows differ from the source: nothing is deleted
+    monkeypatch.setattr(compact_data, "_same_rows", lambda stored, expected: False)
+    archived, _ = archive_day(str(tmp_path), "opc", "2020-01-12",
+                              [path, path + ".status.csv"], Throttle(1e12))
+    assert archived == 0
+    assert os.path.exists(path) and os.path.exists(path + ".status.csv")
+    # The plain files hide their converted copy in the archive
+    assert sorted(name for name, _ in data_files(str(tmp_path))
+                  if name.startswith("opc_data_")) == [
+        "opc_data_20200112_100000.csv", "opc_data_20200112_100000.csv.status.csv"]
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from current_pipeline import CurrentPipeline
+from rms_engine import BlockRmsEngine
+from sample_clock import SampleClock
+from sim_mcc118 import ScanReadResult
+
+
+class FakeWriter(object):
+    def __init__(self):
+        self.blocks = []
+        self.full = False
+
+    def submit(self, block):
+        if self.full:
+            return False
+        self.blocks.append(block)
+        return True
+
+
+class FakeScheduler(object):
+    backlog = 0
+
+
+def read(samples, hardware_overrun=False):
+    data = np.full(samples, 0.5)
+    return ScanReadResult(True, hardware_overrun, False, True, False, data)
+
+
+def pipeline(restarts):
+    clock = SampleClock(1000.0, start_time=0.0)
+    return CurrentPipeline(None, FakeScheduler(), clock, BlockRmsEngine(10, scale=2.0),
+                           FakeWriter(), lambda: restarts.append(True), mono_start=0.0)
+
+
+def test_window_times_from_the_sample_clock():
+    p = pipeline([])
+    assert p.process(read(25)) is None
+    p.process(read(25))
+    first, second = p.writer.blocks
+    np.testing.assert_allclose(first.t, [0.0, 0.01])
+    np.testing.assert_allclose(second.t, [0.02, 0.03, 0.04])
+    np.testing.assert_allclose(second.rms, 1.0)
+    assert second.scan_time == pytest.approx(0.05)
+    assert p.samples_read == 50
+
+
+def test_dropped_blocks_become_one_gap():
+    p = pipeline([])
+    p.process(read(20))
+    p.writer.full = True
+    p.process(read(20))
+    p.process(read(30))
+    assert not p.submitted
+    p.writer.full = False
+    p.process(read(10))
+    (gap,) = p.writer.blocks[-1].gaps
+    assert (gap.start, gap.samples, gap.reason) == (0.02, 50, "writer_queue_full")
+    assert gap.duration == pytest.approx(0.05)
+    assert p.pending_gaps == []
+
+
+def test_overrun_restarts_the_scan_and_records_the_gap(monkeypatch):
+    restarts = []
+    p = pipeline(restarts)
+    now = [0.0]
+    monkeypatch.setattr("current_pipeline.time.monotonic", lambda: now[0])
+    p.process(read(100))
+    now[0] = 0.3
+    # The read that reports the overrun still delivers its samples
+    assert p.process(read(50, hardware_overrun=True)) == "hardware_overrun"
+    assert restarts == [True]
+    # Restart position: 100 samples at the last good read + 0.3 s
+    (gap,) = p.pending_gaps
+    assert (gap.start, gap.samples, gap.reason) == (0.15, 250, "hardware_overrun")
+    assert p.samples_lost == 250 and p.overruns["hardware_overrun"] == 1
+    p.process(read(10))
+    assert p.writer.blocks[-1].gaps == [gap]
+    np.testing.assert_allclose(p.writer.blocks[-1].t, [0.4])
@@ -0,0 +1,85 @@
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import merge_data
+from current_writer import (BlockWriter, BinaryRmsSink, CsvRmsSink, Gap, RmsBlock,
+                            CSV_HEADER)
+from rollups import RollupWriter, read_rollups
+from sample_clock import SampleClock
+
+BASE = datetime(2026, 1, 12, 10, 0, 0).timestamp()
+
+
+def block(first, gaps=None):
+    t = first + np.arange(10) * 0.1
+    rms = (t + 1).reshape(-1, 1)
+    return RmsBlock(t, rms, rms * 1.5, -rms, first + 1.0, BASE + first + 1.0005,
+                    gaps=gaps)
+
+
+def run_writer(tmp_path, sink_cls):
+    clock = SampleClock(100.0, start_time=BASE)
+    rollups = RollupWriter(str(tmp_path / "rollups"), [4])
+    writer = BlockWriter(
+        lambda epoch, ext: str(tmp_path / ("currentdata_2026-01-12_10-00-00" + ext)),
+        clock, period_sec=3600, anchor_sec=10, sink_cls=sink_cls,
+        meta={"channels": [4]}, rollups=rollups)
+    writer.start()
+    writer.submit(block(0.0))
+    writer.submit(block(1.5, gaps=[Gap(1.0, 50, 0.5, "hardware_overrun")]))
+    writer.stop(timeout=10)
+    return writer.sink.path
+
+
+def fields(line):
+    return dict(field.split("=", 1) for field in line.split()[2:])
+
+
+def test_csv_gap_and_anchor_are_comment_lines(tmp_path):
+    path = run_writer(tmp_path, CsvRmsSink)
+    with open(path, newline="") as f:
+        lines = f.read().splitlines()
+    assert lines[0].split(",") == CSV_HEADER
+    rows = [line for line in lines[1:] if not line.startswith("#")]
+    comments = [line for line in lines[1:] if line.startswith("#")]
+    assert len(rows) == 20
+    assert all(len(row.split(",")) == len(CSV_HEADER) for row in rows)
+    assert [line.split()[1] for line in comments] == ["anchor", "gap"]
+    anchor, gap = fields(comments[0]), fields(comments[1])
+    assert anchor["sample_clock"] == "2026-01-12T10:00:01.000000"
+    assert float(anchor["drift_s"]) == pytest.approx(0.0005)
+    assert gap == {"time_s": "1.000000", "sample_clock": "2026-01-12T10:00:01.000000",
+                   "duration_s": "0.500000", "samples": "50",
+                   "reason": "hardware_overrun"}
+    # merge_data reads the rows around the comment lines
+    chunks = list(merge_data.read_current(path))
+    t = np.concatenate([chunk.t for chunk in chunks])
+    np.testing.assert_allclose(t - BASE, np.r_[np.arange(10), 15 + np.arange(10)] * 0.1,
+                               atol=1e-6)
+
+
+def test_binary_events_file(tmp_path):
+    path = run_writer(tmp_path, BinaryRmsSink)
+    with open(path + ".events", newline="") as f:
+        lines = f.read().splitlines()
+    assert [line.split()[:2] for line in lines] == [["#", "anchor"], ["#", "gap"]]
+    assert fields(lines[1])["samples"] == "50"
+
+
+@pytest.mark.parametrize("sink_cls", [CsvRmsSink, BinaryRmsSink])
+def test_stats_sidecar_and_rollups(tmp_path, sink_cls):
+    path = run_writer(tmp_path, sink_cls)
+    with open(path + ".stats.json") as f:
+        stats = json.load(f)
+    assert stats["file"] == os.path.basename(path)
+    assert stats["rows"] == 20
+    assert (stats["gaps"], stats["samples_lost"], stats["seconds_lost"]) == (1, 50, 0.5)
+    assert stats["hardware_overruns"] == 1 and stats["writer_drops"] == 0
+    assert stats["gap_list"][0]["start"] == pytest.approx(BASE + 1.0)
+    # Only RMS rows are aggregated: the gap leaves a short bucket
+    records = read_rollups(str(tmp_path / "rollups"), "1s", BASE, BASE + 10)
+    assert list(records["count"]) == [10, 5, 5]
@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+import pytest
+
+from live_bus import LiveRing, current_dtype
+
+
+@pytest.fixture
+def ring():
+    ring = LiveRing.create(f"ksf_test_{os.getpid()}", current_dtype(2), 64,
+                           meta={"channels": [4, 5]})
+    yield ring
+    ring.close()
+
+
+def rows(ring, start, n):
+    records = np.zeros(n, dtype=ring.dtype)
+    records['t'] = start + np.arange(n)
+    records['rms'] = records['t'][:, None]
+    return records
+
+
+def test_read_since_in_order(ring):
+    ring.publish(rows(ring, 0, 10))
+    assert ring.meta["channels"] == [4, 5]
+    records, count, lost = ring.read_since(0)
+    assert count == 10 and lost == 0
+    np.testing.assert_array_equal(records['t'], np.arange(10))
+    ring.publish(rows(ring, 10, 5))
+    records, count, lost = ring.read_since(count)
+    np.testing.assert_array_equal(records['t'], np.arange(10, 15))
+
+
+def test_wraparound(ring):
+    # 150 records through a ring of 64, in blocks that straddle the end
+    for start in range(0, 150, 25):
+        ring.publish(rows(ring, start, 25))
+    assert ring.count == 150
+    records, count, lost = ring.read_since(0)
+    # The reserve at the writer's position is never handed out
+    kept = ring.capacity - ring.reserve
+    np.testing.assert_array_equal(records['t'], np.arange(150 - kept, 150))
+    assert lost == 150 - kept
+    np.testing.assert_array_equal(ring.latest(3)['t'], [147, 148, 149])
+    np.testing.assert_array_equal(ring.since_time(145)['t'], np.arange(145, 150))
+
+
+def test_publish_larger_than_capacity(ring):
+    ring.publish(rows(ring, 0, 200))
+    assert ring.count == 200
+    records, _, lost = ring.read_since(0)
+    assert records['t'][-1] == 199
+    assert np.all(np.diff(records['t']) == 1)
+    assert lost + len(records) == 200
@@ -0,0 +1,51 @@
+import numpy as np
+
+from merge_data import Chunk, resample, downsample, _parse_stats
+
+
+def chunks(t, values, columns, size):
+    values = np.asarray(values, dtype=np.float64).reshape(len(t), -1)
+    return [Chunk(t[i:i + size], values[i:i + size], columns)
+            for i in range(0, len(t), size)]
+
+
+def test_resample_latest_opc_sample_within_tolerance():
+    t = np.arange(0, 10, 0.5)
+    current = chunks(t, t, ["rms"], 7)
+    opc = chunks(np.array([1.0, 3.0, 6.0]), [10.0, 30.0, 60.0], ["speed"], 2)
+    out = list(resample(current, opc, tolerance=2.5))
+    assert all(chunk.columns == ["rms", "speed"] for chunk in out)
+    t_out = np.concatenate([chunk.t for chunk in out])
+    values = np.concatenate([chunk.values for chunk in out])
+    np.testing.assert_array_equal(t_out, t)
+    np.testing.assert_array_equal(values[:, 0], t)
+    expected = np.where(t < 1, np.nan, np.where(t < 3, 10.0, np.where(t < 6, 30.0, 60.0)))
+    # More than 2.5 s after the last OPC sample
+    expected[t > 8.5] = np.nan
+    np.testing.assert_array_equal(values[:, 1], expected)
+
+
+def test_downsample_statistics_between_opc_samples():
+    t = np.round(np.arange(0, 3, 0.1), 6)
+    current = chunks(t, t, ["rms"], 8)
+    opc = chunks(np.array([0.0, 1.0, 2.0]), [1.0, 2.0, 3.0], ["speed"], 2)
+    out = list(downsample(current, opc, _parse_stats("mean,max,min"), max_interval=5.0))
+    assert out[0].columns == ["speed", "rms mean", "rms max", "rms min", "RMS samples"]
+    values = np.concatenate([chunk.values for chunk in out])
+    np.testing.assert_array_equal(np.concatenate([chunk.t for chunk in out]), [0, 1, 2])
+    np.testing.assert_array_equal(values[:, 0], [1, 2, 3])
+    np.testing.assert_allclose(values[:, 1], [0.45, 1.45, 2.45])
+    np.testing.assert_allclose(values[:, 2], [0.9, 1.9, 2.9])
+    np.testing.assert_allclose(values[:, 3], [0.0, 1.0, 2.0])
+    np.testing.assert_array_equal(values[:, 4], [10, 10, 10])
+
+
+def test_downsample_caps_long_intervals():
+    t = np.arange(0, 10, 1.0)
+    current = chunks(t, t, ["rms"], 4)
+    opc = chunks(np.array([0.0, 8.0]), [1.0, 2.0], ["speed"], 2)
+    out = list(downsample(current, opc, _parse_stats("mean"), max_interval=2.0))
+    values = np.concatenate([chunk.values for chunk in out])
+    # Only the rows within max_interval after each OPC sample
+    np.testing.assert_allclose(values[:, 1], [0.5, 8.5])
+    np.testing.assert_array_equal(values[:, 2], [2, 2])
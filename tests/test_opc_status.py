@@ -0,0 +1,45 @@
+from datetime import datetime
+
+import pytest
+
+from opc_logger import StreamingBinaryWriter, StreamingCsvWriter
+from opc_status import StatusChangeEncoder, format_timestamp, load_dense, parse_timestamp
+
+BASE = datetime(2026, 1, 12, 10, 0, 0).timestamp()
+
+
+def test_parse_timestamp_formats():
+    assert parse_timestamp("2026-01-12 10:00") == BASE
+    assert parse_timestamp("2026-01-12 10:00:01.250") == BASE + 1.25
+    assert parse_timestamp(format_timestamp(BASE + 0.5)) == BASE + 0.5
+    with pytest.raises(ValueError):
+        parse_timestamp("12.01.2026")
+
+
+@pytest.mark.parametrize("writer_class", [StreamingCsvWriter, StreamingBinaryWriter])
+def test_change_only_status_round_trip(tmp_path, writer_class):
+    writer = writer_class(str(tmp_path), fieldnames=["timestamp", "speed"],
+                          rotate_seconds=float("inf"), flush_interval=0,
+                          status_encoder=StatusChangeEncoder(["tool", "mode"]))
+    rows = []
+    for i in range(10):
+        row = {"timestamp": format_timestamp(BASE + i), "speed": float(i),
+               "tool": 1 if i < 4 else 2, "mode": "AUTO"}
+        rows.append(row)
+        writer.write(row)
+        if i == 5:
+            # The second file starts with a snapshot of the status values
+            writer.close()
+    writer.close()
+    assert writer.files == 2
+
+    store = load_dense(str(tmp_path), BASE, BASE + 9)
+    assert store.columns == ["speed", "tool", "mode"]
+    assert [list(row) for row in store.rows()] == [
+        [row["timestamp"], row["speed"], row["tool"], row["mode"]] for row in rows]
+    # Only the status changes were written
+    with open(writer.path + ".status.csv", encoding="utf-8") as f:
+        assert len(f.readlines()) == 1 + 2
+
+    later = load_dense(str(tmp_path), BASE + 7, BASE + 9)
+    assert [row[2:] for row in later.rows()] == [[2, "AUTO"]] * 3
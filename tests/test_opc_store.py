@@ -0,0 +1,55 @@
+import math
+from datetime import datetime
+
+import pytest
+
+from binary_records import read_records
+from opc_logger import StreamingBinaryWriter
+from opc_status import format_timestamp
+from opc_store import OpcSampleStore, open_binary, read_errors
+
+BASE = datetime(2026, 1, 12, 10, 0, 0).timestamp()
+
+
+def test_cells_keep_type_missing_and_nan():
+    store = OpcSampleStore(["flag", "count", "speed", "load", "alarm"], capacity=2)
+    store.append(BASE, [True, 3, 1.5, math.nan, "Error: timeout"])
+    store.append(BASE + 1, [False, 4, None, 2.0, ""])
+    rows = list(store.rows())
+    assert rows[0][0] == "2026-01-12 10:00:00.000"
+    assert rows[0][1:3] == [True, 3] and rows[0][3] == 1.5
+    assert math.isnan(rows[0][4]) and rows[0][5] == "Error: timeout"
+    assert rows[1][1:] == [False, 4, "", 2.0, ""]
+    with pytest.raises(IndexError):
+        store.append(BASE + 2, [True, 5, 1.0, 1.0, 1.0])
+
+
+def test_binary_errors_table(tmp_path):
+    store = OpcSampleStore(["speed", "alarm"], capacity=4)
+    store.append(BASE, [math.nan, "Error: timeout"])
+    store.append(BASE + 0.5, [None, 1.0])
+    path = str(tmp_path / "opc_data_20260112_100000.bin")
+    writer = open_binary(path, store.columns)
+    store.to_binary(writer)
+    writer.close()
+    meta, records = read_records(path)
+    assert meta["columns"] == ["speed", "alarm"]
+    assert list(records["t"]) == [BASE, BASE + 0.5]
+    # A NaN value has no errors line, a missing cell has an empty one
+    assert read_errors(path) == [(BASE, "alarm", "Error: timeout"),
+                                 (BASE + 0.5, "speed", "")]
+
+
+def test_binary_writer_rows_buffered_until_flush(tmp_path):
+    writer = StreamingBinaryWriter(str(tmp_path), fieldnames=["timestamp", "speed", "alarm"],
+                                   rotate_seconds=float("inf"), flush_interval=3600)
+    writer.write({"timestamp": format_timestamp(BASE), "speed": 1.5, "alarm": "Error: x"})
+    writer.write({"timestamp": format_timestamp(BASE + 1), "speed": 2.5})
+    assert writer.rows == 0
+    writer.close()
+    meta, records = read_records(writer.path)
+    assert list(records["t"]) == [BASE, BASE + 1]
+    assert list(records["speed"]) == [1.5, 2.5]
+    assert read_errors(writer.path) == [(BASE, "alarm", "Error: x"),
+                                        (BASE + 1, "alarm", "")]
+    assert writer.rows == 2
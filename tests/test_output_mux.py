@@ -0,0 +1,49 @@
+import subprocess
+import sys
+import time
+
+from output_mux import ChildOutput, OutputMultiplexer
+
+
+def log_lines(folder, key):
+    with open(str(folder / f"{key}.log"), encoding="utf-8") as f:
+        return [line.rstrip("\n").split("] ", 2)[2] for line in f]
+
+
+def test_lines_split_across_reads(tmp_path):
+    output = ChildOutput("split", "Split", str(tmp_path), echo=False)
+    output.feed(b"first li")
+    output.feed(b"ne\r\nprogress 1\rprogress 2\r\n\nlast")
+    assert output.lines == 3
+    output.finish()
+    output.close()
+    assert log_lines(tmp_path, "split") == ["first line", "progress 1", "progress 2", "last"]
+
+
+def test_console_rate_limit_keeps_every_line_in_the_log(tmp_path, capsys):
+    output = ChildOutput("noisy", "Noisy", str(tmp_path), rate=0.001, burst=2)
+    output.feed(b"".join(b"line %d\n" % i for i in range(10)))
+    output.finish()
+    output.close()
+    console = capsys.readouterr().out.splitlines()
+    assert [line.split("] ", 2)[2] for line in console] == [
+        "line 0", "line 1",
+        "... 8 line(s) not shown (console rate limit 0.001/s, all in the log file)"]
+    assert output.suppressed == 8
+    assert log_lines(tmp_path, "noisy") == [f"line {i}" for i in range(10)]
+
+
+def test_multiplexer_reads_child_output(tmp_path):
+    mux = OutputMultiplexer(str(tmp_path), echo=False)
+    process = subprocess.Popen(
+        [sys.executable, "-c", "import sys\nfor i in range(500): print('row', i)\n"
+                               "sys.stdout.write('no newline')"],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0)
+    mux.add(process, "child", "Child")
+    deadline = time.monotonic() + 10
+    while process.poll() is None and time.monotonic() < deadline:
+        mux.poll(0.1)
+    mux.drain()
+    mux.close()
+    lines = log_lines(tmp_path, "child")
+    assert lines == [f"row {i}" for i in range(500)] + ["no newline"]
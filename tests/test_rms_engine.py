@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from rms_engine import BlockRmsEngine, CycleRmsEngine
+
+RATE = 10000.0
+AMPLITUDE = 2.0
+
+
+def sine(count, start=0, freq=50.0, phase=0.3, channels=1):
+    t = (start + np.arange(count)) / RATE
+    angle = 2.0 * np.pi * freq * t[:, None] - 2.0 * np.pi / 3.0 * np.arange(channels)
+    return (AMPLITUDE * np.sin(angle + phase)).ravel()
+
+
+def test_block_rms_of_whole_periods():
+    # 200 samples = one 50 Hz period
+    engine = BlockRmsEngine(200, scale=10.0, channels=3)
+    rms, peak, minimum = engine.process(sine(2000, channels=3))
+    assert rms.shape == (10, 3)
+    np.testing.assert_allclose(rms, 10.0 * AMPLITUDE / np.sqrt(2.0), rtol=1e-9)
+    np.testing.assert_allclose(peak, 10.0 * AMPLITUDE, rtol=1e-3)
+    np.testing.assert_allclose(minimum, -10.0 * AMPLITUDE, rtol=1e-3)
+
+
+def test_block_rms_carries_samples_between_blocks():
+    data = sine(1000)
+    whole = BlockRmsEngine(7).process(data)[0]
+    engine = BlockRmsEngine(7)
+    parts = [engine.process(data[i:i + 93])[0] for i in range(0, len(data), 93)]
+    np.testing.assert_allclose(np.concatenate(parts), whole)
+    assert engine.carry_len == len(data) % 7
+    assert engine.windows_out == len(data) // 7
+
+
+def test_block_rms_rejects_empty_window():
+    with pytest.raises(ValueError):
+        BlockRmsEngine(0)
+
+
+def test_cycle_rms_follows_zero_crossings():
+    engine = CycleRmsEngine(RATE, 50.0, cycles=1, hysteresis=0.02)
+    rms = np.concatenate([engine.process(sine(500, start))[0]
+                          for start in range(0, 5000, 500)])
+    np.testing.assert_allclose(rms, AMPLITUDE / np.sqrt(2.0), rtol=1e-3)
+    # Samples before the first crossing are dropped, then one row per period
+    assert len(rms) == 24
+
+
+def test_cycle_rms_rows_start_on_crossings():
+    engine = CycleRmsEngine(RATE, 50.0, cycles=2)
+    engine.process(sine(4000))
+    assert np.all(np.diff(engine.starts) == 400)
+    assert np.all(sine(4000)[engine.starts] > 0)
+
+
+def test_cycle_rms_forced_rows_then_resync():
+    engine = CycleRmsEngine(RATE, 50.0, cycles=1)
+    # No signal: nominal-length rows so the output does not stall
+    rms, _, _ = engine.process(np.zeros(1000))
+    assert len(rms) == 3
+    np.testing.assert_allclose(rms, 0.0)
+    # One more forced row, then the first real crossing closes the open
+    # row and the next rows start on crossings
+    engine.process(sine(2000, start=1000))
+    assert engine.starts[:2].tolist() == [800, 1000]
+    crossings = engine.starts[2:]
+    assert np.all(np.diff(crossings) == 200)
+    assert np.all(sine(1, start=int(crossings[0]))[0] > 0)
@@ -0,0 +1,55 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from rollups import RollupWriter, read_rollups
+
+BASE = datetime(2026, 10, 18, 8, 0, 0).timestamp()
+
+
+def rows(t, channels=1):
+    rms = np.tile((t - BASE + 1).reshape(-1, 1), (1, channels)) * np.arange(1, channels + 1)
+    return rms, rms * 1.5, -rms
+
+
+def test_buckets_per_level(tmp_path):
+    writer = RollupWriter(str(tmp_path), [4])
+    t = BASE + np.arange(12) * 0.25
+    writer.add(t, *rows(t))
+    writer.close()
+    seconds = read_rollups(str(tmp_path), "1s", BASE, BASE + 10)
+    assert list(seconds["t"] - BASE) == [0, 1, 2]
+    assert list(seconds["count"]) == [4, 4, 4]
+    np.testing.assert_allclose(seconds["mean"], [1.375, 2.375, 3.375])
+    np.testing.assert_allclose(seconds["rms"][0], np.sqrt(np.mean(np.square([1, 1.25, 1.5, 1.75]))),
+                               rtol=1e-6)
+    np.testing.assert_allclose(seconds["max"], [2.625, 4.125, 5.625])
+    np.testing.assert_allclose(seconds["min"], [-1.75, -2.75, -3.75])
+    (minute,) = read_rollups(str(tmp_path), "1min", BASE, BASE)
+    assert minute["count"] == 12 and minute["mean"] == pytest.approx(2.375)
+    assert read_rollups(str(tmp_path), "1h", BASE + 1, BASE + 10).size == 0
+
+
+def test_restart_continues_the_open_bucket(tmp_path):
+    t = BASE + np.arange(8) * 0.25
+    first = RollupWriter(str(tmp_path), [4])
+    first.add(t[:3], *rows(t[:3]))
+    first.close()
+    second = RollupWriter(str(tmp_path), [4])
+    second.add(t[3:], *rows(t[3:]))
+    second.close()
+    seconds = read_rollups(str(tmp_path), "1s", BASE, BASE + 10)
+    assert list(seconds["count"]) == [4, 4]
+    np.testing.assert_allclose(seconds["mean"], [1.375, 2.375])
+    np.testing.assert_allclose(seconds["min"], [-1.75, -2.75])
+
+
+def test_channels_side_by_side(tmp_path):
+    writer = RollupWriter(str(tmp_path), [4, 5, 6])
+    t = BASE + np.arange(4) * 0.25
+    writer.add(t, *rows(t, 3))
+    writer.close()
+    (record,) = read_rollups(str(tmp_path), "1s", BASE, BASE)
+    np.testing.assert_allclose(record["mean"], [1.375, 2.75, 4.125])
+    np.testing.assert_allclose(record["max"], [2.625, 5.25, 7.875])
@@ -0,0 +1,63 @@
+from collections import namedtuple
+
+import numpy as np
+
+from scan_scheduler import Histogram, ReadScheduler
+
+Status = namedtuple("Status", ["samples_available"])
+Result = namedtuple("Result", ["data"])
+
+
+def test_histogram_bins_and_percentile():
+    hist = Histogram([0, 1, 2, 5, 10])
+    assert hist.percentile(50) is None
+    for value in [0.5] * 60 + [1.0] * 30 + [7.0] * 9 + [30.0]:
+        hist.add(value)
+    assert hist.counts.tolist() == [60, 30, 0, 9, 1]
+    assert hist.percentile(50) == 0.0
+    assert hist.percentile(90) == 1.0
+    assert hist.percentile(99) == 5.0
+    assert hist.percentile(100) == 10.0
+    assert hist.max == 30.0
+    hist.reset()
+    assert hist.percentile(50) is None and hist.max == 0.0
+
+
+def test_update_grows_on_backlog_and_shrinks_back():
+    scheduler = ReadScheduler(20000.0, 20000, target_period=0.05)
+    assert (scheduler.base_block, scheduler.max_block) == (1000, 5000)
+    scheduler.update(1000)
+    assert scheduler.block == 1000
+    # Above HIGH_FILL: the backlog and the next block in one read
+    scheduler.update(3000)
+    assert scheduler.block == 4000
+    scheduler.update(19000)
+    assert scheduler.block == 5000
+    blocks = []
+    for _ in range(4):
+        scheduler.update(0)
+        blocks.append(scheduler.block)
+    assert blocks == [2500, 1250, 1000, 1000]
+    assert scheduler.max_backlog == 19000 and scheduler.backlog == 0
+
+
+def test_read_and_interval_stats():
+    class Hat(object):
+        def a_in_scan_read_numpy(self, samples, timeout):
+            self.timeout = timeout
+            return Result(np.zeros(samples * 2 - 10))
+
+        def a_in_scan_status(self):
+            return Status(3000)
+
+    hat = Hat()
+    scheduler = ReadScheduler(20000.0, 20000, channels=2)
+    assert len(scheduler.read(hat).data) == 1990
+    assert hat.timeout == 1000 / 20000.0 + 0.5
+    stats = scheduler.stats(reset=True)
+    assert (stats["reads"], stats["short_reads"], stats["block"]) == (1, 1, 4000)
+    assert stats["interval_reads"] == 1 and stats["interval_max_backlog"] == 3000
+    assert stats["fill_pct_p50"] == 10.0
+    stats = scheduler.stats()
+    assert stats["interval_reads"] == 0 and stats["interval_fill_pct_p50"] is None
+    assert stats["reads"] == 1 and stats["max_backlog"] == 3000
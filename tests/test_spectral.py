@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from spectral import HarmonicAnalyzer, LOBE_BINS
+
+RATE = 10000.0
+
+
+def signal(count, harmonics, freq=50.0, channels=1):
+    t = np.arange(count) / RATE
+    out = sum(amplitude * np.sin(2.0 * np.pi * h * freq * t + 0.2 * h)
+              for h, amplitude in harmonics.items())
+    return np.repeat(out[:, None], channels, axis=1).ravel()
+
+
+def test_thd_of_synthetic_signal():
+    analyzer = HarmonicAnalyzer(RATE, channels=2, cycles=10, overlap=0.5, count=10,
+                                scale=[1.0, 10.0])
+    data = signal(20000, {1: 1.0, 3: 0.1, 5: 0.05}, channels=2)
+    centers, fundamental, thd, levels = analyzer.process(data)
+    assert len(centers) == 19
+    np.testing.assert_allclose(fundamental[:, 0], 1.0 / np.sqrt(2.0), rtol=1e-3)
+    np.testing.assert_allclose(fundamental[:, 1], 10.0 / np.sqrt(2.0), rtol=1e-3)
+    np.testing.assert_allclose(thd, 100.0 * np.hypot(0.1, 0.05), rtol=1e-2)
+    np.testing.assert_allclose(levels[:, 0, 2], 0.1 / np.sqrt(2.0), rtol=1e-2)
+    np.testing.assert_allclose(levels[:, 0, 1], 0.0, atol=1e-3)
+
+
+def test_frames_continue_across_blocks():
+    data = signal(20000, {1: 1.0, 3: 0.2})
+    whole = HarmonicAnalyzer(RATE).process(data)
+    analyzer = HarmonicAnalyzer(RATE)
+    parts = [analyzer.process(data[i:i + 1500]) for i in range(0, len(data), 1500)]
+    np.testing.assert_array_equal(np.concatenate([p[0] for p in parts]), whole[0])
+    np.testing.assert_allclose(np.concatenate([p[2] for p in parts]), whole[2])
+
+
+def test_rejects_overlapping_lobes():
+    with pytest.raises(ValueError):
+        HarmonicAnalyzer(RATE, cycles=2 * LOBE_BINS)
+
+
+def test_rejects_harmonics_above_nyquist():
+    with pytest.raises(ValueError):
+        HarmonicAnalyzer(1000.0, count=20)
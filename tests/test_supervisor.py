@@ -0,0 +1,33 @@
+from supervisor import RestartPolicy
+
+
+def crash(policy, at, ran=1.0):
+    policy.on_start(at)
+    return policy.on_exit(at + ran)
+
+
+def test_backoff_doubles_up_to_the_maximum():
+    policy = RestartPolicy(delay=1, delay_max=8, loop_count=100)
+    waits = [crash(policy, at) for at in range(0, 100, 10)]
+    assert waits[:5] == [1, 2, 4, 8, 8]
+    assert policy.state(running=False) == "backoff"
+    assert not policy.due(policy.restart_at - 0.1)
+    assert policy.due(policy.restart_at)
+
+
+def test_stable_run_resets_the_delay():
+    policy = RestartPolicy(delay=1, delay_max=60, stable_sec=30, loop_count=100)
+    assert [crash(policy, at) for at in (0, 10, 20)] == [1, 2, 4]
+    assert crash(policy, 100, ran=30) == 1
+    assert crash(policy, 200) == 2
+
+
+def test_crash_loop_hold():
+    policy = RestartPolicy(delay=1, loop_count=3, loop_window=60, loop_hold=300)
+    assert [crash(policy, at) for at in (0, 5)] == [1, 2]
+    assert crash(policy, 10) == 300
+    assert policy.crash_loop and policy.state(running=False) == "crash-loop"
+    # Crashes older than the window are forgotten
+    assert crash(policy, 400) == 8
+    assert not policy.crash_loop
+    assert policy.state(running=True) == "running"
@@ -0,0 +1,78 @@
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from binary_records import read_records
+from sample_clock import SampleClock
+from waveform_capture import WaveformCapture, request_capture, poll_trigger_file
+
+BASE = datetime(2026, 1, 12, 10, 0, 0).timestamp()
+
+
+def wait_for_dumps():
+    for thread in threading.enumerate():
+        if thread.name == "waveform-dump":
+            thread.join(10)
+
+
+def capture(tmp_path):
+    clock = SampleClock(100.0, start_time=BASE)
+    return WaveformCapture(str(tmp_path), clock, [4, 5], buffer_sec=2.0,
+                           pre_sec=0.1, post_sec=0.3, block=20)
+
+
+def blocks(first, count, size=20):
+    for start in range(first, first + count * size, size):
+        yield np.arange(start, start + size, dtype=np.float64).repeat(2).reshape(-1, 2)
+
+
+def test_trigger_dumps_pre_and_post_samples(tmp_path):
+    wave = capture(tmp_path)
+    feed = blocks(0, 10)
+    for _ in range(3):
+        wave.feed(next(feed))
+    assert wave.trigger("../rms high/x", index=55)
+    assert not wave.trigger("second")
+    assert wave.ignored == 1 and wave.busy
+    wave.feed(next(feed))
+    assert wave.busy  # 80 < 55 + post
+    wave.feed(next(feed))
+    assert not wave.busy
+    wait_for_dumps()
+
+    files = os.listdir(str(tmp_path))
+    assert files == ["waveform_2026-01-12_10-00-00_550000____rms_high_x.bin"]
+    meta, records = read_records(str(tmp_path / files[0]))
+    assert meta["reason"] == "../rms high/x"
+    assert (meta["trigger_sample"], meta["first_sample"]) == (55, 45)
+    assert meta["first_sample_time"] == pytest.approx(BASE + 0.45)
+    np.testing.assert_array_equal(records["v"][:, 0], np.arange(45, 85))
+    assert wave.captures == 1
+
+
+def test_skip_writes_a_partial_capture(tmp_path):
+    wave = capture(tmp_path)
+    feed = blocks(0, 10)
+    for _ in range(3):
+        wave.feed(next(feed))
+    wave.trigger("overrun")
+    wave.skip(100)
+    wait_for_dumps()
+    assert not wave.busy
+    (name,) = os.listdir(str(tmp_path))
+    _, records = read_records(str(tmp_path / name))
+    np.testing.assert_array_equal(records["v"][:, 1], np.arange(50, 60))
+    # Samples before the gap cannot be read back
+    wave.feed(next(feed))
+    assert wave.ring.oldest == 160
+
+
+def test_trigger_file(tmp_path):
+    path = str(tmp_path / "waveform.trigger")
+    assert poll_trigger_file(path) is None
+    request_capture(path, "progEvent 3")
+    assert poll_trigger_file(path) == "progEvent 3"
+    assert not os.path.exists(path)
@@ -0,0 +1,239 @@
+"""
+    Raw waveform ring buffer with triggered snapshot dumps.
+
+    The last N seconds of raw scan samples are kept in a preallocated NumPy
+    array; writing a block is one or two slice copies, with no allocation
+    per sample or per block. When a trigger fires, the samples from
+    ``pre_sec`` before the trigger to ``post_sec`` after it are copied out
+    once the post-trigger samples have arrived and written to a
+    :py:mod:`binary_records` file by a short-lived background thread.
+
+    Other processes (e.g. the OPC UA logger on a ``progEvent`` change) can
+    request a capture with :py:func:`request_capture`, which drops a small
+    trigger file that the current logger polls.
+"""
+import os
+import re
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from binary_records import RecordWriter
+
+
+def request_capture(trigger_file, reason):
+    # type: (str, str) -> None
+    """
+    Ask a running current logger to dump a waveform snapshot.
+
+    Args:
+        trigger_file (str): Trigger file watched by the current logger.
+        reason (str): Short text stored in the snapshot metadata.
+    """
+    tmp = trigger_file + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(reason)
+    os.replace(tmp, trigger_file)
+
+
+def poll_trigger_file(trigger_file):
+    # type: (str) -> str
+    """
+    Consume a pending trigger file.
+
+    Returns:
+        str: The reason written by :py:func:`request_capture`, or None if no
+        capture was requested.
+    """
+    try:
+        with open(trigger_file, encoding='utf-8') as f:
+            reason = f.read().strip() or 'external'
+        os.remove(trigger_file)
+    except FileNotFoundError:
+        return None
+    return reason
+
+
+class RawRingBuffer(object):
+    """
+    Fixed-size ring of raw samples, indexed by absolute sample number.
+
+    Args:
+        size (int): Capacity in samples per channel.
+        channels (int): Number of channels.
+        dtype (numpy.dtype): Storage type (float32 halves the memory of the
+            float64 samples returned by the library).
+    """
+
+    def __init__(self, size, channels=1, dtype=np.float32):
+        self.size = int(size)
+        self.channels = int(channels)
+        self._buf = np.zeros((self.size, self.channels), dtype=dtype)
+        self.head = 0  # absolute index of the next sample to be written
+        self._valid = 0  # first index after the last gap
+
+    @property
+    def oldest(self):
+        """int: Absolute index of the oldest sample still in the buffer."""
+        return max(self._valid, self.head - self.size)
+
+    def skip(self, count):
+        """Advance the index over ``count`` lost samples (nothing is stored)."""
+        self.head += int(count)
+        self._valid = self.head
+
+    def write(self, block):
+        """Append a (samples, channels) block, overwriting the oldest data."""
+        block = block.reshape(-1, self.channels)
+        count = block.shape[0]
+        if count >= self.size:
+            block = block[count - self.size:]
+            self.head += count - self.size
+            count = self.size
+        pos = self.head % self.size
+        first = min(count, self.size - pos)
+        self._buf[pos:pos + first] = block[:first]
+        if first < count:
+            self._buf[:count - first] = block[first:]
+        self.head += count
+
+    def read(self, start, end):
+        """
+        Copy out the samples with absolute index ``start <= i < end``.
+
+        Raises:
+            ValueError: The range is no longer (or not yet) in the buffer.
+        """
+        if start < self.oldest or end > self.head or start > end:
+            raise ValueError('Error: samples {}-{} not in ring buffer '
+                             '({}-{})'.format(start, end, self.oldest,
+                                              self.head))
+        pos, count = start % self.size, end - start
+        first = min(count, self.size - pos)
+        out = np.empty((count, self.channels), dtype=self._buf.dtype)
+        out[:first] = self._buf[pos:pos + first]
+        out[first:] = self._buf[:count - first]
+        return out
+
+
+class WaveformCapture(object):
+    """
+    Keep raw samples in a :py:class:`RawRingBuffer` and dump the window
+    around each trigger.
+
+    Args:
+        outdir (str): Folder for snapshot files.
+        clock (SampleClock): Sample clock of the running scan.
+        channels (list): Scanned channel numbers.
+        buffer_sec (float): Length of the ring buffer.
+        pre_sec (float): Seconds kept before the trigger.
+        post_sec (float): Seconds kept after the trigger.
+        meta (dict): Extra metadata stored in each snapshot header.
+        block (int): Largest scan block in samples per channel. A capture
+            is completed up to one block after its end, so the buffer must
+            hold pre + post + one block.
+    """
+
+    def __init__(self, outdir, clock, channels, buffer_sec, pre_sec,
+                 post_sec, meta=None, block=0):
+        self.outdir = outdir
+        self.clock = clock
+        self.channels = list(channels)
+        self.pre = int(round(pre_sec * clock.rate))
+        self.post = int(round(post_sec * clock.rate))
+        size = int(round(buffer_sec * clock.rate))
+        if self.pre + self.post + int(block) >= size:
+            raise ValueError('Error: pre + post trigger time plus one scan '
+                             'block must be shorter than the waveform buffer')
+        self.meta = dict(meta or {})
+        self.ring = RawRingBuffer(size, len(self.channels))
+        self._pending = None
+        self.captures = 0
+        self.ignored = 0
+
+    @property
+    def busy(self):
+        """bool: A capture is waiting for its post-trigger samples."""
+        return self._pending is not None
+
+    def trigger(self, reason, index=None):
+        # type: (str, int) -> bool
+        """
+        Start a capture.
+
+        Args:
+            index (int): Sample index of the trigger event (e.g. the first
+                sample over a threshold); default the newest sample.
+
+        Returns:
+            bool: False if a capture is already pending (the trigger is
+            counted in ``ignored``).
+        """
+        if self._pending is not None:
+            self.ignored += 1
+            return False
+        index = self.ring.head if index is None else \
+            min(max(int(index), self.ring.oldest), self.ring.head)
+        self._pending = (reason, index, max(self.ring.oldest, index - self.pre),
+                         index + self.post)
+        return True
+
+    def feed(self, block):
+        """Store a raw block; dump a pending capture once it is complete."""
+        self.ring.write(block)
+        if self._pending is not None and self.ring.head >= self._pending[3]:
+            reason, index, start, end = self._pending
+            self._pending = None
+            try:
+                data = self.ring.read(start, end)
+            except ValueError as error:  # never stop the acquisition loop
+                self.ignored += 1
+                print(f"\n[KSF] Waveform snapshot ({reason}) lost: {error}")
+                return
+            threading.Thread(target=self._dump,
+                             args=(reason, index, start, data),
+                             name="waveform-dump", daemon=True).start()
+
+    def skip(self, count):
+        """
+        Advance over ``count`` lost samples (scan restart after an
+        overrun). A pending capture is written with the samples it has.
+        """
+        if self._pending is not None:
+            reason, index, start, end = self._pending
+            self._pending = None
+            if self.ring.head > start:
+                data = self.ring.read(start, self.ring.head)
+                threading.Thread(target=self._dump,
+                                 args=(reason, index, start, data),
+                                 name="waveform-dump", daemon=True).start()
+        self.ring.skip(count)
+
+    def _dump(self, reason, index, start, data):
+        epoch = float(self.clock.epoch(index))
+        name = datetime.fromtimestamp(epoch).strftime(
+            "waveform_%Y-%m-%d_%H-%M-%S_%f")
+        # The reason may come from the trigger file: no path separators
+        safe = re.sub(r'[^A-Za-z0-9_-]', '_', reason)[:64]
+        path = os.path.join(self.outdir, f"{name}_{safe}.bin")
+        meta = dict(self.meta)
+        meta.update({
+            "reason": reason,
+            "trigger_time": epoch,
+            "trigger_sample": index,
+            "first_sample": start,
+            "first_sample_time": float(self.clock.epoch(start)),
+            "sample_rate": self.clock.rate,
+            "channels": self.channels,
+        })
+        dtype = np.dtype([('v', data.dtype, (data.shape[1],))])
+        try:
+            os.makedirs(self.outdir, exist_ok=True)
+            writer = RecordWriter(path, dtype, meta)
+            writer.append(data.view(dtype).ravel())
+            writer.close()
+            self.captures += 1
+            print(f"\n[KSF] Waveform snapshot ({reason}): {path}")
+        except OSError as error:
+            print(f"\n[KSF] Waveform snapshot failed: {error}")